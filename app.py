@@ -9,27 +9,51 @@ from aws_cdk import core as cdk
 # being updated to use `cdk`.  You may delete this import if you don't need it.
 from aws_cdk import core
 
+from utils import ArtifactCache
 from utils.CdkUtils import CdkUtils
 from stacks.amishare.ami_share import AmiShareStack
 
 
 app = core.App()
-AmiShareStack(app, f"EC2ImageBuilderAmiShare-{CdkUtils.stack_tag}",
+
+# Several instances of the stack can be synthesised in one go, for a list of
+# stack tags and/or a list of "account/region" environments, e.g.
+#   cdk synth -c stackTags=main,feature-x -c environments=111111111111/eu-west-1,222222222222/us-east-1
+# Without them, a single stack is synthesised for the tag of the checked
+# out git branch (or STACK_TAG) and the environment of the CLI configuration.
+stack_tags = [CdkUtils.tag_slug(tag) for tag in CdkUtils.get_context_list(app, "stackTags")] or [CdkUtils.stack_tag]
+
+environments = [
+    core.Environment(account=account, region=region)
+    for account, region in CdkUtils.get_context_environments(app, "environments")
+] or [
     # If you don't specify 'env', this stack will be environment-agnostic.
     # Account/Region-dependent features and context lookups will not work,
     # but a single synthesized template can be deployed anywhere.
 
-    # Uncomment the next line to specialize this stack for the AWS Account
+    # The environment below specializes this stack for the AWS Account
     # and Region that are implied by the current CLI configuration.
 
-    env=core.Environment(account=os.getenv('CDK_DEFAULT_ACCOUNT'), region=os.getenv('CDK_DEFAULT_REGION')),
-
-    # Uncomment the next line if you know exactly what Account and Region you
-    # want to deploy the stack to. */
-
-    #env=core.Environment(account='abcdefghijklm', region='us-east-1'),
+    core.Environment(account=os.getenv('CDK_DEFAULT_ACCOUNT'), region=os.getenv('CDK_DEFAULT_REGION'))
 
     # For more information, see https://docs.aws.amazon.com/cdk/latest/guide/environments.html
-    )
+]
+
+for stack_tag in stack_tags:
+    for environment in environments:
+        stack_id = f"EC2ImageBuilderAmiShare-{stack_tag}"
+        if len(environments) > 1:
+            stack_id = f"{stack_id}-{environment.account}-{environment.region}"
+
+        AmiShareStack(app, stack_id, stack_tag=stack_tag, env=environment)
+
+# With -c prestageArtifacts=true, the artifacts of the artifact cache that are
+# missing from the cache bucket of the deployed stacks are uploaded while
+# synthesising, so that the next builds do not have to download them.
+artifact_cache = CdkUtils.get_project_settings().artifact_cache
+if artifact_cache is not None and str(app.node.try_get_context("prestageArtifacts")).lower() == "true":
+    for stack_tag in stack_tags:
+        for environment in environments:
+            ArtifactCache.prestage_stack_artifacts(stack_tag, artifact_cache.artifacts, environment.region)
 
 app.synth()
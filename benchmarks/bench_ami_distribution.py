@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""
+    bench_ami_distribution.py:
+    Offline benchmark of the ami distribution custom resource handler.
+
+    The handler is driven with botocore Stubber clients over a grid of
+    distribution region counts and account counts. For every grid point
+    the benchmark records the wall time, the peak memory (tracemalloc),
+    the number of AWS API calls and the request payload bytes of one
+    deployment, i.e. one handler invocation whose DistributionTargets
+    update every distribution configuration in parallel, as the stack
+    sends it.
+
+    Usage:
+        python -m benchmarks.bench_ami_distribution
+        python -m benchmarks.bench_ami_distribution --regions 1 30 --accounts 1 5000
+"""
+
+import argparse
+import os
+import tracemalloc
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.stub import Stubber
+
+from benchmarks.bench_utils import measure, write_results
+from stacks.amishare.resources.amidistribution import ami_distribution
+from stacks.amishare.resources.amidistribution import distribution_planner
+from utils.CdkUtils import CdkUtils
+
+AWS_REGION = 'us-east-1'
+AWS_REGIONS = [
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'af-south-1',
+    'ap-east-1', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3',
+    'ap-southeast-1', 'ap-southeast-2', 'ap-southeast-3', 'ca-central-1', 'eu-central-1',
+    'eu-west-1', 'eu-west-2', 'eu-west-3', 'eu-south-1', 'eu-north-1',
+    'me-south-1', 'sa-east-1', 'us-gov-east-1', 'us-gov-west-1', 'eu-central-2',
+    'eu-south-2', 'ap-south-2', 'ap-southeast-4', 'me-central-1', 'il-central-1'
+]
+SSM_PATH = '/bench-AmiSharing'
+DISTRIBUTION_ARN = 'arn:aws:imagebuilder:us-east-1:111111111111:distribution-configuration/ami-share-distribution-config-bench'
+
+# The AmiTags the stack sets on the distributions, see AmiShareStack.get_distribution_ami_tags
+AMI_TAGS = {
+    'project': 'ec2-imagebuilder-ami-share',
+    'Pipeline': 'AmiSharePipeline-bench'
+}
+
+DEFAULT_REGION_COUNTS = [1, 5, 10, 20, 30]
+DEFAULT_ACCOUNT_COUNTS = [1, 10, 100, 1000, 5000]
+
+
+class ApiCallRecorder:
+    """
+        Counts the API calls made by the stubbed clients
+        and the size of their serialized request bodies.
+    """
+
+    def __init__(self, clients):
+        self.calls = 0
+        self.payload_bytes = 0
+        for client in clients:
+            client.meta.events.register_first('before-call.*.*', self._record)
+
+    def _record(self, params, **kwargs):
+        self.calls += 1
+        body = params.get('body') or b''
+        self.payload_bytes += len(body if isinstance(body, bytes) else str(body).encode('utf-8'))
+
+    def reset(self):
+        self.calls = 0
+        self.payload_bytes = 0
+
+
+class CannedResponses:
+    """
+        Answers every call of a client with the response of its operation,
+        in whatever order the calls arrive, as the distribution targets are
+        updated by concurrent threads.
+    """
+
+    def __init__(self, client, responses):
+        self.responses = responses
+        client.meta.events.register('before-call.*.*', self._respond)
+
+    def _respond(self, model, **kwargs):
+        return AWSResponse(None, 200, {}, None), self.responses[model.name]
+
+
+def account_ids(start, count):
+    return [f'{i:012d}' for i in range(start, start + count)]
+
+
+def ssm_pages(publishing_account_ids, sharing_account_ids):
+    parameters = []
+    for name, values in [('AmiPublishingTargetIds', publishing_account_ids), ('AmiSharingAccountIds', sharing_account_ids)]:
+        parameters += [
+            {'Name': f'{SSM_PATH}/{name}/{index:03d}', 'Type': 'StringList', 'Value': ','.join(shard), 'Version': 1}
+            for index, shard in enumerate(CdkUtils.split_string_list(values))
+        ]
+    pages = [parameters[i:i + 10] for i in range(0, len(parameters), 10)]
+    return [
+        dict({'Parameters': page}, **({'NextToken': str(i)} if i < len(pages) - 1 else {}))
+        for i, page in enumerate(pages)
+    ]
+
+
+class HandlerBenchmark:
+    """
+        Runs the ami distribution handler for the distribution
+        targets of one deployment against stubbed clients.
+    """
+
+    def __init__(self, region_count, account_count):
+        self.regions = AWS_REGIONS[:region_count]
+        self.publishing_account_ids = account_ids(0, account_count)
+        self.sharing_account_ids = account_ids(100000, account_count)
+        self.reserved_tags = distribution_planner.reserved_ami_tags(AMI_TAGS)
+        self.distribution_count = len(distribution_planner.plan_account_chunks(
+            self.publishing_account_ids, self.sharing_account_ids, reserved_tags=self.reserved_tags
+        ))
+        self.pages = ssm_pages(self.publishing_account_ids, self.sharing_account_ids)
+
+        self.ssm = boto3.client('ssm', region_name=AWS_REGION)
+        self.imagebuilder = boto3.client('imagebuilder', region_name=AWS_REGION)
+        self.recorder = ApiCallRecorder([self.ssm, self.imagebuilder])
+        self.ssm_stubber = Stubber(self.ssm)
+        CannedResponses(self.imagebuilder, {
+            'GetDistributionConfiguration': {
+                'distributionConfiguration': {
+                    'arn': DISTRIBUTION_ARN,
+                    'distributions': [],
+                    'timeoutMinutes': 360
+                }
+            },
+            'UpdateDistributionConfiguration': {'distributionConfigurationArn': DISTRIBUTION_ARN}
+        })
+
+    def event(self):
+        return {
+            'RequestType': 'Update',
+            'ResourceProperties': {
+                'CdkStackName': 'bench',
+                'DistributionTargets': [
+                    {
+                        'AwsDistributionRegions': self.regions,
+                        'ImageBuilderName': f'AmiDistributionConfig-bench-{index}',
+                        'AmiDistributionName': 'AmiShare-bench-{{ imagebuilder:buildDate }}',
+                        'AmiDistributionArn': f'{DISTRIBUTION_ARN}-{index}',
+                        'DistributionIndex': str(index),
+                        'DistributionCount': str(self.distribution_count),
+                        'ReservedTags': str(self.reserved_tags),
+                        'AccountIdsPath': SSM_PATH,
+                        'PublishingAccountIds': f'{SSM_PATH}/AmiPublishingTargetIds',
+                        'SharingAccountIds': f'{SSM_PATH}/AmiSharingAccountIds'
+                    }
+                    for index in range(self.distribution_count)
+                ]
+            }
+        }
+
+    def stub_responses(self):
+        # the targets share their account lists, which are loaded once
+        for page in self.pages:
+            self.ssm_stubber.add_response('get_parameters_by_path', page)
+
+    def run(self):
+        self.stub_responses()
+        ami_distribution._CLIENTS.clear()
+        ami_distribution._CLIENTS[('ssm', AWS_REGION)] = self.ssm
+        ami_distribution._CLIENTS[('imagebuilder', None)] = self.imagebuilder
+        self.recorder.reset()
+        with self.ssm_stubber:
+            ami_distribution.lambda_handler(self.event(), None)
+
+    def peak_memory_bytes(self):
+        tracemalloc.start()
+        try:
+            self.run()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+def benchmark(region_counts, account_counts, repeat):
+    results = []
+    for region_count in region_counts:
+        for account_count in account_counts:
+            bench = HandlerBenchmark(region_count, account_count)
+            timing = measure(bench.run, repeat)
+            results.append({
+                'regions': region_count,
+                'accounts': account_count,
+                'distribution_configurations': bench.distribution_count,
+                'wall_time': timing,
+                'peak_memory_bytes': bench.peak_memory_bytes(),
+                'api_calls': bench.recorder.calls,
+                'request_payload_bytes': bench.recorder.payload_bytes
+            })
+            print(
+                f"regions={region_count:>2} accounts={account_count:>4} "
+                f"median={timing['median_ms']:>9.3f}ms api_calls={bench.recorder.calls:>3} "
+                f"payload={bench.recorder.payload_bytes}B"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--regions', type=int, nargs='+', default=DEFAULT_REGION_COUNTS)
+    parser.add_argument('--accounts', type=int, nargs='+', default=DEFAULT_ACCOUNT_COUNTS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/ami_distribution.json')
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_REGION', AWS_REGION)
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+    results = benchmark(args.regions, args.accounts, args.repeat)
+    print(f"Results written to {write_results('ami_distribution', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
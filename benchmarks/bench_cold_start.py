@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""
+    bench_cold_start.py:
+    Cold start timing harness for the lambda functions of the project.
+
+    Every sample runs in a fresh interpreter, the way a new Lambda
+    execution environment would, and measures:
+        import_ms: importing the handler module
+        init_ms:   creating the first boto3 client (boto3 import included)
+        warm_ms:   fetching the cached client again, as a warm invocation does
+
+    A variant is a handler module combined with a python interpreter, so
+    the runtimes and architectures configured in the "lambda" project
+    settings can be compared by running the harness with the matching
+    interpreters, e.g. on an arm64 and an x86_64 host.
+
+    Usage:
+        python -m benchmarks.bench_cold_start
+        python -m benchmarks.bench_cold_start --python python3.9 python3.11 --samples 20
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+from benchmarks.bench_utils import write_results
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HANDLERS = {
+    'ami_distribution': ('stacks/amishare/resources/amidistribution', 'ami_distribution', 'imagebuilder'),
+    'ami_launch_permission': ('stacks/amishare/resources/amilaunchpermission', 'ami_launch_permission', 'ec2')
+}
+
+# Executed in a fresh interpreter with the lambda asset directory as the
+# only project path, mirroring the layout of the deployment package.
+SAMPLE = '''
+import json, sys, time
+sys.path.insert(0, {asset_dir!r})
+start = time.perf_counter()
+import {module} as handler
+imported = time.perf_counter()
+handler.get_client({service!r}, 'us-east-1')
+initialised = time.perf_counter()
+handler.get_client({service!r}, 'us-east-1')
+warm = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'init_ms': (initialised - imported) * 1000,
+    'warm_ms': (warm - initialised) * 1000
+}}))
+'''
+
+
+def run_sample(python: str, handler: str) -> dict:
+    asset_dir, module, service = HANDLERS[handler]
+    code = SAMPLE.format(asset_dir=os.path.join(PROJECT_DIR, asset_dir), module=module, service=service)
+    env = dict(os.environ, AWS_REGION='us-east-1', AWS_ACCESS_KEY_ID='benchmark', AWS_SECRET_ACCESS_KEY='benchmark')
+    output = subprocess.run([python, '-c', code], env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarise(samples: list) -> dict:
+    return {
+        metric: {
+            'median_ms': round(statistics.median(sample[metric] for sample in samples), 3),
+            'max_ms': round(max(sample[metric] for sample in samples), 3)
+        }
+        for metric in samples[0]
+    }
+
+
+def interpreter_version(python: str) -> str:
+    return subprocess.run(
+        [python, '-c', 'import platform; print(platform.python_version(), platform.machine())'],
+        check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--python', nargs='+', default=[sys.executable], help='python interpreters to compare')
+    parser.add_argument('--handlers', nargs='+', default=list(HANDLERS), choices=list(HANDLERS))
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/cold_start.json')
+    args = parser.parse_args()
+
+    results = []
+    for python in args.python:
+        version = interpreter_version(python)
+        for handler in args.handlers:
+            summary = summarise([run_sample(python, handler) for _ in range(args.samples)])
+            results.append({
+                'handler': handler,
+                'python': version,
+                'samples': args.samples,
+                **summary
+            })
+            print(
+                f"{handler:<22} {version:<16} import={summary['import_ms']['median_ms']:>8.3f}ms "
+                f"init={summary['init_ms']['median_ms']:>8.3f}ms warm={summary['warm_ms']['median_ms']:>6.3f}ms"
+            )
+
+    print(f"Results written to {write_results('cold_start', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
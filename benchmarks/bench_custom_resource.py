@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+    bench_custom_resource.py:
+    Response latency harness for the ami distribution custom resource,
+    comparing the "provider" and "direct" lambda.customResourceMode.
+
+    Every sample is a cold start: the handlers run in fresh interpreters
+    with stubbed boto3 clients, and the latency is measured from the
+    invocation until the response arrives at a local stand-in for the
+    pre-signed ResponseURL.
+        provider: a framework interpreter invokes the handler interpreter,
+                  as the provider framework function invokes the ami
+                  distribution function, and sends the response
+        direct:   a single interpreter runs direct_handler, which sends
+                  the response itself
+
+    The Lambda Invoke request between the framework and the handler and
+    the Node.js runtime of the provider framework are not part of the
+    offline harness, so the provider mode latency is a lower bound.
+
+    Usage:
+        python -m benchmarks.bench_custom_resource
+        python -m benchmarks.bench_custom_resource --samples 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_utils import write_results
+from tests.utils.cfn_response import ResponseServer, custom_resource_event
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ASSET_DIR = os.path.join(PROJECT_DIR, 'stacks/amishare/resources/amidistribution')
+
+MODES = ('provider', 'direct')
+
+# A Delete event, which loads the account ids from SSM
+# and leaves the distribution configuration untouched.
+RESOURCE_PROPERTIES = {
+    'CdkStackName': 'benchmark',
+    'AwsDistributionRegions': ['eu-west-1', 'us-east-1'],
+    'ImageBuilderName': 'AmiDistributionConfig-benchmark',
+    'AmiDistributionName': 'AmiShare-benchmark-{{ imagebuilder:buildDate }}',
+    'AmiDistributionArn': 'arn:aws:imagebuilder:us-east-1:111111111111:distribution-configuration/benchmark',
+    'AccountIdsPath': '/benchmark-AmiSharing',
+    'PublishingAccountIds': '/benchmark-AmiSharing/AmiPublishingTargetIds',
+    'SharingAccountIds': '/benchmark-AmiSharing/AmiSharingAccountIds'
+}
+
+# Executed in a fresh interpreter with the lambda asset directory as the
+# only project path, mirroring the layout of the deployment package.
+HANDLER = '''
+import json, sys
+sys.path.insert(0, {asset_dir!r})
+import ami_distribution
+from botocore.stub import Stubber
+
+class LambdaContext:
+    log_stream_name = 'benchmark'
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+stubber = Stubber(ami_distribution.get_client('ssm', 'us-east-1'))
+stubber.add_response('get_parameters_by_path', {{'Parameters': [
+    {{'Name': '/benchmark-AmiSharing/AmiPublishingTargetIds', 'Value': '222222222222'}},
+    {{'Name': '/benchmark-AmiSharing/AmiSharingAccountIds', 'Value': '444444444444'}}
+]}})
+stubber.activate()
+event = json.loads(sys.argv[1])
+if {direct!r}:
+    ami_distribution.direct_handler(event, LambdaContext())
+else:
+    print(json.dumps(ami_distribution.lambda_handler(event, LambdaContext())))
+'''
+
+# The provider framework function: invokes the handler and sends its response.
+FRAMEWORK = '''
+import json, subprocess, sys, urllib.request
+event = json.loads(sys.argv[2])
+output = json.loads(subprocess.run(
+    [sys.executable, '-c', sys.argv[1], sys.argv[2]], check=True, capture_output=True, text=True
+).stdout.strip().splitlines()[-1])
+body = json.dumps({
+    'Status': 'SUCCESS',
+    'Reason': 'See the details in CloudWatch Log Stream: benchmark',
+    'PhysicalResourceId': output['PhysicalResourceId'],
+    'StackId': event['StackId'],
+    'RequestId': event['RequestId'],
+    'LogicalResourceId': event['LogicalResourceId'],
+    'NoEcho': False,
+    'Data': output['Data']
+}).encode('utf-8')
+urllib.request.urlopen(urllib.request.Request(
+    event['ResponseURL'], data=body, method='PUT', headers={'Content-Type': ''}
+), timeout=10).close()
+'''
+
+
+def run_sample(python: str, mode: str, server: ResponseServer) -> float:
+    """Return the milliseconds from the invocation until the response of the custom resource arrived."""
+    event = json.dumps(custom_resource_event(server.url, RESOURCE_PROPERTIES, request_type='Delete'))
+    handler = HANDLER.format(asset_dir=ASSET_DIR, direct=mode == 'direct')
+    command = [python, '-c', handler, event] if mode == 'direct' else [python, '-c', FRAMEWORK, handler, event]
+    env = dict(os.environ, AWS_REGION='us-east-1', AWS_ACCESS_KEY_ID='benchmark', AWS_SECRET_ACCESS_KEY='benchmark')
+
+    count = len(server.responses) + 1
+    start = time.perf_counter()
+    subprocess.run(command, env=env, check=True, capture_output=True)
+    received, _, response = server.wait_for_response(count)
+    if response['Status'] != 'SUCCESS':
+        raise RuntimeError(f"The {mode} custom resource failed: {response['Reason']}")
+    return (received - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--python', default=sys.executable, help='python interpreter of the lambda functions')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/custom_resource.json')
+    args = parser.parse_args()
+
+    results = []
+    with ResponseServer() as server:
+        for mode in args.modes:
+            latencies = [run_sample(args.python, mode, server) for _ in range(args.samples)]
+            results.append({
+                'mode': mode,
+                'samples': args.samples,
+                'response_ms': {
+                    'median_ms': round(statistics.median(latencies), 3),
+                    'max_ms': round(max(latencies), 3)
+                }
+            })
+            print(f"{mode:<10} response={statistics.median(latencies):>9.3f}ms")
+
+    print(f"Results written to {write_results('custom_resource', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
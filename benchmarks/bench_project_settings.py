@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+    bench_project_settings.py:
+    Micro-benchmark of the project settings lookup.
+
+    Compares reading and parsing cdk.json on every lookup, which is what
+    CdkUtils.get_project_settings used to do, with the cached and
+    validated loader for a cold lookup (parse and validate) and for
+    repeated lookups of an unmodified file.
+
+    Usage:
+        python -m benchmarks.bench_project_settings
+        python -m benchmarks.bench_project_settings --lookups 100000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.bench_utils import write_results
+from utils import ProjectSettings as project_settings
+
+SETTINGS = {
+    "vpc": {"vpc_id": "vpc-0123456789abcdef0", "subnet_id": "subnet-0123456789abcdef0"},
+    "imagebuilder": {
+        "baseImageArn": "amazon-linux-2-x86/2021.4.29",
+        "ebsVolumeSize": 8,
+        "instanceTypes": ["t2.medium"],
+        "version": "1.0.0",
+        "imageBuilderEmailAddress": "email@example.com",
+        "distributionList": ["account1", "account2"],
+        "amiPublishingRegions": ["eu-west-1", "us-east-1"],
+        "amiPublishingTargetIds": [f"{i:012d}" for i in range(100)],
+        "amiSharingIds": [f"{i:012d}" for i in range(100, 1100)]
+    }
+}
+
+
+def read_uncached(filename):
+    with open(filename, 'r') as cdk_json:
+        data = cdk_json.read()
+    return json.loads(data).get("projectSettings")
+
+
+def per_lookup_us(func, lookups: int) -> float:
+    start = time.perf_counter()
+    for _ in range(lookups):
+        func()
+    return round((time.perf_counter() - start) * 1e6 / lookups, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/project_settings.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'cdk.json')
+        with open(filename, 'w') as cdk_json:
+            json.dump({"projectSettings": SETTINGS}, cdk_json)
+
+        def cold_lookup():
+            project_settings._SETTINGS_CACHE.clear()
+            project_settings.load_project_settings(filename)
+
+        results = [
+            {'lookup': 'uncached_json', 'per_lookup_us': per_lookup_us(lambda: read_uncached(filename), args.lookups)},
+            {'lookup': 'cold', 'per_lookup_us': per_lookup_us(cold_lookup, args.lookups)},
+            {'lookup': 'cached', 'per_lookup_us': per_lookup_us(lambda: project_settings.load_project_settings(filename), args.lookups)}
+        ]
+
+    for result in results:
+        print(f"{result['lookup']:<14} {result['per_lookup_us']:>10.3f}us")
+    print(f"Results written to {write_results('project_settings', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""
+    bench_stack_tag.py:
+    Import-time benchmark of the git branch resolution behind CdkUtils.stack_tag.
+
+    Every sample runs in a fresh interpreter, so the module imports are
+    included, and resolves the branch of the project repository with
+        git_files: utils.GitBranch, reading the git files directly
+        gitpython: git.Repo(...).active_branch, the GitPython fallback
+
+    Usage:
+        python -m benchmarks.bench_stack_tag
+        python -m benchmarks.bench_stack_tag --samples 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.bench_utils import write_results
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESOLVERS = {
+    'git_files': 'from utils.GitBranch import resolve_branch_name\nbranch = resolve_branch_name({path!r})',
+    'gitpython': 'from git import Repo\nbranch = Repo(path={path!r}, search_parent_directories=True).active_branch.name'
+}
+
+SAMPLE = '''
+import json, sys, time
+sys.path.insert(0, {project_dir!r})
+start = time.perf_counter()
+{resolver}
+print(json.dumps({{'branch': branch, 'resolve_ms': (time.perf_counter() - start) * 1000}}))
+'''
+
+
+def run_sample(resolver: str) -> dict:
+    code = SAMPLE.format(project_dir=PROJECT_DIR, resolver=RESOLVERS[resolver].format(path=PROJECT_DIR))
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/stack_tag.json')
+    args = parser.parse_args()
+
+    results = []
+    for resolver in RESOLVERS:
+        samples = [run_sample(resolver) for _ in range(args.samples)]
+        timings = [sample['resolve_ms'] for sample in samples]
+        results.append({
+            'resolver': resolver,
+            'samples': args.samples,
+            'median_ms': round(statistics.median(timings), 3),
+            'max_ms': round(max(timings), 3)
+        })
+        print(f"{resolver:<10} branch={samples[0]['branch']:<20} median={results[-1]['median_ms']:>8.3f}ms")
+
+    print(f"Results written to {write_results('stack_tag', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
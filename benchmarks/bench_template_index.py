@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+    bench_template_index.py:
+    Benchmark of the template assertions of the test cases.
+
+    Runs the RootTestCase baseline checks, substring lookups and
+    have_resource/contain_metadata_path matches against a synthetic
+    template with thousands of resources, once by serialising and
+    scanning the whole template per assertion, as the test cases used
+    to do, and once through a TemplateIndex built for the template.
+
+    Usage:
+        python -m benchmarks.bench_template_index
+        python -m benchmarks.bench_template_index --resources 1000 10000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+
+from cdk_expects_matcher import CdkMatchers
+
+from benchmarks.bench_utils import measure, write_results
+from tests.utils import template_index
+
+DEFAULT_RESOURCE_COUNTS = [100, 1000, 5000]
+LOOKUPS = 50
+
+RESOURCE_TYPES = [
+    ('AWS::S3::Bucket', lambda i: {
+        'BucketEncryption': {'ServerSideEncryptionConfiguration': [{'ServerSideEncryptionByDefault': {'SSEAlgorithm': 'aws:kms'}}]},
+        'PublicAccessBlockConfiguration': {'BlockPublicAcls': True, 'BlockPublicPolicy': True, 'IgnorePublicAcls': True, 'RestrictPublicBuckets': True}
+    }),
+    ('AWS::KMS::Key', lambda i: {'EnableKeyRotation': True, 'Description': f'key {i}'}),
+    ('AWS::IAM::Role', lambda i: {'RoleName': f'role-{i}', 'AssumeRolePolicyDocument': {'Statement': []}}),
+    ('AWS::SSM::Parameter', lambda i: {'Name': f'/bench/{i:05d}', 'Type': 'StringList', 'Value': ','.join(f'{a:012d}' for a in range(20))})
+]
+
+
+def synthetic_template(resource_count: int) -> dict:
+    resources = {}
+    for i in range(resource_count):
+        resource_type, properties = RESOURCE_TYPES[i % len(RESOURCE_TYPES)]
+        resources[f'Resource{i:05d}'] = {
+            'Type': resource_type,
+            'Properties': properties(i),
+            'Metadata': {'aws:cdk:path': f'Bench/resource-{i:05d}/Resource'}
+        }
+    return {'Resources': resources}
+
+
+def assertions(cfn_template: dict, count, template_str, count_type, matchers) -> None:
+    """The checks of RootTestCase plus LOOKUPS lookups and matches spread over the template."""
+    count_type('AWS::S3::Bucket') == count('"SSEAlgorithm":"aws:kms"') == count('"BucketEncryption"')
+    count_type('AWS::S3::Bucket') == count('"BlockPublicAcls":true') == count('"RestrictPublicBuckets":true')
+    count_type('AWS::KMS::Key') == count('"EnableKeyRotation":true')
+    resource_count = len(cfn_template['Resources'])
+    for i in range(0, resource_count, max(1, resource_count // LOOKUPS)):
+        f'"/bench/{i:05d}"' in template_str()
+        matchers.have_resource('AWS::IAM::Role', {'RoleName': f'role-{i}'})._match(cfn_template)
+        matchers.contain_metadata_path('AWS::SSM::Parameter', f'resource-{i:05d}')._match(cfn_template)
+
+
+def scan_assertions(cfn_template: dict) -> None:
+    def template_str():
+        return json.dumps(cfn_template).replace(' ', '')
+
+    assertions(
+        cfn_template,
+        lambda value: template_str().count(value),
+        template_str,
+        lambda resource_type: template_str().count(f'"{resource_type}"'),
+        CdkMatchers
+    )
+
+
+def index_assertions(cfn_template: dict) -> None:
+    template_index.TemplateIndex._indexes.clear()
+    index = template_index.TemplateIndex.of(cfn_template)
+    assertions(cfn_template, index.count, lambda: index.template_str, index.count_type, template_index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resources', type=int, nargs='+', default=DEFAULT_RESOURCE_COUNTS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/template_index.json')
+    args = parser.parse_args()
+
+    results = []
+    for resource_count in args.resources:
+        cfn_template = synthetic_template(resource_count)
+        # the cdk_expects_matcher matchers print every comparison
+        with contextlib.redirect_stdout(io.StringIO()):
+            scan = measure(lambda: scan_assertions(cfn_template), args.repeat)
+            indexed = measure(lambda: index_assertions(cfn_template), args.repeat)
+        results.append({'resources': resource_count, 'scan': scan, 'index': indexed})
+        print(f"resources={resource_count:>5} scan={scan['median_ms']:>10.3f}ms index={indexed['median_ms']:>9.3f}ms")
+
+    print(f"Results written to {write_results('template_index', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
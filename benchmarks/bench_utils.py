@@ -0,0 +1,44 @@
+"""
+    bench_utils.py:
+    Helpers shared by the offline benchmarks of the
+    ec2-imagebuilder-ami-share project.
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def measure(func, repeat: int = 5) -> dict:
+    """Call func repeat times and return wall time statistics in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'max_ms': round(max(timings), 3)
+    }
+
+
+def write_results(name: str, results: list, output: str = None) -> str:
+    """Write benchmark results as JSON, sorted for stable diffs in review."""
+    output = output or os.path.join(RESULTS_DIR, f'{name}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    document = {
+        'benchmark': name,
+        'python': platform.python_version(),
+        'platform': sys.platform,
+        'results': results
+    }
+    with open(output, 'w') as results_file:
+        json.dump(document, results_file, indent=2, sort_keys=True)
+        results_file.write('\n')
+    return output
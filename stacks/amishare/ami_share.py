@@ -6,15 +6,26 @@
     required for the ec2-imagebuilder-ami-share project.
 """
 
+import json
+
 from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_events as events
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_imagebuilder as imagebuilder
 from aws_cdk import aws_kms as kms
 from aws_cdk import aws_lambda
+from aws_cdk import aws_s3 as s3
 from aws_cdk import aws_sns as sns
+from aws_cdk import aws_sqs as sqs
 from aws_cdk import aws_ssm as ssm
 from aws_cdk import core, custom_resources
+from stacks.amishare.resources.amibuildnotification import ami_build_notification
+from stacks.amishare.resources.amidistribution import distribution_planner
+from utils import ArtifactCache
 from utils.CdkUtils import CdkUtils
+from utils.ProjectSettings import (
+    LambdaSettings, NotificationQueueSettings, PipelineSettings, ProjectSettings, ScheduleSettings
+)
 
 
 class AmiShareStack(core.Stack):
@@ -23,32 +34,44 @@ class AmiShareStack(core.Stack):
         required for the ec2-imagebuilder-ami-share project.
     """
 
-    def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
+    def __init__(
+            self,
+            scope: core.Construct,
+            construct_id: str,
+            project_settings: ProjectSettings = None,
+            stack_tag: str = None,
+            **kwargs
+        ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        config = CdkUtils.get_project_settings()
+        # the tag that differentiates this instance of the stack from other
+        # instances, defaults to the tag of the checked out git branch
+        self.stack_tag = stack_tag or CdkUtils.stack_tag
+
+        # the project settings of cdk.json, unless settings are passed in explicitly
+        config = project_settings or CdkUtils.get_project_settings()
 
         # Retrieve VPC information via lookup
         ami_share_vpc = ec2.Vpc.from_lookup(self, "VPC",
-            vpc_id = config['vpc']['vpc_id']
+            vpc_id = config.vpc.vpc_id
         )
 
         # create a KMS key to encrypt project contents
         ami_share_kms_key = kms.Key(
             self, 
-            f"ami-share-kms-key-{CdkUtils.stack_tag}",
+            f"ami-share-kms-key-{self.stack_tag}",
             admins=[iam.AccountPrincipal(account_id=core.Aws.ACCOUNT_ID)],
             enable_key_rotation=True,
             enabled=True,
             description="KMS key used with EC2 Imagebuilder Ami Share project",
             removal_policy=core.RemovalPolicy.DESTROY,
-            alias=f"ami-share-kms-key-alias-{CdkUtils.stack_tag}"
+            alias=f"ami-share-kms-key-alias-{self.stack_tag}"
         )
 
         ami_share_kms_key.grant_encrypt_decrypt(iam.ServicePrincipal(service=f'imagebuilder.{core.Aws.URL_SUFFIX}'))
 
         # below role is assumed by the ImageBuilder ec2 instance
-        ami_share_image_role = iam.Role(self, f"ami-share-image-role-{CdkUtils.stack_tag}", assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"))
+        ami_share_image_role = iam.Role(self, f"ami-share-image-role-{self.stack_tag}", assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"))
         ami_share_image_role.add_managed_policy(iam.ManagedPolicy.from_aws_managed_policy_name("AmazonSSMManagedInstanceCore"))
         ami_share_image_role.add_managed_policy(iam.ManagedPolicy.from_aws_managed_policy_name("EC2InstanceProfileForImageBuilder"))
         ami_share_kms_key.grant_encrypt_decrypt(ami_share_image_role)
@@ -68,142 +91,224 @@ class AmiShareStack(core.Stack):
             ],
         ))
 
-        # create an instance profile to attach the role
+        # create an instance profile to attach the role, IAM names are global
+        # to the account so the name includes the region of the stack
         instance_profile = iam.CfnInstanceProfile(
-            self, f"ami-share-imagebuilder-instance-profile-{CdkUtils.stack_tag}",
-            instance_profile_name=f"ami-share-imagebuilder-instance-profile-{CdkUtils.stack_tag}",
+            self, f"ami-share-imagebuilder-instance-profile-{self.stack_tag}",
+            instance_profile_name=f"ami-share-imagebuilder-instance-profile-{self.stack_tag}-{self.region}",
             roles=[ami_share_image_role.role_name]
         )
 
         ssm.StringListParameter(
-            self, f"ami-share-distribution-list-{CdkUtils.stack_tag}",
-            parameter_name=f'/{CdkUtils.stack_tag}-AmiSharePipeline/DistributionList',
-            string_list_value=config["imagebuilder"]['distributionList']
+            self, f"ami-share-distribution-list-{self.stack_tag}",
+            parameter_name=f'/{self.stack_tag}-AmiSharePipeline/DistributionList',
+            string_list_value=list(config.imagebuilder.distribution_list)
         )
 
         sns_topic = sns.Topic(
-            self, f"ami-share-imagebuilder-topic-{CdkUtils.stack_tag}",
-            topic_name=f"ami-share-imagebuilder-topic-{CdkUtils.stack_tag}",
+            self, f"ami-share-imagebuilder-topic-{self.stack_tag}",
+            topic_name=f"ami-share-imagebuilder-topic-{self.stack_tag}",
             master_key=ami_share_kms_key
         )
 
         sns.Subscription(
-            self, f"ami-share-imagebuilder-subscription-{CdkUtils.stack_tag}",
+            self, f"ami-share-imagebuilder-subscription-{self.stack_tag}",
             topic=sns_topic,
-            endpoint=config["imagebuilder"]["imageBuilderEmailAddress"],
-            protocol=sns.SubscriptionProtocol.EMAIL
+            endpoint=config.imagebuilder.image_builder_email_address,
+            protocol=sns.SubscriptionProtocol.EMAIL,
+            # with the notification queue, only the digests of the notifications are emailed
+            filter_policy={
+                ami_build_notification.MESSAGE_TYPE_ATTRIBUTE: sns.SubscriptionFilter.string_filter(
+                    allowlist=[ami_build_notification.DIGEST_MESSAGE_TYPE]
+                )
+            } if config.notification_queue is not None else None
         )
 
         sns_topic.grant_publish(ami_share_image_role)
         ami_share_kms_key.grant_encrypt_decrypt(iam.ServicePrincipal(service=f'sns.{core.Aws.URL_SUFFIX}'))
 
-        # SG for the image build
+        # SG for the image build, limited to HTTP(S) when the VPC endpoints are enabled
         ami_share_imagebuilder_sg = ec2.SecurityGroup(
-            self, f"ami-share-imagebuilder-sg-{CdkUtils.stack_tag}",
+            self, f"ami-share-imagebuilder-sg-{self.stack_tag}",
             vpc=ami_share_vpc,
-            allow_all_outbound=True,
+            allow_all_outbound=not config.vpc.endpoints,
             description="Security group for the EC2 Image Builder Pipeline: " + self.stack_name + "-Pipeline",
-            security_group_name=f"ami-share-imagebuilder-sg-{CdkUtils.stack_tag}"
-        )
-
-        # create infrastructure configuration to supply instance type
-        infra_config = imagebuilder.CfnInfrastructureConfiguration(
-            self, f"ami-share-infra-config-{CdkUtils.stack_tag}",
-            name=f"ami-share-infra-config-{CdkUtils.stack_tag}",
-            instance_types=config["imagebuilder"]["instanceTypes"],
-            instance_profile_name=instance_profile.instance_profile_name,
-            subnet_id=config['vpc']['subnet_id'],
-            security_group_ids=[ami_share_imagebuilder_sg.security_group_id],
-            resource_tags={
-                "project": "ec2-imagebuilder-ami-share"
-            },
-            terminate_instance_on_failure=True,
-            sns_topic_arn=sns_topic.topic_arn
-        )
-        # infrastructure need to wait for instance profile to complete before beginning deployment.
-        infra_config.add_depends_on(instance_profile)
-
-         # recipe that installs the Ami Share components together with a Amazon Linux 2 base image
-        ami_share_recipe = imagebuilder.CfnImageRecipe(
-            self, f"ami-share-image-recipe-{CdkUtils.stack_tag}",
-            name=f"ami-share-image-recipe-{CdkUtils.stack_tag}",
-            version=config["imagebuilder"]["version"],
-            components=[
-                {
-                    "componentArn": core.Arn.format(components=core.ArnComponents(
-                        service="imagebuilder",
-                        resource="component",
-                        resource_name="aws-cli-version-2-linux/x.x.x",
-                        account="aws"
-                    ), stack=self)
-                }
-            ],
-            parent_image=f"arn:aws:imagebuilder:{self.region}:aws:image/{config['imagebuilder']['baseImageArn']}",
-            block_device_mappings=[
-                imagebuilder.CfnImageRecipe.InstanceBlockDeviceMappingProperty(
-                    device_name="/dev/xvda",
-                    ebs=imagebuilder.CfnImageRecipe.EbsInstanceBlockDeviceSpecificationProperty(
-                        delete_on_termination=True,
-                        # Encryption is disabled, because the export VM doesn't support encrypted ebs
-                        encrypted=False,
-                        volume_size=config["imagebuilder"]["ebsVolumeSize"],
-                        volume_type="gp2"
-                    )
-                )],
-            description=f"Recipe to build and validate AmiShareImageRecipe-{CdkUtils.stack_tag}",
-            tags={
-                "project": "ec2-imagebuilder-ami-share"
-            },
-            working_directory="/imagebuilder"
-        )      
-
-        # Distribution configuration for AMIs
-        ami_share_distribution_config = imagebuilder.CfnDistributionConfiguration(
-            self, f'ami-share-distribution-config-{CdkUtils.stack_tag}',
-            name=f'ami-share-distribution-config-{CdkUtils.stack_tag}',
-            distributions=[
-                imagebuilder.CfnDistributionConfiguration.DistributionProperty(
-                    region=self.region,
-                    ami_distribution_configuration={
-                        'Name': core.Fn.sub(f'AmiShare-{CdkUtils.stack_tag}-ImageRecipe-{{{{ imagebuilder:buildDate }}}}'),
-                        'AmiTags': {
-                            "project": "ec2-imagebuilder-ami-share",
-                            'Pipeline': f"AmiSharePipeline-{CdkUtils.stack_tag}"
-                        }
-                    }
-                )
-            ]
+            security_group_name=f"ami-share-imagebuilder-sg-{self.stack_tag}"
         )
 
-        # build the imagebuilder pipeline
-        ami_share_pipeline = imagebuilder.CfnImagePipeline(
-            self, f"ami-share-pipeline-{CdkUtils.stack_tag}",
-            name=f"ami-share-pipeline-{CdkUtils.stack_tag}",
-            image_recipe_arn=ami_share_recipe.attr_arn,
-            infrastructure_configuration_arn=infra_config.attr_arn,
-            tags={
-                "project": "ec2-imagebuilder-ami-share"
-            },
-            description=f"Image Pipeline for: AmiSharePipeline-{CdkUtils.stack_tag}",
-            enhanced_image_metadata_enabled=True,
-            image_tests_configuration=imagebuilder.CfnImagePipeline.ImageTestsConfigurationProperty(
-                image_tests_enabled=True,
-                timeout_minutes=90
-            ),
-            distribution_configuration_arn=ami_share_distribution_config.attr_arn,
-            status="ENABLED"
-        )
-        ami_share_pipeline.add_depends_on(infra_config)
+        if config.vpc.endpoints:
+            self.create_vpc_endpoints(ami_share_vpc, ami_share_imagebuilder_sg)
+
+        # component fetching the installers and packages of the builds through the artifact cache
+        artifact_cache_component = None
+        if config.artifact_cache is not None:
+            artifact_cache_component = self.create_artifact_cache(
+                config, ami_share_kms_key, ami_share_image_role
+            )
+
+        # Every pipeline of the project settings gets its own infrastructure
+        # configuration, recipe, distribution configurations and pipelines,
+        # all sharing the key, role, instance profile, topic and security group above.
+        # The unnamed default pipeline keeps the original resource names.
+        ami_share_pipelines = []
+        foundation_pipelines = []
+        # position of the next pipeline in the build schedule
+        build_index = 0
+
+        for pipeline in config.pipelines:
+            pipeline_suffix = pipeline.suffix
+
+            # create infrastructure configuration to supply instance type
+            infra_config = imagebuilder.CfnInfrastructureConfiguration(
+                self, f"ami-share-infra-config-{self.stack_tag}{pipeline_suffix}",
+                name=f"ami-share-infra-config-{self.stack_tag}{pipeline_suffix}",
+                instance_types=list(pipeline.instance_types),
+                instance_profile_name=instance_profile.instance_profile_name,
+                subnet_id=config.vpc.subnet_id,
+                security_group_ids=[ami_share_imagebuilder_sg.security_group_id],
+                resource_tags={
+                    "project": "ec2-imagebuilder-ami-share"
+                },
+                terminate_instance_on_failure=True,
+                sns_topic_arn=sns_topic.topic_arn
+            )
+            # infrastructure need to wait for instance profile to complete before beginning deployment.
+            infra_config.add_depends_on(instance_profile)
+
+            # recipe that installs the Ami Share components together with the base image of the pipeline
+            base_image = f"arn:aws:imagebuilder:{self.region}:aws:image/{pipeline.base_image_arn}"
+            full_components = [self.get_aws_component("aws-cli-version-2-linux")]
+            if artifact_cache_component is not None:
+                # the artifact cache component copies the artifacts with the aws cli
+                full_components.append({"componentArn": artifact_cache_component.attr_arn})
+
+            if pipeline.has_foundation:
+                # The foundation recipe installs all components on the base image and is built
+                # by its own pipeline, without distribution. Its images stay in this account.
+                foundation_recipe = self.create_image_recipe(
+                    f"ami-share-image-recipe-{self.stack_tag}{pipeline_suffix}-foundation",
+                    pipeline, full_components, base_image,
+                    f"Recipe to build and validate AmiShareImageRecipe-{self.stack_tag}{pipeline_suffix}-Foundation"
+                )
+
+                foundation_pipeline = imagebuilder.CfnImagePipeline(
+                    self, f"ami-share-pipeline-{self.stack_tag}{pipeline_suffix}-foundation",
+                    name=f"ami-share-pipeline-{self.stack_tag}{pipeline_suffix}-foundation",
+                    image_recipe_arn=foundation_recipe.attr_arn,
+                    infrastructure_configuration_arn=infra_config.attr_arn,
+                    tags={
+                        "project": "ec2-imagebuilder-ami-share"
+                    },
+                    description=f"Foundation Image Pipeline for: AmiSharePipeline-{self.stack_tag}{pipeline_suffix}",
+                    enhanced_image_metadata_enabled=True,
+                    image_tests_configuration=imagebuilder.CfnImagePipeline.ImageTestsConfigurationProperty(
+                        image_tests_enabled=True,
+                        timeout_minutes=90
+                    ),
+                    schedule=self.get_pipeline_schedule(config.schedule, build_index),
+                    status="ENABLED"
+                )
+                foundation_pipeline.add_depends_on(infra_config)
+                build_index += 1
+
+                foundation_pipelines.append({
+                    'pipeline': pipeline,
+                    'image_pipeline': foundation_pipeline
+                })
+
+            if pipeline.incremental:
+                # Patch builds start from the newest version of the foundation image and only
+                # apply the OS updates released since, instead of reinstalling every component.
+                # Image Builder resolves the x.x.x version filter when the build starts.
+                ami_share_recipe = self.create_image_recipe(
+                    f"ami-share-image-recipe-{self.stack_tag}{pipeline_suffix}",
+                    pipeline, [self.get_aws_component("update-linux")],
+                    f"arn:aws:imagebuilder:{self.region}:{self.account}:image/{foundation_recipe.name.lower()}/x.x.x",
+                    f"Recipe to patch and validate AmiShareImageRecipe-{self.stack_tag}{pipeline_suffix}"
+                )
+                ami_share_recipe.add_depends_on(foundation_recipe)
+            else:
+                ami_share_recipe = self.create_image_recipe(
+                    f"ami-share-image-recipe-{self.stack_tag}{pipeline_suffix}",
+                    pipeline, full_components, base_image,
+                    f"Recipe to build and validate AmiShareImageRecipe-{self.stack_tag}{pipeline_suffix}"
+                )
+
+            # The publishing and sharing accounts are spread across as many
+            # distribution configurations, and pipelines, as are required to stay
+            # within the EC2 Image Builder and EC2 limits of a single distribution.
+            # The AMI tags of the distribution configurations reduce the tags left for the account lists.
+            reserved_tags = distribution_planner.reserved_ami_tags(self.get_distribution_ami_tags(pipeline_suffix))
+            account_chunks = distribution_planner.plan_account_chunks(
+                publishing_account_ids=pipeline.ami_publishing_target_ids,
+                sharing_account_ids=pipeline.ami_sharing_ids,
+                reserved_tags=reserved_tags
+            )
+
+            for index in range(len(account_chunks)):
+                # the first distribution keeps the name of the pipeline
+                suffix = pipeline_suffix + (f"-{index}" if index else "")
+
+                # Distribution configuration for AMIs
+                ami_share_distribution_config = imagebuilder.CfnDistributionConfiguration(
+                    self, f'ami-share-distribution-config-{self.stack_tag}{suffix}',
+                    name=f'ami-share-distribution-config-{self.stack_tag}{suffix}',
+                    distributions=[
+                        imagebuilder.CfnDistributionConfiguration.DistributionProperty(
+                            region=self.region,
+                            ami_distribution_configuration={
+                                'Name': core.Fn.sub(f'AmiShare-{self.stack_tag}{pipeline_suffix}-ImageRecipe-{{{{ imagebuilder:buildDate }}}}'),
+                                'AmiTags': self.get_distribution_ami_tags(suffix)
+                            }
+                        )
+                    ]
+                )
+
+                # build the imagebuilder pipeline
+                ami_share_pipeline = imagebuilder.CfnImagePipeline(
+                    self, f"ami-share-pipeline-{self.stack_tag}{suffix}",
+                    name=f"ami-share-pipeline-{self.stack_tag}{suffix}",
+                    image_recipe_arn=ami_share_recipe.attr_arn,
+                    infrastructure_configuration_arn=infra_config.attr_arn,
+                    tags={
+                        "project": "ec2-imagebuilder-ami-share"
+                    },
+                    description=f"Image Pipeline for: AmiSharePipeline-{self.stack_tag}{suffix}",
+                    enhanced_image_metadata_enabled=True,
+                    image_tests_configuration=imagebuilder.CfnImagePipeline.ImageTestsConfigurationProperty(
+                        image_tests_enabled=True,
+                        timeout_minutes=90
+                    ),
+                    distribution_configuration_arn=ami_share_distribution_config.attr_arn,
+                    schedule=self.get_pipeline_schedule(config.schedule, build_index),
+                    status="ENABLED"
+                )
+                ami_share_pipeline.add_depends_on(infra_config)
+                build_index += 1
+
+                ami_share_pipelines.append({
+                    'pipeline': pipeline,
+                    'suffix': suffix,
+                    'index': index,
+                    'count': len(account_chunks),
+                    'reserved_tags': reserved_tags,
+                    'distribution_config': ami_share_distribution_config,
+                    'image_pipeline': ami_share_pipeline
+                })
 
         # Create ami distribution lambda function - this is required because 
         # EC2 ImageBuilder AMI distribution setting targetAccountIds
         # is not supported by CloudFormation (as of September 2021).
         # see https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-resource-imagebuilder-distributionconfiguration.html
         
+        # Runtime, architecture, memory size and log level of the lambda functions
+        lambda_settings = self.get_lambda_settings(config.lambda_)
+        direct_custom_resources = config.lambda_.custom_resource_mode == 'direct'
+
         # Create a role for the amidistribution lambda function
         amidistribution_lambda_role = iam.Role(
             scope=self,
-            id=f"amidistributionLambdaRole-{CdkUtils.stack_tag}",
+            id=f"amidistributionLambdaRole-{self.stack_tag}",
             assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
             managed_policies=[
                 iam.ManagedPolicy.from_aws_managed_policy_name(
@@ -214,8 +319,9 @@ class AmiShareStack(core.Stack):
         amidistribution_lambda_role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
-                resources=[ami_share_distribution_config.attr_arn],
+                resources=[entry['distribution_config'].attr_arn for entry in ami_share_pipelines],
                 actions=[
+                    "imagebuilder:GetDistributionConfiguration",
                     "imagebuilder:UpdateDistributionConfiguration"
                 ]
             )
@@ -223,7 +329,14 @@ class AmiShareStack(core.Stack):
         amidistribution_lambda_role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
-                resources=[f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{CdkUtils.stack_tag}-AmiSharing/*"],
+                resources=[
+                    resource
+                    for pipeline in config.pipelines
+                    for resource in [
+                        f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{self.stack_tag}-AmiSharing{pipeline.suffix}",
+                        f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{self.stack_tag}-AmiSharing{pipeline.suffix}/*"
+                    ]
+                ],
                 actions=[
                         "ssm:GetParameter",
                         "ssm:GetParameters",
@@ -236,54 +349,261 @@ class AmiShareStack(core.Stack):
         # ami distribution setting currently not supported in Cloudformation
         ami_distribution_lambda = aws_lambda.Function(
             scope=self,
-            id=f"amiDistributionLambda-{CdkUtils.stack_tag}",
+            id=f"amiDistributionLambda-{self.stack_tag}",
             code=aws_lambda.Code.asset("stacks/amishare/resources/amidistribution"),
-            handler="ami_distribution.lambda_handler",
-            runtime=aws_lambda.Runtime.PYTHON_3_6,
-            role=amidistribution_lambda_role
+            handler="ami_distribution.direct_handler" if direct_custom_resources else "ami_distribution.lambda_handler",
+            role=amidistribution_lambda_role,
+            # a single invocation updates every distribution configuration of the stack
+            timeout=core.Duration.minutes(5),
+            environment={
+                'LOG_LEVEL': lambda_settings['log_level']
+            },
+            **lambda_settings['function_props']
         )
 
-        # Provider that invokes the ami distribution lambda function
-        ami_distribution_provider = custom_resources.Provider(
-            self, 
-            f'AmiDistributionCustomResourceProvider-{CdkUtils.stack_tag}',
-            on_event_handler=ami_distribution_lambda
-        )
+        if direct_custom_resources:
+            # CloudFormation invokes the ami distribution lambda function,
+            # which sends the custom resource responses itself
+            ami_distribution_service_token = ami_distribution_lambda.function_arn
+        else:
+            # Provider that invokes the ami distribution lambda function
+            ami_distribution_provider = custom_resources.Provider(
+                self, 
+                f'AmiDistributionCustomResourceProvider-{self.stack_tag}',
+                on_event_handler=ami_distribution_lambda
+            )
+            ami_distribution_service_token = ami_distribution_provider.service_token
+
+        # Create a SSM Parameters for AMI Publishing and Sharing Ids of every pipeline
+        # so as not to hardcode the account id values in the Lambda.
+        # Large lists are split across numbered parameters below each path.
+        ssm_ami_sharing_ids_paths = {}
+        ami_distribution_targets = []
+
+        for pipeline in config.pipelines:
+            ssm_ami_sharing_path = f'/{self.stack_tag}-AmiSharing{pipeline.suffix}'
 
-        # Create a SSM Parameters for AMI Publishing and Sharing Ids
-        # so as not to hardcode the account id values in the Lambda
-        ssm_ami_publishing_target_ids = ssm.StringListParameter(
-            self, f"AmiPublishingTargetIds-{CdkUtils.stack_tag}",
-            parameter_name=f'/{CdkUtils.stack_tag}-AmiSharing/AmiPublishingTargetIds',
-            string_list_value=config['imagebuilder']['amiPublishingTargetIds']
+            ssm_ami_publishing_target_ids_path = self.create_sharded_string_list_parameters(
+                f"AmiPublishingTargetIds-{self.stack_tag}{pipeline.suffix}",
+                f'{ssm_ami_sharing_path}/AmiPublishingTargetIds',
+                pipeline.ami_publishing_target_ids
+            )
+
+            ssm_ami_sharing_ids_path = self.create_sharded_string_list_parameters(
+                f"AmiSharingAccountIds-{self.stack_tag}{pipeline.suffix}",
+                f'{ssm_ami_sharing_path}/AmiSharingAccountIds',
+                pipeline.ami_sharing_ids
+            )
+            ssm_ami_sharing_ids_paths[f"ami-share-image-recipe-{self.stack_tag}{pipeline.suffix}"] = ssm_ami_sharing_ids_path
+
+            # The distribution targets of the pipeline,
+            # one for each distribution configuration of the pipeline
+            for entry in ami_share_pipelines:
+                if entry['pipeline'] is not pipeline:
+                    continue
+                ami_distribution_targets.append({
+                    'AwsDistributionRegions': list(pipeline.ami_publishing_regions),
+                    'ImageBuilderName': f"AmiDistributionConfig-{self.stack_tag}{entry['suffix']}",
+                    'AmiDistributionName': f"AmiShare-{self.stack_tag}{pipeline.suffix}" + "-{{ imagebuilder:buildDate }}",
+                    'AmiDistributionArn': entry['distribution_config'].attr_arn,
+                    'DistributionIndex': entry['index'],
+                    'DistributionCount': entry['count'],
+                    'ReservedTags': entry['reserved_tags'],
+                    'AccountIdsPath': ssm_ami_sharing_path,
+                    'PublishingAccountIds': ssm_ami_publishing_target_ids_path,
+                    'SharingAccountIds': ssm_ami_sharing_ids_path,
+                    **self.get_fast_launch_configurations(pipeline)
+                })
+
+        # The custom resource that uses the ami distribution lambda function to supply
+        # the values of every distribution configuration, which it updates in parallel.
+        # The service token of a custom resource can not be updated, so switching
+        # modes replaces the custom resource under a new logical id.
+        ami_distribution_custom_resource = core.CustomResource(
+            self,
+            f'AmiDistribution{"Direct" if direct_custom_resources else ""}CustomResource-{self.stack_tag}',
+            service_token=ami_distribution_service_token,
+            properties={
+                'CdkStackName': self.stack_tag,
+                'DistributionTargets': ami_distribution_targets
+            }
         )
+        for entry in ami_share_pipelines:
+            ami_distribution_custom_resource.node.add_dependency(entry['distribution_config'])
 
-        ssm_ami_sharing_ids = ssm.StringListParameter(
-            self, f"AmiSharingAccountIds-{CdkUtils.stack_tag}",
-            parameter_name=f'/{CdkUtils.stack_tag}-AmiSharing/AmiSharingAccountIds',
-            string_list_value=config['imagebuilder']['amiSharingIds']
+        # Create ami launch permission lambda function - shares the distributed
+        # AMIs and their snapshots with the sharing accounts as soon as
+        # EC2 ImageBuilder reports that an image is available.
+
+        # Create a role for the ami launch permission lambda function
+        ami_launch_permission_lambda_role = iam.Role(
+            scope=self,
+            id=f"amiLaunchPermissionLambdaRole-{self.stack_tag}",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaBasicExecutionRole"
+                )
+            ]
+        )
+        ami_launch_permission_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[f"arn:aws:imagebuilder:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:image/*"],
+                actions=[
+                    "imagebuilder:GetImage"
+                ]
+            )
+        )
+        ami_launch_permission_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[entry['image_pipeline'].attr_arn for entry in ami_share_pipelines],
+                actions=[
+                    # finds the previous images of a pipeline to clean up their launch acceleration
+                    "imagebuilder:ListImagePipelineImages"
+                ]
+            )
+        )
+        ami_launch_permission_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=["*"],
+                actions=[
+                    "ec2:DescribeImages",
+                    "ec2:ModifyImageAttribute",
+                    "ec2:ModifySnapshotAttribute",
+                    "ec2:DescribeFastSnapshotRestores",
+                    "ec2:EnableFastSnapshotRestores",
+                    "ec2:DisableFastSnapshotRestores",
+                    "ec2:DescribeFastLaunchImages",
+                    "ec2:DisableFastLaunch",
+                    # required to share AMIs with organizations and OUs
+                    "organizations:DescribeOrganization",
+                    "organizations:DescribeOrganizationalUnit"
+                ]
+            )
+        )
+        ami_launch_permission_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[
+                    f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{self.stack_tag}-AmiSharing{pipeline.suffix}/*"
+                    for pipeline in config.pipelines
+                ],
+                actions=[
+                        "ssm:GetParametersByPath"
+                ]
+            )
         )
 
-        # The custom resource that uses the ami distribution provider to supply values
-        ami_distribution_custom_resource = core.CustomResource(
-            self, 
-            f'AmiDistributionCustomResource-{CdkUtils.stack_tag}',
-            service_token=ami_distribution_provider.service_token,
-            properties = {
-                'CdkStackName': CdkUtils.stack_tag,
-                'AwsDistributionRegions': config['imagebuilder']['amiPublishingRegions'],
-                'ImageBuilderName': f'AmiDistributionConfig-{CdkUtils.stack_tag}',
-                'AmiDistributionName': f"AmiShare-{CdkUtils.stack_tag}" + "-{{ imagebuilder:buildDate }}",
-                'AmiDistributionArn': ami_share_distribution_config.attr_arn,
-                'PublishingAccountIds': ssm_ami_publishing_target_ids.parameter_name,
-                'SharingAccountIds': ssm_ami_sharing_ids.parameter_name
+        # The lambda function writes the latest AMI of every pipeline to SSM parameters
+        # in the distribution regions and, through their role, in the sharing accounts
+        latest_ami_parameter_paths = {}
+        latest_ami_sharing_account_role_name = ''
+        if config.latest_ami_parameters is not None:
+            latest_ami_parameter_paths = {
+                f"ami-share-image-recipe-{self.stack_tag}{pipeline.suffix}": config.latest_ami_parameters.pipeline_path(self.stack_tag, pipeline)
+                for pipeline in config.pipelines
             }
+            ami_launch_permission_lambda_role.add_to_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    resources=[
+                        f"arn:aws:ssm:{region}:{core.Aws.ACCOUNT_ID}:parameter{config.latest_ami_parameters.pipeline_path(self.stack_tag, pipeline)}/*"
+                        for pipeline in config.pipelines
+                        for region in pipeline.ami_publishing_regions
+                    ],
+                    actions=[
+                        "ssm:PutParameter"
+                    ]
+                )
+            )
+            if config.latest_ami_parameters.sharing_account_role_name:
+                latest_ami_sharing_account_role_name = config.latest_ami_parameters.sharing_account_role_name
+                ami_launch_permission_lambda_role.add_to_policy(
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        resources=[f"arn:aws:iam::*:role/{latest_ami_sharing_account_role_name}"],
+                        actions=[
+                            "sts:AssumeRole"
+                        ]
+                    )
+                )
+
+        ami_launch_permission_lambda = aws_lambda.Function(
+            scope=self,
+            id=f"amiLaunchPermissionLambda-{self.stack_tag}",
+            code=aws_lambda.Code.asset("stacks/amishare/resources/amilaunchpermission"),
+            handler="ami_launch_permission.lambda_handler",
+            role=ami_launch_permission_lambda_role,
+            timeout=core.Duration.minutes(5),
+            environment={
+                'LOG_LEVEL': lambda_settings['log_level'],
+                # the sharing ids path of every pipeline, by image recipe name
+                'SHARING_ACCOUNT_IDS_PATHS': json.dumps(ssm_ami_sharing_ids_paths, sort_keys=True),
+                'MAX_WORKERS': str(config.imagebuilder.launch_permission_max_workers),
+                # the fast snapshot restore availability zones of every pipeline, by image recipe name and region
+                'FAST_SNAPSHOT_RESTORE_ZONES': json.dumps({
+                    f"ami-share-image-recipe-{self.stack_tag}{pipeline.suffix}": {
+                        region.region: list(region.fast_snapshot_restore_zones)
+                        for region in pipeline.region_settings if region.fast_snapshot_restore_zones
+                    }
+                    for pipeline in config.pipelines
+                    if any(region.fast_snapshot_restore_zones for region in pipeline.region_settings)
+                }, sort_keys=True),
+                # the image recipe names of the pipelines that use Fast Launch in a region
+                'FAST_LAUNCH_IMAGE_NAMES': json.dumps(sorted(
+                    f"ami-share-image-recipe-{self.stack_tag}{pipeline.suffix}"
+                    for pipeline in config.pipelines
+                    if any(region.fast_launch is not None for region in pipeline.region_settings)
+                )),
+                # the latest AMI parameter path of every pipeline, by image recipe name
+                'LATEST_AMI_PARAMETER_PATHS': json.dumps(latest_ami_parameter_paths, sort_keys=True),
+                'LATEST_AMI_SHARING_ACCOUNT_ROLE_NAME': latest_ami_sharing_account_role_name
+            },
+            **lambda_settings['function_props']
+        )
+
+        # EventBridge rule that invokes the lambda function
+        # when an image of one of the pipelines becomes available
+        ami_launch_permission_rule = events.CfnRule(
+            self, f"ami-share-image-available-rule-{self.stack_tag}",
+            description=f"Share AMIs built by AmiSharePipeline-{self.stack_tag}",
+            event_pattern={
+                "source": ["aws.imagebuilder"],
+                "detail-type": ["EC2 Image Builder Image State Change"],
+                "detail": {
+                    "state": {
+                        "status": ["AVAILABLE"]
+                    }
+                },
+                "resources": [
+                    {"prefix": f"arn:aws:imagebuilder:{self.region}:{self.account}:image/{recipe_name}/"}
+                    for recipe_name in sorted(ssm_ami_sharing_ids_paths)
+                ]
+            },
+            state="ENABLED",
+            targets=[
+                events.CfnRule.TargetProperty(
+                    arn=ami_launch_permission_lambda.function_arn,
+                    id=f"amiLaunchPermissionLambda-{self.stack_tag}"
+                )
+            ]
         )
 
-        ami_distribution_custom_resource.node.add_dependency(ami_share_distribution_config)
+        ami_launch_permission_lambda.add_permission(
+            f"ami-share-image-available-rule-permission-{self.stack_tag}",
+            principal=iam.ServicePrincipal("events.amazonaws.com"),
+            source_arn=ami_launch_permission_rule.attr_arn
+        )
 
-        # The result obtained from the output of custom resource
-        ami_distriubtion_arn = core.CustomResource.get_att_string(ami_distribution_custom_resource, attribute_name='AmiDistributionArn')
+        # Buffer the build notifications in a queue and email their digests
+        notification_queue = None
+        if config.notification_queue is not None:
+            notification_queue = self.create_notification_queue(
+                config.notification_queue, sns_topic, ami_share_kms_key, lambda_settings
+            )
 
         ##################################################
         ## <START> CDK Outputs
@@ -291,28 +611,401 @@ class AmiShareStack(core.Stack):
 
         core.CfnOutput(
             self,
-            id=f"export-ami-share-sns-topic-arn-{CdkUtils.stack_tag}",
-            export_name=f"AmiShare-SnsTopicArn-{CdkUtils.stack_tag}", 
+            id=f"export-ami-share-sns-topic-arn-{self.stack_tag}",
+            export_name=f"AmiShare-SnsTopicArn-{self.stack_tag}", 
             value=sns_topic.topic_arn,
             description="Ami Share Sns Topic"
         )
+
+        if notification_queue is not None:
+            core.CfnOutput(
+                self,
+                id=f"export-ami-share-notification-queue-arn-{self.stack_tag}",
+                export_name=f"AmiShare-NotificationQueueArn-{self.stack_tag}",
+                value=notification_queue.queue_arn,
+                description="Ami Share build notification queue"
+            )
         
         core.CfnOutput(
             self,
-            id=f"export-ami-share-kms-key-arn-{CdkUtils.stack_tag}",
-            export_name=f"AmiShare-KmsKeyArn-{CdkUtils.stack_tag}", 
+            id=f"export-ami-share-kms-key-arn-{self.stack_tag}",
+            export_name=f"AmiShare-KmsKeyArn-{self.stack_tag}", 
             value=ami_share_kms_key.key_arn,
             description="Ami Share KMS Key ARN"
         )
 
-        core.CfnOutput(
-            self,
-            id=f"export-ami-share-pipeline-arn-{CdkUtils.stack_tag}",
-            export_name=f"AmiShare-PipelineArn-{CdkUtils.stack_tag}",
-            value=ami_share_pipeline.attr_arn,
-            description="Ami Share Pipeline Arn"
-        )
+        for entry in ami_share_pipelines:
+            suffix = entry['suffix']
+            core.CfnOutput(
+                self,
+                id=f"export-ami-share-pipeline-arn-{self.stack_tag}{suffix}",
+                export_name=f"AmiShare-PipelineArn-{self.stack_tag}{suffix}",
+                value=entry['image_pipeline'].attr_arn,
+                description="Ami Share Pipeline Arn"
+            )
+
+        for entry in foundation_pipelines:
+            suffix = entry['pipeline'].suffix
+            core.CfnOutput(
+                self,
+                id=f"export-ami-share-foundation-pipeline-arn-{self.stack_tag}{suffix}",
+                export_name=f"AmiShare-FoundationPipelineArn-{self.stack_tag}{suffix}",
+                value=entry['image_pipeline'].attr_arn,
+                description="Ami Share Foundation Pipeline Arn"
+            )
 
         ##################################################
         ## </END> CDK Outputs
         ##################################################
+
+    @staticmethod
+    def get_lambda_settings(lambda_settings: LambdaSettings) -> dict:
+        """
+            Map the validated "lambda" project settings to the
+            aws_lambda.Function properties shared by the project's functions.
+        """
+        architectures = {
+            'arm64': aws_lambda.Architecture.ARM_64,
+            'x86_64': aws_lambda.Architecture.X86_64
+        }
+
+        return {
+            'log_level': lambda_settings.log_level,
+            'function_props': {
+                'runtime': aws_lambda.Runtime(lambda_settings.runtime, aws_lambda.RuntimeFamily.PYTHON),
+                'architecture': architectures[lambda_settings.architecture],
+                'memory_size': lambda_settings.memory_size
+            }
+        }
+
+    def get_distribution_ami_tags(self, suffix: str) -> dict:
+        """The AmiTags of the distribution configuration of the pipeline or account chunk suffix."""
+        return {
+            "project": "ec2-imagebuilder-ami-share",
+            'Pipeline': f"AmiSharePipeline-{self.stack_tag}{suffix}"
+        }
+
+    @staticmethod
+    def get_fast_launch_configurations(pipeline: PipelineSettings) -> dict:
+        """
+            The FastLaunchConfigurations property of the distribution targets
+            of pipeline, keyed by region, or no property when no region uses Fast Launch.
+        """
+        fast_launch_configurations = {
+            region.region: {
+                'TargetResourceCount': region.fast_launch.target_resource_count,
+                'MaxParallelLaunches': region.fast_launch.max_parallel_launches
+            }
+            for region in pipeline.region_settings if region.fast_launch is not None
+        }
+        return {'FastLaunchConfigurations': fast_launch_configurations} if fast_launch_configurations else {}
+
+    @staticmethod
+    def get_pipeline_schedule(schedule_settings: ScheduleSettings, build_index: int) -> imagebuilder.CfnImagePipeline.ScheduleProperty:
+        """
+            Schedule of the build_index-th image pipeline of the stack,
+            None for pipelines that are only run on demand.
+        """
+        if schedule_settings is None:
+            return None
+
+        return imagebuilder.CfnImagePipeline.ScheduleProperty(
+            schedule_expression=schedule_settings.schedule_expression_for(build_index),
+            pipeline_execution_start_condition=schedule_settings.start_condition
+        )
+
+    def create_vpc_endpoints(self, vpc: ec2.IVpc, imagebuilder_sg: ec2.SecurityGroup) -> None:
+        """
+            Add private endpoints for the services used by the build instances to vpc,
+            so that their calls do not leave the VPC through the NAT gateway.
+        """
+        # S3 is reached through a gateway endpoint in the route tables of the VPC
+        vpc.add_gateway_endpoint(
+            f"ami-share-s3-endpoint-{self.stack_tag}",
+            service=ec2.GatewayVpcEndpointAwsService.S3
+        )
+
+        endpoint_sg = ec2.SecurityGroup(
+            self, f"ami-share-endpoint-sg-{self.stack_tag}",
+            vpc=vpc,
+            allow_all_outbound=False,
+            description="Security group for the VPC endpoints of: " + self.stack_name + "-Pipeline",
+            security_group_name=f"ami-share-endpoint-sg-{self.stack_tag}"
+        )
+        endpoint_sg.add_ingress_rule(imagebuilder_sg, ec2.Port.tcp(443), "HTTPS from the image builds")
+
+        interface_services = {
+            "ssm": ec2.InterfaceVpcEndpointAwsService.SSM,
+            "ssmmessages": ec2.InterfaceVpcEndpointAwsService.SSM_MESSAGES,
+            "ec2messages": ec2.InterfaceVpcEndpointAwsService.EC2_MESSAGES,
+            "imagebuilder": ec2.InterfaceVpcEndpointAwsService("imagebuilder"),
+            "logs": ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS,
+            "kms": ec2.InterfaceVpcEndpointAwsService.KMS
+        }
+        for name, service in interface_services.items():
+            vpc.add_interface_endpoint(
+                f"ami-share-{name}-endpoint-{self.stack_tag}",
+                service=service,
+                private_dns_enabled=True,
+                security_groups=[endpoint_sg]
+            )
+
+        # the endpoints and the component downloads are served over HTTPS,
+        # the Amazon Linux package repositories in S3 over HTTP
+        imagebuilder_sg.add_egress_rule(ec2.Peer.any_ipv4(), ec2.Port.tcp(443), "HTTPS to AWS services and component downloads")
+        imagebuilder_sg.add_egress_rule(ec2.Peer.any_ipv4(), ec2.Port.tcp(80), "HTTP to the package repositories")
+
+    def create_artifact_cache(self, config: ProjectSettings, kms_key: kms.Key, image_role: iam.Role) -> imagebuilder.CfnComponent:
+        """
+            Create the artifact cache bucket, readable and writable by the builds,
+            and the component that fetches the artifacts through it.
+        """
+        artifact_cache_bucket = s3.Bucket(
+            self, f"ami-share-artifact-cache-{self.stack_tag}",
+            encryption=s3.BucketEncryption.KMS,
+            encryption_key=kms_key,
+            bucket_key_enabled=True,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            removal_policy=core.RemovalPolicy.DESTROY,
+            auto_delete_objects=True
+        )
+        # the builds store the artifacts they had to download from upstream
+        artifact_cache_bucket.grant_read_write(image_role, f"{ArtifactCache.ARTIFACT_CACHE_PREFIX}/*")
+
+        # used to find the bucket when pre-staging the artifacts
+        ssm.StringParameter(
+            self, f"ami-share-artifact-cache-bucket-{self.stack_tag}",
+            parameter_name=ArtifactCache.artifact_cache_bucket_parameter(self.stack_tag),
+            string_value=artifact_cache_bucket.bucket_name
+        )
+
+        return imagebuilder.CfnComponent(
+            self, f"ami-share-artifact-cache-component-{self.stack_tag}",
+            name=f"ami-share-artifact-cache-component-{self.stack_tag}",
+            platform="Linux",
+            version=config.imagebuilder.version,
+            description="Fetches the build artifacts from the artifact cache, falling back to their upstream url",
+            kms_key_id=kms_key.key_arn,
+            # JSON is valid YAML, the format of component documents
+            data=json.dumps({
+                "name": f"ami-share-artifact-cache-{self.stack_tag}",
+                "schemaVersion": 1.0,
+                "phases": [{
+                    "name": "build",
+                    "steps": [{
+                        "name": "FetchArtifacts",
+                        "action": "ExecuteBash",
+                        "inputs": {
+                            "commands": [
+                                ArtifactCache.fetch_script(artifact_cache_bucket.bucket_name, config.artifact_cache.artifacts)
+                            ]
+                        }
+                    }]
+                }]
+            }),
+            tags={
+                "project": "ec2-imagebuilder-ami-share"
+            }
+        )
+
+    def create_notification_queue(self, settings: NotificationQueueSettings, sns_topic: sns.Topic, kms_key: kms.Key,
+                                  lambda_settings: dict) -> sqs.Queue:
+        """
+            Create the queue subscribed to the build notifications of sns_topic, the lambda
+            function consuming it in batches and the scheduled lambda function publishing
+            the digests of the notifications.
+        """
+        consumer_timeout = core.Duration.minutes(1)
+        digest_timeout = core.Duration.minutes(5)
+
+        notification_dlq = sqs.Queue(
+            self, f"ami-share-notification-dlq-{self.stack_tag}",
+            encryption=sqs.QueueEncryption.KMS,
+            encryption_master_key=kms_key,
+            retention_period=core.Duration.days(14)
+        )
+        notification_queue = sqs.Queue(
+            self, f"ami-share-notification-queue-{self.stack_tag}",
+            encryption=sqs.QueueEncryption.KMS,
+            encryption_master_key=kms_key,
+            # six times the timeout of the consumer plus the batching window, as recommended for SQS event sources
+            visibility_timeout=core.Duration.seconds(6 * consumer_timeout.to_seconds() + settings.max_batching_window_seconds),
+            dead_letter_queue=sqs.DeadLetterQueue(queue=notification_dlq, max_receive_count=5)
+        )
+        notification_queue.add_to_resource_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                principals=[iam.ServicePrincipal("sns.amazonaws.com")],
+                resources=[notification_queue.queue_arn],
+                actions=["sqs:SendMessage"],
+                conditions={"ArnEquals": {"aws:SourceArn": sns_topic.topic_arn}}
+            )
+        )
+        sns.Subscription(
+            self, f"ami-share-notification-subscription-{self.stack_tag}",
+            topic=sns_topic,
+            endpoint=notification_queue.queue_arn,
+            protocol=sns.SubscriptionProtocol.SQS,
+            raw_message_delivery=True,
+            # the digests published to the topic are not queued again
+            filter_policy={
+                ami_build_notification.MESSAGE_TYPE_ATTRIBUTE: sns.SubscriptionFilter(conditions=[{"exists": False}])
+            }
+        )
+
+        # buffers the de-duplicated transitions until the next digest, dropping
+        # the transitions sent again within the deduplication interval
+        digest_queue = sqs.Queue(
+            self, f"ami-share-notification-digest-queue-{self.stack_tag}",
+            fifo=True,
+            encryption=sqs.QueueEncryption.KMS,
+            encryption_master_key=kms_key,
+            retention_period=core.Duration.days(14)
+        )
+
+        consumer_role = iam.Role(
+            scope=self,
+            id=f"amiBuildNotificationLambdaRole-{self.stack_tag}",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaBasicExecutionRole"
+                )
+            ]
+        )
+        notification_queue.grant_consume_messages(consumer_role)
+        digest_queue.grant_send_messages(consumer_role)
+
+        consumer = aws_lambda.Function(
+            scope=self,
+            id=f"amiBuildNotificationLambda-{self.stack_tag}",
+            code=aws_lambda.Code.asset("stacks/amishare/resources/amibuildnotification"),
+            handler="ami_build_notification.lambda_handler",
+            role=consumer_role,
+            timeout=consumer_timeout,
+            environment={
+                'LOG_LEVEL': lambda_settings['log_level'],
+                'DIGEST_QUEUE_URL': digest_queue.queue_url
+            },
+            **lambda_settings['function_props']
+        )
+        aws_lambda.EventSourceMapping(
+            self, f"amiBuildNotificationEventSource-{self.stack_tag}",
+            target=consumer,
+            event_source_arn=notification_queue.queue_arn,
+            batch_size=settings.batch_size,
+            max_batching_window=core.Duration.seconds(settings.max_batching_window_seconds)
+            if settings.max_batching_window_seconds else None,
+            # only the failed records of a batch are delivered again
+            report_batch_item_failures=True
+        )
+
+        digest_role = iam.Role(
+            scope=self,
+            id=f"amiBuildDigestLambdaRole-{self.stack_tag}",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaBasicExecutionRole"
+                )
+            ]
+        )
+        digest_queue.grant_consume_messages(digest_role)
+        sns_topic.grant_publish(digest_role)
+        kms_key.grant_encrypt_decrypt(digest_role)
+
+        digest = aws_lambda.Function(
+            scope=self,
+            id=f"amiBuildDigestLambda-{self.stack_tag}",
+            code=aws_lambda.Code.asset("stacks/amishare/resources/amibuildnotification"),
+            handler="ami_build_notification.digest_handler",
+            role=digest_role,
+            timeout=digest_timeout,
+            environment={
+                'LOG_LEVEL': lambda_settings['log_level'],
+                'DIGEST_QUEUE_URL': digest_queue.queue_url,
+                # the drained messages stay hidden until the digest has been published
+                'DIGEST_VISIBILITY_TIMEOUT': str(digest_timeout.to_seconds() * 3),
+                'SNS_TOPIC_ARN': sns_topic.topic_arn
+            },
+            **lambda_settings['function_props']
+        )
+        digest_period = settings.digest_period_hours
+        digest_rule = events.CfnRule(
+            self, f"ami-share-notification-digest-rule-{self.stack_tag}",
+            description=f"Digest of the build notifications of AmiSharePipeline-{self.stack_tag}",
+            schedule_expression=f"rate({digest_period} {'hour' if digest_period == 1 else 'hours'})",
+            state="ENABLED",
+            targets=[
+                events.CfnRule.TargetProperty(
+                    arn=digest.function_arn,
+                    id=f"amiBuildDigestLambda-{self.stack_tag}"
+                )
+            ]
+        )
+        digest.add_permission(
+            f"ami-share-notification-digest-rule-permission-{self.stack_tag}",
+            principal=iam.ServicePrincipal("events.amazonaws.com"),
+            source_arn=digest_rule.attr_arn
+        )
+
+        return notification_queue
+
+    def get_aws_component(self, name: str) -> dict:
+        """Latest version of the AWS managed Image Builder component name, as a recipe component."""
+        return {
+            "componentArn": core.Arn.format(components=core.ArnComponents(
+                service="imagebuilder",
+                resource="component",
+                resource_name=f"{name}/x.x.x",
+                account="aws"
+            ), stack=self)
+        }
+
+    def create_image_recipe(self, name: str, pipeline: PipelineSettings, components: list, parent_image: str,
+                            description: str) -> imagebuilder.CfnImageRecipe:
+        """Create the image recipe name, installing components on parent_image with the volumes of pipeline."""
+        recipe = imagebuilder.CfnImageRecipe(
+            self, name,
+            name=name,
+            version=pipeline.version,
+            components=components,
+            parent_image=parent_image,
+            block_device_mappings=[
+                imagebuilder.CfnImageRecipe.InstanceBlockDeviceMappingProperty(
+                    device_name=block_device.device_name,
+                    ebs=imagebuilder.CfnImageRecipe.EbsInstanceBlockDeviceSpecificationProperty(
+                        delete_on_termination=True,
+                        # Encryption is disabled, because the export VM doesn't support encrypted ebs
+                        encrypted=False,
+                        volume_size=block_device.volume_size,
+                        volume_type=block_device.volume_type,
+                        iops=block_device.iops
+                    )
+                ) for block_device in pipeline.block_devices],
+            description=description,
+            tags={
+                "project": "ec2-imagebuilder-ami-share"
+            },
+            working_directory="/imagebuilder"
+        )
+        # the gp3 throughput is not part of the EbsInstanceBlockDeviceSpecificationProperty of this CDK version
+        for index, block_device in enumerate(pipeline.block_devices):
+            if block_device.throughput is not None:
+                recipe.add_property_override(f"BlockDeviceMappings.{index}.Ebs.Throughput", block_device.throughput)
+        return recipe
+
+    def create_sharded_string_list_parameters(self, construct_id: str, path: str, values: list) -> str:
+        """
+            Create numbered StringList parameters below path, splitting values
+            so that no parameter exceeds the SSM parameter size limit.
+            Returns the path below which the parameters were created.
+        """
+        for index, shard in enumerate(CdkUtils.split_string_list(values)):
+            ssm.StringListParameter(
+                self, f"{construct_id}-{index}",
+                parameter_name=f'{path}/{index:03d}',
+                string_list_value=shard
+            )
+        return path
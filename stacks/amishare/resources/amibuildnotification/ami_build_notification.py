@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+"""
+    ami_build_notification.py:
+    Lambda functions that consume the EC2 Image Builder notifications
+    of the SNS topic from an SQS queue, in batches, and send a periodic
+    digest of the image builds instead of one email per notification.
+
+    lambda_handler de-duplicates the image state transitions of a batch,
+    logs every transition as a structured JSON record and buffers it in
+    the FIFO digest queue, whose deduplication ids drop the transitions
+    that SNS or SQS delivered more than once. Failed records are reported
+    as batch item failures, so that only they are delivered again.
+
+    digest_handler drains the digest queue on a schedule and publishes
+    a single summary of the buffered transitions to the SNS topic.
+"""
+
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from itertools import groupby
+
+
+# boto3 clients are cached at module level so that warm invocations of the
+# lambda function reuse the clients created during the first invocation.
+# boto3 itself is imported when the first client is created, keeping it
+# off the import path of the module.
+_CLIENTS = {}
+
+CLIENT_RETRIES = {
+    'max_attempts': 10,
+    'mode': 'adaptive'
+}
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# Message attribute of the digests published to the SNS topic. The email
+# subscription only receives digests, the queue only the notifications.
+MESSAGE_TYPE_ATTRIBUTE = 'messageType'
+DIGEST_MESSAGE_TYPE = 'digest'
+
+# Maximum number of entries of a SendMessageBatch, ReceiveMessage
+# or DeleteMessageBatch request.
+SQS_BATCH_SIZE = 10
+
+# Image states that are reported as failed builds by the digest.
+FAILED_STATUSES = ('FAILED', 'CANCELLED')
+
+# Maximum length of an SNS subject.
+SNS_SUBJECT_MAX_LENGTH = 100
+
+# Maximum number of messages drained by a single digest, the remaining
+# messages are reported by the next digest.
+DIGEST_MAX_MESSAGES = 5000
+
+
+def get_client(
+        service_name: str,
+        region_name: str = None
+    ):
+    key = (service_name, region_name)
+    if key not in _CLIENTS:
+        import boto3
+        from botocore.config import Config
+        _CLIENTS[key] = boto3.client(service_name, region_name=region_name, config=Config(retries=CLIENT_RETRIES))
+    return _CLIENTS[key]
+
+
+def parse_transition(
+        record: dict
+    ) -> dict:
+    """
+        Return the image state transition of an SQS record holding an Image
+        Builder notification, delivered as raw SNS message, or None when
+        the record holds any other message.
+    """
+    try:
+        image = json.loads(record['body'])
+    except ValueError:
+        return None
+    if not isinstance(image, dict) or 'arn' not in image or 'status' not in image.get('state', {}):
+        return None
+
+    sent_timestamp = int(record.get('attributes', {}).get('SentTimestamp', 0))
+    transition = {
+        'ImageArn': image['arn'],
+        'ImageName': image.get('name', image['arn'].split(':image/', 1)[-1].split('/')[0]),
+        'Version': f"{image.get('version', '')}/{image.get('buildVersion', '')}",
+        'Status': image['state']['status'],
+        'Time': datetime.fromtimestamp(sent_timestamp / 1000, timezone.utc).isoformat(timespec='seconds')
+    }
+    if image['state'].get('reason'):
+        transition['Reason'] = image['state']['reason']
+    return transition
+
+
+def transition_id(
+        transition: dict
+    ) -> str:
+    """Identifies the transition of an image to a state, within the 128 characters of an SQS deduplication id."""
+    return hashlib.sha256(f"{transition['ImageArn']}|{transition['Status']}".encode('utf-8')).hexdigest()
+
+
+def dedupe_transitions(
+        records: list[dict]
+    ) -> tuple:
+    """
+        Return the distinct state transitions of the records, keyed by
+        transition id, with the message ids of the records that carry
+        them, and the message ids of the records that are no transitions.
+    """
+    transitions = {}
+    message_ids = {}
+    ignored = []
+    for record in records:
+        transition = parse_transition(record)
+        if transition is None:
+            ignored.append(record['messageId'])
+            continue
+        key = transition_id(transition)
+        transitions.setdefault(key, transition)
+        message_ids.setdefault(key, []).append(record['messageId'])
+    return transitions, message_ids, ignored
+
+
+def buffer_transitions(
+        sqs,
+        queue_url: str,
+        transitions: dict
+    ) -> list[str]:
+    """
+        Send the transitions, keyed by transition id, to the FIFO digest
+        queue. Returns the ids of the transitions that could not be sent.
+    """
+    keys = list(transitions)
+    failed = []
+    for i in range(0, len(keys), SQS_BATCH_SIZE):
+        batch = keys[i:i + SQS_BATCH_SIZE]
+        response = sqs.send_message_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {
+                    'Id': str(index),
+                    'MessageBody': json.dumps(transitions[key], sort_keys=True),
+                    # every transition is its own group, the digest orders them by time
+                    'MessageGroupId': key,
+                    'MessageDeduplicationId': key
+                }
+                for index, key in enumerate(batch)
+            ]
+        )
+        failed.extend(batch[int(entry['Id'])] for entry in response.get('Failed', []))
+    return failed
+
+
+def lambda_handler(event, context):
+    transitions, message_ids, ignored = dedupe_transitions(event['Records'])
+    for message_id in ignored:
+        logger.warning(f"Ignoring message {message_id}, not an image state notification")
+    for transition in transitions.values():
+        logger.info(json.dumps({'ImageStateTransition': transition}, sort_keys=True))
+
+    failed = buffer_transitions(get_client('sqs'), os.environ['DIGEST_QUEUE_URL'], transitions)
+    output = {
+        'Records': len(event['Records']),
+        'Transitions': len(transitions),
+        'Failed': len(failed)
+    }
+    logger.info(f"Output: {json.dumps(output)}")
+
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': message_id} for key in failed for message_id in message_ids[key]
+        ]
+    }
+
+
+def drain_queue(
+        sqs,
+        queue_url: str,
+        visibility_timeout: int,
+        max_messages: int = DIGEST_MAX_MESSAGES
+    ) -> list[dict]:
+    """
+        Receive the messages of the queue, up to max_messages, hiding them
+        for visibility_timeout seconds until they are deleted.
+    """
+    messages = []
+    while len(messages) < max_messages:
+        received = sqs.receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=SQS_BATCH_SIZE,
+            VisibilityTimeout=visibility_timeout,
+            WaitTimeSeconds=1
+        ).get('Messages', [])
+        if not received:
+            break
+        messages.extend(received)
+    return messages
+
+
+def delete_messages(
+        sqs,
+        queue_url: str,
+        messages: list[dict]
+    ) -> None:
+    for i in range(0, len(messages), SQS_BATCH_SIZE):
+        response = sqs.delete_message_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {'Id': str(index), 'ReceiptHandle': message['ReceiptHandle']}
+                for index, message in enumerate(messages[i:i + SQS_BATCH_SIZE])
+            ]
+        )
+        # the undeleted messages are delivered again, and reported by the next digest
+        for entry in response.get('Failed', []):
+            logger.warning(f"Could not delete digest message: {entry.get('Message', entry['Code'])}")
+
+
+def build_digest(
+        transitions: list[dict]
+    ) -> tuple:
+    """Return the subject and the message of the digest of the transitions."""
+    transitions = sorted(transitions, key=lambda transition: (transition['ImageName'], transition['Time'], transition['Version']))
+    failed = sum(transition['Status'] in FAILED_STATUSES for transition in transitions)
+    subject = f"AMI builds: {len(transitions) - failed} completed, {failed} failed"
+
+    lines = [f"{subject}, since {min(transition['Time'] for transition in transitions)}"]
+    for image_name, image_transitions in groupby(transitions, key=lambda transition: transition['ImageName']):
+        lines.extend(['', image_name])
+        for transition in image_transitions:
+            line = f"  {transition['Time']}  {transition['Version']}  {transition['Status']}"
+            if transition.get('Reason'):
+                line += f": {transition['Reason']}"
+            lines.append(line)
+    return subject[:SNS_SUBJECT_MAX_LENGTH], '\n'.join(lines) + '\n'
+
+
+def digest_handler(event, context):
+    sqs = get_client('sqs')
+    queue_url = os.environ['DIGEST_QUEUE_URL']
+    messages = drain_queue(sqs, queue_url, int(os.environ.get('DIGEST_VISIBILITY_TIMEOUT', 900)))
+
+    # transitions buffered again after the deduplication interval of the queue are reported once
+    transitions = list({
+        transition_id(transition): transition for transition in (json.loads(message['Body']) for message in messages)
+    }.values())
+    if not transitions:
+        logger.info("No image state transitions since the last digest")
+        return {'Published': False, 'Transitions': 0}
+
+    subject, message = build_digest(transitions)
+    get_client('sns').publish(
+        TopicArn=os.environ['SNS_TOPIC_ARN'],
+        Subject=subject,
+        Message=message,
+        MessageAttributes={
+            MESSAGE_TYPE_ATTRIBUTE: {'DataType': 'String', 'StringValue': DIGEST_MESSAGE_TYPE}
+        }
+    )
+    delete_messages(sqs, queue_url, messages)
+
+    output = {'Published': True, 'Transitions': len(transitions), 'Messages': len(messages)}
+    logger.info(f"Output: {json.dumps(output)}")
+    return output
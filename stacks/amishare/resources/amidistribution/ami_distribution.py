@@ -13,34 +13,176 @@
     to set the AMI distribution settings which are currently missing from 
     CloudFormation - specifically the targetAccountIds attribute
     https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/imagebuilder.html
+
+    lambda_handler is invoked by the CDK custom resource provider framework,
+    which sends the CloudFormation response. direct_handler is the entry point
+    of a direct Lambda-backed custom resource: it sends the response to the
+    pre-signed ResponseURL itself, as cfnresponse does, saving the provider
+    framework function and its invocation.
+    https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/crpg-ref-responses.html
+
+    A single custom resource configures many distribution configurations:
+    its DistributionTargets property lists them, each with its own regions
+    and account lists, and they are updated in parallel.
 """
 
 
 import json
 import logging
 import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # imported as part of the stacks package (unit tests)
+    from . import distribution_planner
+except ImportError:
+    # imported from the root of the lambda deployment package
+    import distribution_planner
+
+
+# boto3 clients are cached at module level so that warm invocations of the
+# lambda function reuse the clients created during the first invocation.
+# boto3 itself is imported when the first client is created, keeping it
+# off the import path of the module.
+_CLIENTS = {}
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# GetParameters accepts at most 10 parameter names per request.
+SSM_GET_PARAMETERS_MAX_NAMES = 10
+
+# The ResourceProperties keys whose values are SSM parameter names.
+SSM_PARAMETER_PROPERTIES = ['PublishingAccountIds', 'SharingAccountIds']
+
+# Custom resource response statuses.
+SUCCESS = 'SUCCESS'
+FAILED = 'FAILED'
+
+# Seconds before the function times out at which a direct custom resource
+# reports a failure, so that CloudFormation does not wait for the response
+# until the custom resource times out.
+RESPONSE_TIMEOUT_MARGIN_SECONDS = 1
+
+RESPONSE_TIMEOUT_SECONDS = 10
+
+# Number of distribution targets updated at the same time, unless
+# overridden by the MAX_WORKERS environment variable.
+DEFAULT_MAX_WORKERS = 8
+
+# Distribution target statuses reported in the custom resource Data.
+TARGET_UPDATED = 'UPDATED'
+TARGET_UNCHANGED = 'UNCHANGED'
+
+
+def get_client(
+        service_name: str,
+        region_name: str = None
+    ):
+    key = (service_name, region_name)
+    if key not in _CLIENTS:
+        import boto3
+        _CLIENTS[key] = boto3.client(service_name, region_name=region_name)
+    return _CLIENTS[key]
+
+
+def get_ssm_parameters(
+        ssm_param_names: list[str],
+        aws_ssm_region: str
+    ) -> dict:
+    ssm = get_client('ssm', aws_ssm_region)
+    # remove duplicates while preserving order
+    names = list(dict.fromkeys(ssm_param_names))
+    parameters = {}
+
+    for i in range(0, len(names), SSM_GET_PARAMETERS_MAX_NAMES):
+        response = ssm.get_parameters(Names=names[i:i + SSM_GET_PARAMETERS_MAX_NAMES], WithDecryption=False)
+        if response.get('InvalidParameters'):
+            raise ValueError(f"SSM parameters not found: {', '.join(response['InvalidParameters'])}")
+        for parameter in response['Parameters']:
+            parameters[parameter['Name']] = parameter
 
-import boto3
-import botocore
+    return parameters
 
 
-def get_ssm_parameter(
-        ssm_param_name: str, 
+def get_ssm_parameters_by_path(
+        ssm_param_path: str,
         aws_ssm_region: str
+    ) -> dict:
+    ssm = get_client('ssm', aws_ssm_region)
+    paginator = ssm.get_paginator('get_parameters_by_path')
+    parameters = {}
+
+    for page in paginator.paginate(Path=ssm_param_path, Recursive=True, WithDecryption=False):
+        for parameter in page['Parameters']:
+            parameters[parameter['Name']] = parameter
+
+    return parameters
+
+
+def join_parameter_shards(
+        parameters: dict,
+        ssm_param_name: str
     ) -> str:
-    ssm = boto3.client('ssm', region_name=aws_ssm_region)
-    parameter = ssm.get_parameter(Name=ssm_param_name, WithDecryption=False)
-    return parameter['Parameter']
+    """
+        Rebuild a StringList value that may have been split across
+        numbered parameters below ssm_param_name.
+    """
+    shards = [
+        parameters[name]['Value'] for name in sorted(parameters)
+        if name == ssm_param_name or name.startswith(f"{ssm_param_name}/")
+    ]
+    if not shards:
+        raise ValueError(f"SSM parameter not found: {ssm_param_name}")
+    return ",".join(shards)
+
+
+def load_resource_parameters(
+        props: dict,
+        aws_ssm_region: str
+    ) -> dict:
+    """
+        Fetch every SSM parameter named in the custom resource properties
+        and return the parameter values keyed by resource property name.
+        When the properties supply an AccountIdsPath the parameters are
+        loaded, including any shards, with a paginated GetParametersByPath
+        walk, otherwise with a single GetParameters request.
+    """
+    param_names = {prop: props[prop] for prop in SSM_PARAMETER_PROPERTIES if prop in props}
+    if 'AccountIdsPath' in props:
+        parameters = get_ssm_parameters_by_path(props['AccountIdsPath'], aws_ssm_region)
+    else:
+        parameters = get_ssm_parameters(list(param_names.values()), aws_ssm_region)
+    return {prop: join_parameter_shards(parameters, name) for prop, name in param_names.items()}
 
 
 def get_distributions_configurations(
         aws_distribution_regions: list[str],
         ami_distribution_name: str,
         publishing_account_ids: list[str],
-        sharing_account_ids: list[str]
+        sharing_account_ids: list[str],
+        organization_arns: list[str] = None,
+        organizational_unit_arns: list[str] = None,
+        fast_launch_configurations: dict = None
     ) -> list[dict]:
+    """
+        Render the distribution of every region. fast_launch_configurations
+        holds the Windows Fast Launch settings of the regions that use it,
+        keyed by region, with TargetResourceCount and MaxParallelLaunches.
+    """
 
     distribution_configs = []
+    publishing_account_ids = sorted(set(publishing_account_ids))
+    sharing_account_ids = sorted(set(sharing_account_ids))
+    launch_permission = {
+        'userIds': sharing_account_ids,
+        'organizationArns': sorted(set(organization_arns or [])),
+        'organizationalUnitArns': sorted(set(organizational_unit_arns or []))
+    }
+    # empty lists are omitted as the API requires at least one entry
+    launch_permission = {key: values for key, values in launch_permission.items() if values}
 
     for aws_region in aws_distribution_regions:
         distribution_config = {
@@ -48,67 +190,284 @@ def get_distributions_configurations(
             'amiDistributionConfiguration': {
                 'name': ami_distribution_name,
                 'description': f'AMI Distribution configuration for {ami_distribution_name}',
-                'targetAccountIds': publishing_account_ids,
                 'amiTags': {
-                    'PublishTargets': ",".join(publishing_account_ids),
-                    'SharingTargets': ",".join(sharing_account_ids)
-                },
-                'launchPermission': {
-                    'userIds': sharing_account_ids
+                    **distribution_planner.split_tag_values(distribution_planner.PUBLISH_TARGETS_TAG, publishing_account_ids),
+                    **distribution_planner.split_tag_values(distribution_planner.SHARING_TARGETS_TAG, sharing_account_ids)
                 }
             }
         }
+        if publishing_account_ids:
+            distribution_config['amiDistributionConfiguration']['targetAccountIds'] = publishing_account_ids
+        if launch_permission:
+            distribution_config['amiDistributionConfiguration']['launchPermission'] = launch_permission
+        fast_launch = (fast_launch_configurations or {}).get(aws_region)
+        if fast_launch:
+            # custom resource properties are passed as strings
+            distribution_config['fastLaunchConfigurations'] = [{
+                'enabled': True,
+                'snapshotConfiguration': {'targetResourceCount': int(fast_launch['TargetResourceCount'])},
+                'maxParallelLaunches': int(fast_launch['MaxParallelLaunches'])
+            }]
 
         distribution_configs.append(distribution_config)
 
     return distribution_configs
 
 
+def canonicalize(value):
+    """
+        Return a canonical form of a distribution configuration value so that
+        two configurations can be compared regardless of ordering.
+        Dictionary keys are sorted, empty values are dropped and lists
+        (regions, account ids, tags) are sorted and de-duplicated.
+    """
+    if isinstance(value, dict):
+        return {
+            key: canonicalize(value[key]) for key in sorted(value)
+            if value[key] not in (None, '', [], {})
+        }
+    if isinstance(value, (list, tuple)):
+        items = {json.dumps(item, sort_keys=True): item for item in map(canonicalize, value)}
+        return [items[key] for key in sorted(items)]
+    return value
+
+
+def get_current_distribution_configuration(
+        ami_distribution_arn: str
+    ) -> dict:
+    client = get_client('imagebuilder')
+    response = client.get_distribution_configuration(distributionConfigurationArn=ami_distribution_arn)
+    return response['distributionConfiguration']
+
+
+def update_distribution_configuration(
+        ami_distribution_arn: str,
+        description: str,
+        distributions: list[dict]
+    ) -> bool:
+    """
+        Update the distribution configuration only when the rendered
+        distributions differ from the deployed ones.
+        Returns True if UpdateDistributionConfiguration was called.
+    """
+    current = get_current_distribution_configuration(ami_distribution_arn)
+    if canonicalize({'description': current.get('description'), 'distributions': current.get('distributions', [])}) == \
+            canonicalize({'description': description, 'distributions': distributions}):
+        return False
+
+    client = get_client('imagebuilder')
+    client.update_distribution_configuration(
+        distributionConfigurationArn=ami_distribution_arn,
+        description=description,
+        distributions=distributions
+    )
+    return True
+
+
+def get_distribution_targets(
+        props: dict
+    ) -> list[dict]:
+    """
+        Return the distribution targets of the custom resource properties:
+        the DistributionTargets list, or the properties themselves for a
+        custom resource of a single distribution configuration.
+    """
+    return props.get('DistributionTargets', [props])
+
+
+def parameter_source(
+        target: dict
+    ) -> tuple:
+    """Identifies the SSM parameters that hold the account lists of a target."""
+    return tuple(target.get(prop) for prop in ['AccountIdsPath', *SSM_PARAMETER_PROPERTIES])
+
+
+def update_target(
+        target: dict,
+        parameters: dict,
+        request_type: str
+    ) -> bool:
+    """
+        Update the distribution configuration of a target with its chunk of
+        the account lists in parameters. Returns True if it was updated.
+    """
+    distribution_index = int(target.get('DistributionIndex', 0))
+    distribution_count = int(target.get('DistributionCount', 1))
+
+    # planned with the reserved tags of the stack, so that both agree on the distribution count
+    account_chunks = distribution_planner.plan_account_chunks(
+        publishing_account_ids=parameters['PublishingAccountIds'].split(","),
+        sharing_account_ids=parameters['SharingAccountIds'].split(","),
+        reserved_tags=int(target.get('ReservedTags', 0))
+    )
+    if len(account_chunks) != distribution_count and request_type != 'Delete':
+        raise ValueError(
+            f"The account lists require {len(account_chunks)} distribution configurations "
+            f"but the stack defines {distribution_count}, redeploy the stack to update the pipelines"
+        )
+    account_chunk = account_chunks[min(distribution_index, len(account_chunks) - 1)]
+    publishing_account_ids = account_chunk['publishingAccountIds']
+    sharing_account_ids = account_chunk['sharingAccountIds']
+    organization_arns = account_chunk['organizationArns']
+    organizational_unit_arns = account_chunk['organizationalUnitArns']
+
+    logger.info(publishing_account_ids)
+    logger.info(sharing_account_ids)
+    logger.info(organization_arns)
+    logger.info(organizational_unit_arns)
+
+    if request_type == 'Delete':
+        return False
+    return update_distribution_configuration(
+        ami_distribution_arn=target['AmiDistributionArn'],
+        description=f"AMI Distribution settings for: {target['ImageBuilderName']}",
+        distributions=get_distributions_configurations(
+            aws_distribution_regions=target['AwsDistributionRegions'],
+            ami_distribution_name=target['AmiDistributionName'],
+            publishing_account_ids=publishing_account_ids,
+            sharing_account_ids=sharing_account_ids,
+            organization_arns=organization_arns,
+            organizational_unit_arns=organizational_unit_arns,
+            fast_launch_configurations=target.get('FastLaunchConfigurations')
+        )
+    )
+
+
+def update_distribution_targets(
+        targets: list[dict],
+        request_type: str,
+        aws_region: str,
+        max_workers: int = DEFAULT_MAX_WORKERS
+    ) -> list[dict]:
+    """
+        Update the distribution configurations of the targets, at most
+        max_workers at a time. Returns the result of every target, in
+        order, with its Status and either its DistributionUpdated flag
+        or the Reason it failed.
+    """
+    # clients are created up front as client creation is not thread safe
+    get_client('ssm', aws_region)
+    if request_type != 'Delete':
+        get_client('imagebuilder')
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # the targets of a pipeline share its account lists, which are loaded once
+        parameter_futures = {}
+        for target in targets:
+            if parameter_source(target) not in parameter_futures:
+                parameter_futures[parameter_source(target)] = executor.submit(load_resource_parameters, target, aws_region)
+
+        # the parameter loads are queued ahead of the updates waiting for them
+        def update(target: dict) -> bool:
+            return update_target(target, parameter_futures[parameter_source(target)].result(), request_type)
+
+        update_futures = [executor.submit(update, target) for target in targets]
+
+    results = []
+    for target, future in zip(targets, update_futures):
+        result = {'AmiDistributionArn': target['AmiDistributionArn']}
+        try:
+            result.update(Status=SUCCESS, DistributionUpdated=future.result())
+        except Exception as err:
+            result.update(Status=FAILED, Reason=f"{type(err).__name__}: {err}")
+        results.append(result)
+    return results
+
+
 def lambda_handler(event, context):
-    # set logging
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    
     # print the event details
-    logger.debug(json.dumps(event, indent=2))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps(event))
 
     props = event['ResourceProperties']
     cdk_stack_name = props['CdkStackName']
-    aws_region = os.environ['AWS_REGION']
-    aws_distribution_regions = props['AwsDistributionRegions']
-    imagebuiler_name = props['ImageBuilderName']
-    ami_distribution_name = props['AmiDistributionName']
-    ami_distribution_arn = props['AmiDistributionArn']
-    ssm_publishing_account_ids_param_name = props['PublishingAccountIds']
-    ssm_sharing_account_ids_param_name = props['SharingAccountIds']
+    targets = get_distribution_targets(props)
 
-    publishing_account_ids = get_ssm_parameter(ssm_publishing_account_ids_param_name, aws_region)['Value'].split(",")
-    sharing_account_ids = get_ssm_parameter(ssm_sharing_account_ids_param_name, aws_region)['Value'].split(",")
+    results = update_distribution_targets(
+        targets,
+        event['RequestType'],
+        os.environ['AWS_REGION'],
+        int(os.environ.get('MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    )
+    for result in results:
+        logger.info(json.dumps({'DistributionTarget': result}))
 
-    logger.info(publishing_account_ids)
-    logger.info(sharing_account_ids)
+    # CloudFormation drops the Data of a failed response, the failed targets are reported in its reason
+    failed = [result for result in results if result['Status'] == FAILED]
+    if failed:
+        raise ValueError(
+            f"{len(failed)} of {len(results)} distribution configurations failed to update: " +
+            "; ".join(f"{result['AmiDistributionArn']}: {result['Reason']}" for result in failed)
+        )
 
-    if event['RequestType'] != 'Delete':
-        try:
-            client = boto3.client('imagebuilder')
-            client.update_distribution_configuration(
-                distributionConfigurationArn=ami_distribution_arn,
-                description=f"AMI Distribution settings for: {imagebuiler_name}",
-                distributions=get_distributions_configurations(
-                    aws_distribution_regions=aws_distribution_regions,
-                    ami_distribution_name=ami_distribution_name,
-                    publishing_account_ids=publishing_account_ids,
-                    sharing_account_ids=sharing_account_ids
-                )
-            )
-        except botocore.exceptions.ClientError as err:
-            raise err
+    # Data is limited to 4096 bytes, so the targets are keyed by their position
+    data = {
+        f"Target{index}": TARGET_UPDATED if result['DistributionUpdated'] else TARGET_UNCHANGED
+        for index, result in enumerate(results)
+    }
+    data['DistributionUpdated'] = str(any(result['DistributionUpdated'] for result in results)).lower()
+    if 'AmiDistributionArn' in props:
+        data['AmiDistributionArn'] = props['AmiDistributionArn']
 
     output = {
         'PhysicalResourceId': f"ami-distribution-id-{cdk_stack_name}",
-        'Data': {
-            'AmiDistributionArn': ami_distribution_arn
-        }
+        'Data': data
     }
     logger.info(f"Output: {json.dumps(output)}")
     return output
+
+
+def send_response(
+        event: dict,
+        context,
+        status: str,
+        data: dict = None,
+        physical_resource_id: str = None,
+        reason: str = None
+    ) -> None:
+    """Upload the custom resource response of event to its pre-signed ResponseURL."""
+    body = json.dumps({
+        'Status': status,
+        'Reason': reason or f"See the details in CloudWatch Log Stream: {context.log_stream_name}",
+        'PhysicalResourceId': physical_resource_id or event.get('PhysicalResourceId') or context.log_stream_name,
+        'StackId': event['StackId'],
+        'RequestId': event['RequestId'],
+        'LogicalResourceId': event['LogicalResourceId'],
+        'NoEcho': False,
+        'Data': data or {}
+    }).encode('utf-8')
+    # the pre-signed URL is signed without a content type
+    request = urllib.request.Request(
+        event['ResponseURL'], data=body, method='PUT', headers={'Content-Type': '', 'Content-Length': str(len(body))}
+    )
+    with urllib.request.urlopen(request, timeout=RESPONSE_TIMEOUT_SECONDS) as response:
+        logger.info(f"Sent {status} response, status code {response.status}")
+
+
+def direct_handler(event, context):
+    """
+        Handle the event like lambda_handler and send the CloudFormation
+        response, failing the custom resource when the handler raises or
+        is about to time out. Exactly one response is sent.
+    """
+    responded = threading.Lock()
+
+    def respond(status: str, **kwargs) -> None:
+        if responded.acquire(blocking=False):
+            send_response(event, context, status, **kwargs)
+
+    timer = threading.Timer(
+        max(context.get_remaining_time_in_millis() / 1000 - RESPONSE_TIMEOUT_MARGIN_SECONDS, 0),
+        respond, args=(FAILED,), kwargs={'reason': 'The ami distribution custom resource timed out'}
+    )
+    timer.daemon = True
+    timer.start()
+    try:
+        output = lambda_handler(event, context)
+    except Exception as err:
+        logger.exception("Failed to handle the custom resource event")
+        respond(FAILED, reason=f"{type(err).__name__}: {err}")
+    else:
+        respond(SUCCESS, data=output['Data'], physical_resource_id=output['PhysicalResourceId'])
+    finally:
+        timer.cancel()
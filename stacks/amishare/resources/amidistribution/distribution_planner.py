@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""
+    distribution_planner.py:
+    Plans how the AMI publishing and sharing account lists are spread
+    across EC2 Image Builder distribution configurations so that every
+    generated distribution stays within the service limits.
+
+    The module has no third party dependencies so that it can be used
+    both by the ami distribution lambda function and, at synth time,
+    by the CDK stack that creates the distribution configurations.
+    https://docs.aws.amazon.com/imagebuilder/latest/APIReference/API_AmiDistributionConfiguration.html
+    https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/Using_Tags.html#tag-restrictions
+"""
+
+
+import re
+
+
+# EC2 Image Builder AmiDistributionConfiguration limits
+MAX_TARGET_ACCOUNT_IDS = 1536
+MAX_LAUNCH_PERMISSION_USER_IDS = 1536
+
+MAX_ORGANIZATION_ARNS = 25
+MAX_ORGANIZATIONAL_UNIT_ARNS = 25
+
+# EC2 tag limits
+MAX_AMI_TAGS = 50
+MAX_TAG_VALUE_LENGTH = 256
+
+# Tags EC2 Image Builder adds to the AMIs it distributes: CreatedBy and Ec2ImageBuilderArn
+IMAGE_BUILDER_AMI_TAGS = 2
+# Tags left free for the tags that are added to the AMIs after their distribution
+AMI_TAG_HEADROOM = 4
+
+PUBLISH_TARGETS_TAG = 'PublishTargets'
+SHARING_TARGETS_TAG = 'SharingTargets'
+
+ACCOUNT_ID_LENGTH = 12
+
+# arn:aws:organizations::111111111111:organization/o-exampleorgid
+ORGANIZATION_ARN_PATTERN = re.compile(r'^arn:aws[a-z-]*:organizations::\d{12}:organization/o-[a-z0-9]{10,32}$')
+# arn:aws:organizations::111111111111:ou/o-exampleorgid/ou-exampleouid
+ORGANIZATIONAL_UNIT_ARN_PATTERN = re.compile(r'^arn:aws[a-z-]*:organizations::\d{12}:ou/o-[a-z0-9]{10,32}/ou-[0-9a-z]{4,32}-[a-z0-9]{8,32}$')
+
+
+def split_sharing_principals(
+        sharing_ids: list
+    ) -> dict:
+    """
+        Separate a sharing list that mixes account ids, AWS Organization
+        ARNs and organizational unit (OU) ARNs into the three launch
+        permission lists. Values are sorted and de-duplicated.
+    """
+    principals = {
+        'userIds': set(),
+        'organizationArns': set(),
+        'organizationalUnitArns': set()
+    }
+    for value in filter(None, sharing_ids):
+        if ORGANIZATION_ARN_PATTERN.match(value):
+            principals['organizationArns'].add(value)
+        elif ORGANIZATIONAL_UNIT_ARN_PATTERN.match(value):
+            principals['organizationalUnitArns'].add(value)
+        elif value.startswith('arn:'):
+            raise ValueError(f"Unsupported sharing ARN, expected an organization or OU ARN: {value}")
+        else:
+            principals['userIds'].add(value)
+
+    if len(principals['organizationArns']) > MAX_ORGANIZATION_ARNS:
+        raise ValueError(f"At most {MAX_ORGANIZATION_ARNS} organization ARNs can be shared with")
+    if len(principals['organizationalUnitArns']) > MAX_ORGANIZATIONAL_UNIT_ARNS:
+        raise ValueError(f"At most {MAX_ORGANIZATIONAL_UNIT_ARNS} organizational unit ARNs can be shared with")
+
+    return {key: sorted(values) for key, values in principals.items()}
+
+
+def split_tag_values(
+        tag_key: str,
+        values: list,
+        max_length: int = MAX_TAG_VALUE_LENGTH
+    ) -> dict:
+    """
+        Join values into comma separated tag values of at most max_length
+        characters. The first tag uses tag_key, any further tags are
+        numbered: PublishTargets, PublishTargets2, PublishTargets3, ...
+    """
+    tags = {}
+    tag_value = ''
+
+    for value in values:
+        candidate = f"{tag_value},{value}" if tag_value else value
+        if len(candidate) > max_length and tag_value:
+            tags[tag_key if not tags else f"{tag_key}{len(tags) + 1}"] = tag_value
+            candidate = value
+        if len(candidate) > max_length:
+            raise ValueError(f"Tag value exceeds the maximum length of {max_length} characters: {value}")
+        tag_value = candidate
+
+    if tag_value or not tags:
+        tags[tag_key if not tags else f"{tag_key}{len(tags) + 1}"] = tag_value
+    return tags
+
+
+def reserved_ami_tags(
+        ami_tags: dict
+    ) -> int:
+    """
+        The number of AMI tags that are not available to the account lists
+        of a distribution that sets ami_tags: those tags, the tags added by
+        EC2 Image Builder and the headroom.
+    """
+    return len(ami_tags) + IMAGE_BUILDER_AMI_TAGS + AMI_TAG_HEADROOM
+
+
+def accounts_per_distribution(
+        max_accounts: int,
+        account_id_length: int = ACCOUNT_ID_LENGTH,
+        reserved_tags: int = 0
+    ) -> int:
+    """
+        The number of accounts of one list that fit into a single
+        distribution, given that each of the two account lists may
+        use half of the remaining AMI tags.
+    """
+    tag_slots = (MAX_AMI_TAGS - reserved_tags) // 2
+    accounts_per_tag = (MAX_TAG_VALUE_LENGTH + 1) // (account_id_length + 1)
+    return max(1, min(max_accounts, tag_slots * accounts_per_tag))
+
+
+def plan_account_chunks(
+        publishing_account_ids: list,
+        sharing_account_ids: list,
+        reserved_tags: int = 0
+    ) -> list:
+    """
+        Split the publishing and sharing account lists into the smallest
+        number of evenly sized chunks that each fit into one distribution
+        configuration. Account ids are sorted and de-duplicated so that
+        the plan is deterministic. Organization and OU ARNs in the sharing
+        list do not count towards the chunk size and are shared with
+        in every chunk.
+    """
+    publishing_account_ids = sorted(set(filter(None, publishing_account_ids)))
+    sharing_principals = split_sharing_principals(sharing_account_ids)
+    sharing_account_ids = sharing_principals['userIds']
+    account_id_length = max(map(len, publishing_account_ids + sharing_account_ids), default=ACCOUNT_ID_LENGTH)
+
+    publishing_capacity = accounts_per_distribution(MAX_TARGET_ACCOUNT_IDS, account_id_length, reserved_tags)
+    sharing_capacity = accounts_per_distribution(MAX_LAUNCH_PERMISSION_USER_IDS, account_id_length, reserved_tags)
+    chunk_count = max(
+        1,
+        -(-len(publishing_account_ids) // publishing_capacity),
+        -(-len(sharing_account_ids) // sharing_capacity)
+    )
+
+    def chunk(values: list, index: int) -> list:
+        return values[index * len(values) // chunk_count:(index + 1) * len(values) // chunk_count]
+
+    return [
+        {
+            'publishingAccountIds': chunk(publishing_account_ids, index),
+            'sharingAccountIds': chunk(sharing_account_ids, index),
+            'organizationArns': sharing_principals['organizationArns'],
+            'organizationalUnitArns': sharing_principals['organizationalUnitArns']
+        }
+        for index in range(chunk_count)
+    ]
@@ -0,0 +1,537 @@
+#!/usr/bin/env python
+
+"""
+    ami_launch_permission.py:
+    Lambda function that reacts to EC2 Image Builder image state
+    change events and shares the distributed AMIs, together with
+    their EBS snapshots, with the AMI sharing accounts.
+
+    Every distributed region and every batch of sharing accounts is
+    handled as an independent unit of work on a bounded thread pool.
+    The boto3 clients use the adaptive retry mode so that throttled
+    requests are retried with backoff and client side rate limiting.
+    https://boto3.amazonaws.com/v1/documentation/api/latest/guide/retries.html
+
+    Once shared, the launches of the new AMIs are accelerated: fast
+    snapshot restore is enabled for their snapshots in the configured
+    availability zones, and fast snapshot restore and Windows Fast
+    Launch are disabled for the previous AMIs of the same pipeline.
+
+    Finally the AMI id, version and build date of the new image are
+    written to the latest AMI parameters of the pipeline in every
+    distributed region, so that consumers resolve the latest AMI with
+    a single GetParameter instead of a DescribeImages scan.
+"""
+
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+# boto3 clients are cached at module level so that warm invocations of the
+# lambda function reuse the clients created during the first invocation.
+# boto3 itself is imported when the first client is created, keeping it
+# off the import path of the module.
+_CLIENTS = {}
+
+CLIENT_RETRIES = {
+    'max_attempts': 10,
+    'mode': 'adaptive'
+}
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# Image state that triggers the sharing of the distributed AMIs.
+IMAGE_AVAILABLE_STATUS = 'AVAILABLE'
+
+# Number of sharing accounts added by a single ModifyImageAttribute
+# or ModifySnapshotAttribute request.
+ACCOUNT_BATCH_SIZE = 100
+
+DEFAULT_MAX_WORKERS = 16
+
+# Fast snapshot restore states in which the restores are, or will be, billed.
+FAST_SNAPSHOT_RESTORE_ACTIVE_STATES = ['enabling', 'optimizing', 'enabled']
+
+# Maximum number of values of a single DescribeImages filter.
+DESCRIBE_IMAGES_FILTER_MAX_VALUES = 200
+
+# Fast Launch states of images that still have pre-provisioned snapshots.
+FAST_LAUNCH_ACTIVE_STATES = ['enabling', 'enabling-failed', 'enabled', 'enabled-failed']
+
+# Session name of the sharing account role that writes the latest AMI parameters.
+LATEST_AMI_ROLE_SESSION_NAME = 'ami-share-latest-ami-parameters'
+
+
+def get_client(
+        service_name: str,
+        region_name: str = None
+    ):
+    key = (service_name, region_name)
+    if key not in _CLIENTS:
+        import boto3
+        from botocore.config import Config
+        _CLIENTS[key] = boto3.client(service_name, region_name=region_name, config=Config(retries=CLIENT_RETRIES))
+    return _CLIENTS[key]
+
+
+def get_sharing_ids(
+        ssm_param_path: str,
+        aws_ssm_region: str
+    ) -> list[str]:
+    """
+        Rebuild the sharing account ids, organization ARNs and OU ARNs
+        from the numbered StringList parameters stored below ssm_param_path.
+    """
+    ssm = get_client('ssm', aws_ssm_region)
+    paginator = ssm.get_paginator('get_parameters_by_path')
+    account_ids = set()
+
+    for page in paginator.paginate(Path=ssm_param_path, Recursive=True, WithDecryption=False):
+        for parameter in page['Parameters']:
+            account_ids.update(filter(None, parameter['Value'].split(",")))
+
+    return sorted(account_ids)
+
+
+def get_image_name(
+        image_arn: str
+    ) -> str:
+    """
+        Return the image (recipe) name of the image ARN
+        arn:aws:imagebuilder:<region>:<account>:image/<name>/<version>/<build>
+    """
+    return image_arn.split(':image/', 1)[-1].split('/')[0]
+
+
+def get_sharing_ids_path(
+        image_arn: str,
+        sharing_ids_paths: dict
+    ) -> str:
+    """
+        Select the SSM path of the sharing ids of the pipeline that built
+        the image, by the image name of the image ARN.
+    """
+    image_name = get_image_name(image_arn)
+    if image_name not in sharing_ids_paths:
+        raise ValueError(f"No sharing account ids configured for image {image_name}")
+    return sharing_ids_paths[image_name]
+
+
+def launch_permission(
+        sharing_id: str
+    ) -> dict:
+    """
+        Return the ModifyImageAttribute launch permission for an
+        account id, an organization ARN or an organizational unit ARN.
+    """
+    if sharing_id.startswith('arn:'):
+        if ':organization/' in sharing_id:
+            return {'OrganizationArn': sharing_id}
+        if ':ou/' in sharing_id:
+            return {'OrganizationalUnitArn': sharing_id}
+        raise ValueError(f"Unsupported sharing ARN, expected an organization or OU ARN: {sharing_id}")
+    return {'UserId': sharing_id}
+
+
+def get_image(
+        image_arn: str
+    ) -> dict:
+    client = get_client('imagebuilder')
+    return client.get_image(imageBuildVersionArn=image_arn)['image']
+
+
+def get_distributed_amis(
+        image: dict
+    ) -> dict:
+    """
+        Return the AMI ids, keyed by region, that Image Builder
+        distributed into the account that owns the image.
+    """
+    image_account_id = image['arn'].split(":")[4]
+    amis = {}
+    for ami in image.get('outputResources', {}).get('amis', []):
+        if ami.get('accountId', image_account_id) == image_account_id:
+            amis[ami['region']] = ami['image']
+    return amis
+
+
+def get_previous_amis(
+        image: dict
+    ) -> dict:
+    """
+        Return the AMI ids, keyed by region, of the images that the
+        pipeline of image built before it.
+    """
+    previous_amis = {}
+    if 'sourcePipelineArn' not in image:
+        return previous_amis
+
+    client = get_client('imagebuilder')
+    paginator = client.get_paginator('list_image_pipeline_images')
+    for page in paginator.paginate(imagePipelineArn=image['sourcePipelineArn']):
+        for summary in page['imageSummaryList']:
+            if summary['arn'] == image['arn'] or summary.get('state', {}).get('status') != IMAGE_AVAILABLE_STATUS:
+                continue
+            for region, ami_id in get_distributed_amis(summary).items():
+                previous_amis.setdefault(region, []).append(ami_id)
+    return previous_amis
+
+
+def get_snapshot_ids(
+        ec2,
+        ami_id: str
+    ) -> list[str]:
+    images = ec2.describe_images(ImageIds=[ami_id])['Images']
+    return [
+        mapping['Ebs']['SnapshotId']
+        for image in images
+        for mapping in image.get('BlockDeviceMappings', [])
+        if 'SnapshotId' in mapping.get('Ebs', {})
+    ]
+
+
+def get_owned_snapshot_ids(
+        ec2,
+        ami_ids: list[str]
+    ) -> dict:
+    """
+        Return the snapshot ids of the AMIs, keyed by AMI id, skipping AMIs
+        that have been deregistered in the meantime.
+    """
+    snapshot_ids = {}
+    for i in range(0, len(ami_ids), DESCRIBE_IMAGES_FILTER_MAX_VALUES):
+        images = ec2.describe_images(
+            Owners=['self'],
+            Filters=[{'Name': 'image-id', 'Values': ami_ids[i:i + DESCRIBE_IMAGES_FILTER_MAX_VALUES]}]
+        )['Images']
+        for image in images:
+            snapshot_ids[image['ImageId']] = [
+                mapping['Ebs']['SnapshotId']
+                for mapping in image.get('BlockDeviceMappings', [])
+                if 'SnapshotId' in mapping.get('Ebs', {})
+            ]
+    return snapshot_ids
+
+
+def share_ami(
+        ec2,
+        ami_id: str,
+        snapshot_ids: list[str],
+        sharing_ids: list[str]
+    ) -> None:
+    ec2.modify_image_attribute(
+        ImageId=ami_id,
+        LaunchPermission={
+            'Add': [launch_permission(sharing_id) for sharing_id in sharing_ids]
+        }
+    )
+    # snapshot create volume permissions can only be granted to accounts,
+    # organizations and OUs can launch the AMI without them
+    account_ids = [sharing_id for sharing_id in sharing_ids if 'UserId' in launch_permission(sharing_id)]
+    if not account_ids:
+        return
+    for snapshot_id in snapshot_ids:
+        ec2.modify_snapshot_attribute(
+            SnapshotId=snapshot_id,
+            Attribute='createVolumePermission',
+            OperationType='add',
+            UserIds=account_ids
+        )
+
+
+def share_amis(
+        amis: dict,
+        sharing_ids: list[str],
+        max_workers: int = DEFAULT_MAX_WORKERS
+    ) -> list[dict]:
+    """
+        Share the AMIs, keyed by region, with the account ids,
+        organization ARNs and organizational unit ARNs.
+        Returns a list describing every failed unit of work.
+    """
+    from botocore.exceptions import ClientError
+
+    # clients are created up front as client creation is not thread safe
+    ec2_clients = {region: get_client('ec2', region) for region in amis}
+    # organizations and OUs are shared with in a single unit of work
+    organization_ids = [sharing_id for sharing_id in sharing_ids if sharing_id.startswith('arn:')]
+    account_ids = [sharing_id for sharing_id in sharing_ids if not sharing_id.startswith('arn:')]
+    account_batches = [
+        account_ids[i:i + ACCOUNT_BATCH_SIZE]
+        for i in range(0, len(account_ids), ACCOUNT_BATCH_SIZE)
+    ]
+    if organization_ids:
+        account_batches.append(organization_ids)
+    failures = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        snapshot_futures = {
+            region: executor.submit(get_snapshot_ids, ec2_clients[region], ami_id)
+            for region, ami_id in amis.items()
+        }
+
+        share_futures = {}
+        for region, future in snapshot_futures.items():
+            try:
+                snapshot_ids = future.result()
+            except ClientError as err:
+                failures.append({'Region': region, 'ImageId': amis[region], 'Error': str(err)})
+                continue
+            for batch in account_batches:
+                share_futures[executor.submit(share_ami, ec2_clients[region], amis[region], snapshot_ids, batch)] = (region, batch)
+
+        for future, (region, batch) in share_futures.items():
+            try:
+                future.result()
+            except ClientError as err:
+                failures.append({'Region': region, 'ImageId': amis[region], 'SharingIds': batch, 'Error': str(err)})
+
+    return failures
+
+
+def accelerate_ami(
+        ec2,
+        ami_id: str,
+        previous_ami_ids: list[str],
+        zones: list[str]
+    ) -> None:
+    """
+        Enable fast snapshot restore for the snapshots of ami_id in zones
+        only, and disable fast snapshot restore and Fast Launch for the
+        previous AMIs, whose launches no longer need to be accelerated.
+    """
+    snapshot_ids = get_snapshot_ids(ec2, ami_id)
+    previous_snapshots = get_owned_snapshot_ids(ec2, previous_ami_ids) if previous_ami_ids else {}
+    previous_snapshot_ids = [snapshot_id for ids in previous_snapshots.values() for snapshot_id in ids]
+
+    active = set()
+    if snapshot_ids or previous_snapshot_ids:
+        paginator = ec2.get_paginator('describe_fast_snapshot_restores')
+        for page in paginator.paginate(Filters=[
+            {'Name': 'snapshot-id', 'Values': snapshot_ids + previous_snapshot_ids},
+            {'Name': 'state', 'Values': FAST_SNAPSHOT_RESTORE_ACTIVE_STATES}
+        ]):
+            for restore in page['FastSnapshotRestores']:
+                active.add((restore['SnapshotId'], restore['AvailabilityZone']))
+
+    wanted = {(snapshot_id, zone) for snapshot_id in snapshot_ids for zone in zones}
+    stale = active - wanted
+    for zone in sorted({zone for _, zone in stale}):
+        ec2.disable_fast_snapshot_restores(
+            AvailabilityZones=[zone],
+            SourceSnapshotIds=sorted(snapshot_id for snapshot_id, stale_zone in stale if stale_zone == zone)
+        )
+    missing = wanted - active
+    if missing:
+        ec2.enable_fast_snapshot_restores(
+            AvailabilityZones=sorted({zone for _, zone in missing}),
+            SourceSnapshotIds=sorted({snapshot_id for snapshot_id, _ in missing})
+        )
+
+    # the previous AMIs that are still registered
+    if previous_snapshots:
+        paginator = ec2.get_paginator('describe_fast_launch_images')
+        for page in paginator.paginate(ImageIds=sorted(previous_snapshots)):
+            for fast_launch_image in page['FastLaunchImages']:
+                if fast_launch_image['State'] in FAST_LAUNCH_ACTIVE_STATES:
+                    ec2.disable_fast_launch(ImageId=fast_launch_image['ImageId'])
+
+
+def accelerate_amis(
+        amis: dict,
+        previous_amis: dict,
+        fast_snapshot_restore_zones: dict,
+        max_workers: int = DEFAULT_MAX_WORKERS
+    ) -> list[dict]:
+    """
+        Accelerate the launches of the AMIs, keyed by region, with the fast
+        snapshot restore availability zones of every region, cleaning up
+        the acceleration of the previous AMIs. Returns a list describing
+        every failed region.
+    """
+    from botocore.exceptions import ClientError
+
+    # clients are created up front as client creation is not thread safe
+    ec2_clients = {region: get_client('ec2', region) for region in amis}
+    failures = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                accelerate_ami, ec2_clients[region], ami_id,
+                previous_amis.get(region, []), fast_snapshot_restore_zones.get(region, [])
+            ): region
+            for region, ami_id in amis.items()
+        }
+        for future, region in futures.items():
+            try:
+                future.result()
+            except ClientError as err:
+                failures.append({'Region': region, 'ImageId': amis[region], 'Error': str(err)})
+
+    return failures
+
+
+def get_image_version(
+        image_arn: str
+    ) -> str:
+    """Return the <version>/<build> of the image ARN."""
+    return '/'.join(image_arn.split(':image/', 1)[-1].split('/')[1:3])
+
+
+def put_latest_ami_parameters(
+        ssm,
+        parameter_path: str,
+        ami_id: str,
+        version: str,
+        build_date: str
+    ) -> None:
+    # the aws:ec2:image data type lets EC2 launches and CloudFormation resolve the parameter as an AMI id
+    ssm.put_parameter(Name=f'{parameter_path}/ami-id', Value=ami_id, Type='String', DataType='aws:ec2:image', Overwrite=True)
+    ssm.put_parameter(Name=f'{parameter_path}/version', Value=version, Type='String', Overwrite=True)
+    ssm.put_parameter(Name=f'{parameter_path}/build-date', Value=build_date, Type='String', Overwrite=True)
+
+
+def role_session(
+        credentials: dict
+    ):
+    import boto3
+    return boto3.session.Session(
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken']
+    )
+
+
+def put_sharing_account_parameters(
+        sts,
+        account_id: str,
+        role_name: str,
+        amis: dict,
+        parameter_path: str,
+        version: str,
+        build_date: str
+    ) -> None:
+    """
+        Write the latest AMI parameters of the shared AMIs, keyed by region,
+        into a sharing account, with the credentials of its role_name role.
+    """
+    from botocore.config import Config
+
+    credentials = sts.assume_role(
+        RoleArn=f'arn:aws:iam::{account_id}:role/{role_name}',
+        RoleSessionName=LATEST_AMI_ROLE_SESSION_NAME
+    )['Credentials']
+    # every unit of work uses its own session, sessions are not thread safe
+    session = role_session(credentials)
+    for region, ami_id in amis.items():
+        ssm = session.client('ssm', region_name=region, config=Config(retries=CLIENT_RETRIES))
+        put_latest_ami_parameters(ssm, parameter_path, ami_id, version, build_date)
+
+
+def publish_latest_amis(
+        amis: dict,
+        parameter_path: str,
+        version: str,
+        build_date: str,
+        sharing_account_ids: list[str] = (),
+        role_name: str = None,
+        max_workers: int = DEFAULT_MAX_WORKERS
+    ) -> list[dict]:
+    """
+        Write the latest AMI parameters below parameter_path for the AMIs,
+        keyed by region, and, with a role_name, into every sharing account.
+        Returns a list describing every failed unit of work.
+    """
+    from botocore.exceptions import ClientError
+
+    # clients are created up front as client creation is not thread safe
+    ssm_clients = {region: get_client('ssm', region) for region in amis}
+    sts = get_client('sts', os.environ.get('AWS_REGION')) if role_name and sharing_account_ids else None
+    failures = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        region_futures = {
+            executor.submit(put_latest_ami_parameters, ssm_clients[region], parameter_path, ami_id, version, build_date): region
+            for region, ami_id in amis.items()
+        }
+        account_futures = {
+            executor.submit(
+                put_sharing_account_parameters, sts, account_id, role_name, amis, parameter_path, version, build_date
+            ): account_id
+            for account_id in (sharing_account_ids if sts else [])
+        }
+
+        for future, region in region_futures.items():
+            try:
+                future.result()
+            except ClientError as err:
+                failures.append({'Region': region, 'ImageId': amis[region], 'ParameterPath': parameter_path, 'Error': str(err)})
+        for future, account_id in account_futures.items():
+            try:
+                future.result()
+            except ClientError as err:
+                failures.append({'AccountId': account_id, 'ParameterPath': parameter_path, 'Error': str(err)})
+
+    return failures
+
+
+def lambda_handler(event, context):
+    status = event['detail']['state']['status']
+    if status != IMAGE_AVAILABLE_STATUS:
+        logger.info(f"Ignoring image state: {status}")
+        return {'Shared': False}
+
+    image_arn = event['resources'][0]
+    aws_region = os.environ['AWS_REGION']
+    max_workers = int(os.environ.get('MAX_WORKERS', DEFAULT_MAX_WORKERS))
+
+    sharing_ids_path = get_sharing_ids_path(image_arn, json.loads(os.environ['SHARING_ACCOUNT_IDS_PATHS']))
+    sharing_ids = get_sharing_ids(sharing_ids_path, aws_region)
+    image = get_image(image_arn)
+    amis = get_distributed_amis(image)
+    failures = share_amis(amis, sharing_ids, max_workers)
+
+    # {image recipe name: {region: [availability zones]}}, without the recipes that use no fast snapshot restore
+    fast_snapshot_restore_zones = json.loads(os.environ.get('FAST_SNAPSHOT_RESTORE_ZONES', '{}')).get(get_image_name(image_arn), {})
+    # [image recipe name], of the recipes that use Fast Launch in a region
+    fast_launch_image_names = json.loads(os.environ.get('FAST_LAUNCH_IMAGE_NAMES', '[]'))
+    # pipelines that accelerate no launches make none of the acceleration API calls
+    if fast_snapshot_restore_zones or get_image_name(image_arn) in fast_launch_image_names:
+        failures += accelerate_amis(amis, get_previous_amis(image), fast_snapshot_restore_zones, max_workers)
+
+    # {image recipe name: parameter path}, empty without latest AMI parameters
+    parameter_path = json.loads(os.environ.get('LATEST_AMI_PARAMETER_PATHS', '{}')).get(get_image_name(image_arn))
+    if parameter_path and not image.get('dateCreated'):
+        # SSM rejects empty parameter values, the parameters keep pointing at the previous image
+        logger.warning(f"Not publishing the latest AMI parameters of {image_arn}, the image has no build date")
+        parameter_path = None
+    if parameter_path:
+        failures += publish_latest_amis(
+            amis,
+            parameter_path,
+            get_image_version(image_arn),
+            image['dateCreated'],
+            # the role can only be assumed in accounts, not in organizations and OUs
+            [sharing_id for sharing_id in sharing_ids if not sharing_id.startswith('arn:')],
+            os.environ.get('LATEST_AMI_SHARING_ACCOUNT_ROLE_NAME'),
+            max_workers
+        )
+
+    output = {
+        'Shared': not failures,
+        'ImageArn': image_arn,
+        'Regions': sorted(amis),
+        'SharingIdCount': len(sharing_ids),
+        'LatestAmiParameterPath': parameter_path,
+        'Failures': failures
+    }
+    logger.info(f"Output: {json.dumps(output)}")
+
+    if failures:
+        raise RuntimeError(f"Failed to share {image_arn} in {len(failures)} unit(s) of work")
+    return output
@@ -0,0 +1,169 @@
+import json
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+from stacks.amishare.resources.amibuildnotification import ami_build_notification
+
+AWS_REGION = 'eu-west-1'
+DIGEST_QUEUE_URL = 'https://sqs.eu-west-1.amazonaws.com/111111111111/digest.fifo'
+SNS_TOPIC_ARN = 'arn:aws:sns:eu-west-1:111111111111:ami-share-imagebuilder-topic-test'
+IMAGE_ARN = 'arn:aws:imagebuilder:eu-west-1:111111111111:image/ami-share-image-recipe-test/1.0.0/{build}'
+
+
+def notification(message_id, build, status, reason=None, sent_timestamp=1636403472000):
+    """An SQS record of the raw SNS message that Image Builder publishes for an image."""
+    state = {'status': status}
+    if reason:
+        state['reason'] = reason
+    return {
+        'messageId': message_id,
+        'body': json.dumps({
+            'arn': IMAGE_ARN.format(build=build),
+            'name': 'ami-share-image-recipe-test',
+            'version': '1.0.0',
+            'buildVersion': build,
+            'state': state
+        }),
+        'attributes': {'SentTimestamp': str(sent_timestamp)}
+    }
+
+
+def transition(build, status, time='2021-11-08T20:31:12+00:00', **fields):
+    return {
+        'ImageArn': IMAGE_ARN.format(build=build),
+        'ImageName': 'ami-share-image-recipe-test',
+        'Version': f'1.0.0/{build}',
+        'Status': status,
+        'Time': time,
+        **fields
+    }
+
+
+@pytest.fixture()
+def clients(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('DIGEST_QUEUE_URL', DIGEST_QUEUE_URL)
+    monkeypatch.setenv('SNS_TOPIC_ARN', SNS_TOPIC_ARN)
+    monkeypatch.setattr(ami_build_notification, '_CLIENTS', {})
+    clients = {}
+    for service_name in ('sqs', 'sns'):
+        clients[service_name] = boto3.client(service_name, region_name=AWS_REGION)
+        ami_build_notification._CLIENTS[(service_name, None)] = clients[service_name]
+    return clients
+
+
+class TestConsumer:
+
+    def test_duplicate_transitions_buffered_once(self, clients):
+        records = [
+            notification('m1', 1, 'AVAILABLE'),
+            # delivered again by SNS
+            notification('m2', 1, 'AVAILABLE'),
+            notification('m3', 2, 'FAILED', reason='Component failed'),
+            {'messageId': 'm4', 'body': 'not json'}
+        ]
+        expected = [transition(1, 'AVAILABLE'), transition(2, 'FAILED', Reason='Component failed')]
+
+        with Stubber(clients['sqs']) as stubber:
+            stubber.add_response('send_message_batch', {'Successful': [], 'Failed': []}, {
+                'QueueUrl': DIGEST_QUEUE_URL,
+                'Entries': [
+                    {
+                        'Id': str(index),
+                        'MessageBody': json.dumps(expected_transition, sort_keys=True),
+                        'MessageGroupId': ami_build_notification.transition_id(expected_transition),
+                        'MessageDeduplicationId': ami_build_notification.transition_id(expected_transition)
+                    }
+                    for index, expected_transition in enumerate(expected)
+                ]
+            })
+
+            result = ami_build_notification.lambda_handler({'Records': records}, None)
+            stubber.assert_no_pending_responses()
+
+        assert result == {'batchItemFailures': []}
+
+    def test_unsent_transitions_reported_as_batch_item_failures(self, clients):
+        records = [notification('m1', 1, 'AVAILABLE'), notification('m2', 2, 'AVAILABLE'), notification('m3', 1, 'AVAILABLE')]
+
+        with Stubber(clients['sqs']) as stubber:
+            stubber.add_response('send_message_batch', {
+                'Successful': [{'Id': '1', 'MessageId': 'd2', 'MD5OfMessageBody': 'md5'}],
+                'Failed': [{'Id': '0', 'SenderFault': False, 'Code': 'InternalError'}]
+            }, {'QueueUrl': DIGEST_QUEUE_URL, 'Entries': ANY})
+
+            result = ami_build_notification.lambda_handler({'Records': records}, None)
+
+        # every record that carries the unsent transition is delivered again
+        assert result == {'batchItemFailures': [{'itemIdentifier': 'm1'}, {'itemIdentifier': 'm3'}]}
+
+    def test_requests_scale_with_batch_size(self, clients):
+        records = [notification(f'm{build}', build, 'AVAILABLE') for build in range(1, 26)]
+
+        with Stubber(clients['sqs']) as stubber:
+            for _ in range(3):
+                stubber.add_response('send_message_batch', {'Successful': [], 'Failed': []}, {'QueueUrl': DIGEST_QUEUE_URL, 'Entries': ANY})
+
+            ami_build_notification.lambda_handler({'Records': records}, None)
+            stubber.assert_no_pending_responses()
+
+
+class TestDigest:
+
+    @staticmethod
+    def message(index, body):
+        return {'MessageId': f'd{index}', 'ReceiptHandle': f'r{index}', 'Body': json.dumps(body)}
+
+    def test_digest_groups_transitions_by_image(self):
+        subject, message = ami_build_notification.build_digest([
+            transition(2, 'FAILED', time='2021-11-08T21:00:00+00:00', Reason='Component failed'),
+            transition(1, 'AVAILABLE'),
+            dict(transition(1, 'AVAILABLE'), ImageName='ami-share-image-recipe-test-al2-arm64')
+        ])
+
+        assert subject == 'AMI builds: 2 completed, 1 failed'
+        assert message == (
+            'AMI builds: 2 completed, 1 failed, since 2021-11-08T20:31:12+00:00\n'
+            '\n'
+            'ami-share-image-recipe-test\n'
+            '  2021-11-08T20:31:12+00:00  1.0.0/1  AVAILABLE\n'
+            '  2021-11-08T21:00:00+00:00  1.0.0/2  FAILED: Component failed\n'
+            '\n'
+            'ami-share-image-recipe-test-al2-arm64\n'
+            '  2021-11-08T20:31:12+00:00  1.0.0/1  AVAILABLE\n'
+        )
+
+    def test_buffered_transitions_published_once_and_deleted(self, clients):
+        messages = [self.message(index, transition(index % 2, 'AVAILABLE')) for index in range(12)]
+        receive_params = {'QueueUrl': DIGEST_QUEUE_URL, 'MaxNumberOfMessages': 10, 'VisibilityTimeout': 900, 'WaitTimeSeconds': 1}
+
+        with Stubber(clients['sqs']) as sqs_stubber, Stubber(clients['sns']) as sns_stubber:
+            sqs_stubber.add_response('receive_message', {'Messages': messages[:10]}, receive_params)
+            sqs_stubber.add_response('receive_message', {'Messages': messages[10:]}, receive_params)
+            sqs_stubber.add_response('receive_message', {}, receive_params)
+            sns_stubber.add_response('publish', {'MessageId': 'p1'}, {
+                'TopicArn': SNS_TOPIC_ARN,
+                'Subject': 'AMI builds: 2 completed, 0 failed',
+                'Message': ANY,
+                'MessageAttributes': {'messageType': {'DataType': 'String', 'StringValue': 'digest'}}
+            })
+            for batch in (messages[:10], messages[10:]):
+                sqs_stubber.add_response('delete_message_batch', {'Successful': [], 'Failed': []}, {
+                    'QueueUrl': DIGEST_QUEUE_URL,
+                    'Entries': [{'Id': str(index), 'ReceiptHandle': message['ReceiptHandle']} for index, message in enumerate(batch)]
+                })
+
+            result = ami_build_notification.digest_handler({}, None)
+            sqs_stubber.assert_no_pending_responses()
+            sns_stubber.assert_no_pending_responses()
+
+        assert result == {'Published': True, 'Transitions': 2, 'Messages': 12}
+
+    def test_no_digest_without_transitions(self, clients):
+        with Stubber(clients['sqs']) as sqs_stubber, Stubber(clients['sns']):
+            sqs_stubber.add_response('receive_message', {}, None)
+
+            assert ami_build_notification.digest_handler({}, None) == {'Published': False, 'Transitions': 0}
@@ -0,0 +1,500 @@
+import threading
+import time
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import ANY, Stubber
+
+from stacks.amishare.resources.amidistribution import ami_distribution
+from tests.utils.cfn_response import LambdaContext, ResponseServer, custom_resource_event
+from utils.CdkUtils import CdkUtils, SSM_PARAMETER_MAX_LENGTH
+
+AWS_REGION = 'eu-west-1'
+PUBLISHING_PARAM = '/test-AmiSharing/AmiPublishingTargetIds'
+SHARING_PARAM = '/test-AmiSharing/AmiSharingAccountIds'
+DISTRIBUTION_ARN = 'arn:aws:imagebuilder:eu-west-1:111111111111:distribution-configuration/ami-share-distribution-config-test'
+
+
+def create_event(request_type='Create', **props):
+    resource_properties = {
+        'CdkStackName': 'test',
+        'AwsDistributionRegions': ['eu-west-1', 'eu-central-1'],
+        'ImageBuilderName': 'AmiDistributionConfig-test',
+        'AmiDistributionName': 'AmiShare-test-{{ imagebuilder:buildDate }}',
+        'AmiDistributionArn': DISTRIBUTION_ARN,
+        'PublishingAccountIds': PUBLISHING_PARAM,
+        'SharingAccountIds': SHARING_PARAM
+    }
+    resource_properties.update(props)
+    return {
+        'RequestType': request_type,
+        'ResourceProperties': resource_properties
+    }
+
+
+def ssm_parameter(name, value):
+    return {
+        'Name': name,
+        'Type': 'StringList',
+        'Value': value,
+        'Version': 1
+    }
+
+
+def distribution_configuration(distributions, description='AMI Distribution settings for: AmiDistributionConfig-test'):
+    return {
+        'distributionConfiguration': {
+            'arn': DISTRIBUTION_ARN,
+            'name': 'ami-share-distribution-config-test',
+            'description': description,
+            'distributions': distributions,
+            'timeoutMinutes': 360
+        }
+    }
+
+
+class ApiCallCounter:
+    """
+        Counts the API calls made by a boto3 client.
+    """
+
+    def __init__(self, client):
+        self.calls = []
+        client.meta.events.register('before-call.*.*', self._record)
+
+    def _record(self, model, **kwargs):
+        self.calls.append(model.name)
+
+
+@pytest.fixture()
+def aws_environment(monkeypatch):
+    monkeypatch.setenv('AWS_REGION', AWS_REGION)
+    monkeypatch.setenv('AWS_DEFAULT_REGION', AWS_REGION)
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setattr(ami_distribution, '_CLIENTS', {})
+
+
+@pytest.fixture()
+def ssm_client(aws_environment):
+    client = boto3.client('ssm', region_name=AWS_REGION)
+    ami_distribution._CLIENTS[('ssm', AWS_REGION)] = client
+    return client
+
+
+@pytest.fixture()
+def imagebuilder_client(aws_environment):
+    client = boto3.client('imagebuilder', region_name=AWS_REGION)
+    ami_distribution._CLIENTS[('imagebuilder', None)] = client
+    return client
+
+
+class TestLoadResourceParameters:
+
+    def test_account_lists_fetched_in_single_call(self, ssm_client, imagebuilder_client):
+        counter = ApiCallCounter(ssm_client)
+
+        with Stubber(ssm_client) as ssm_stubber, Stubber(imagebuilder_client) as imagebuilder_stubber:
+            ssm_stubber.add_response(
+                'get_parameters',
+                {
+                    'Parameters': [
+                        ssm_parameter(PUBLISHING_PARAM, '222222222222,333333333333'),
+                        ssm_parameter(SHARING_PARAM, '444444444444')
+                    ]
+                },
+                {'Names': [PUBLISHING_PARAM, SHARING_PARAM], 'WithDecryption': False}
+            )
+            imagebuilder_stubber.add_response(
+                'get_distribution_configuration',
+                distribution_configuration([])
+            )
+            imagebuilder_stubber.add_response(
+                'update_distribution_configuration',
+                {'distributionConfigurationArn': DISTRIBUTION_ARN},
+                {
+                    'distributionConfigurationArn': DISTRIBUTION_ARN,
+                    'description': ANY,
+                    'distributions': ANY
+                }
+            )
+
+            output = ami_distribution.lambda_handler(create_event(), None)
+
+            ssm_stubber.assert_no_pending_responses()
+            imagebuilder_stubber.assert_no_pending_responses()
+
+        assert counter.calls == ['GetParameters']
+        assert output['Data']['AmiDistributionArn'] == DISTRIBUTION_ARN
+
+    def test_clients_reused_across_invocations(self, ssm_client):
+        with Stubber(ssm_client) as ssm_stubber:
+            for _ in range(2):
+                ssm_stubber.add_response(
+                    'get_parameters',
+                    {
+                        'Parameters': [
+                            ssm_parameter(PUBLISHING_PARAM, '222222222222'),
+                            ssm_parameter(SHARING_PARAM, '444444444444')
+                        ]
+                    }
+                )
+                ami_distribution.lambda_handler(create_event(request_type='Delete'), None)
+
+            ssm_stubber.assert_no_pending_responses()
+
+        assert list(ami_distribution._CLIENTS) == [('ssm', AWS_REGION)]
+        assert ami_distribution.get_client('ssm', AWS_REGION) is ssm_client
+
+    def test_missing_parameter_raises(self, ssm_client):
+        with Stubber(ssm_client) as ssm_stubber:
+            ssm_stubber.add_response(
+                'get_parameters',
+                {
+                    'Parameters': [ssm_parameter(PUBLISHING_PARAM, '222222222222')],
+                    'InvalidParameters': [SHARING_PARAM]
+                }
+            )
+            with pytest.raises(ValueError):
+                ami_distribution.load_resource_parameters(create_event()['ResourceProperties'], AWS_REGION)
+
+
+class TestDiffAwareDistributionUpdate:
+
+    def render(self, regions, publishing_account_ids, sharing_account_ids):
+        return ami_distribution.get_distributions_configurations(
+            aws_distribution_regions=regions,
+            ami_distribution_name='AmiShare-test-{{ imagebuilder:buildDate }}',
+            publishing_account_ids=publishing_account_ids,
+            sharing_account_ids=sharing_account_ids
+        )
+
+    def stub_parameters(self, ssm_stubber, publishing, sharing):
+        ssm_stubber.add_response(
+            'get_parameters',
+            {
+                'Parameters': [
+                    ssm_parameter(PUBLISHING_PARAM, publishing),
+                    ssm_parameter(SHARING_PARAM, sharing)
+                ]
+            }
+        )
+
+    def test_canonical_form_ignores_ordering_and_duplicates(self):
+        deployed = self.render(['eu-central-1', 'eu-west-1'], ['333333333333', '222222222222'], ['444444444444'])
+        deployed.reverse()
+        deployed[0]['amiDistributionConfiguration']['targetAccountIds'] = ['333333333333', '222222222222', '333333333333']
+        rendered = self.render(['eu-west-1', 'eu-central-1'], ['222222222222', '333333333333'], ['444444444444', '444444444444'])
+
+        assert ami_distribution.canonicalize(deployed) == ami_distribution.canonicalize(rendered)
+
+    def test_unchanged_configuration_skips_update(self, ssm_client, imagebuilder_client):
+        counter = ApiCallCounter(imagebuilder_client)
+        deployed = self.render(['eu-central-1', 'eu-west-1'], ['333333333333', '222222222222'], ['444444444444'])
+
+        with Stubber(ssm_client) as ssm_stubber, Stubber(imagebuilder_client) as imagebuilder_stubber:
+            self.stub_parameters(ssm_stubber, '222222222222,333333333333', '444444444444')
+            imagebuilder_stubber.add_response('get_distribution_configuration', distribution_configuration(deployed))
+
+            output = ami_distribution.lambda_handler(create_event(request_type='Update'), None)
+
+            imagebuilder_stubber.assert_no_pending_responses()
+
+        assert counter.calls == ['GetDistributionConfiguration']
+        assert output['Data']['DistributionUpdated'] == 'false'
+
+    def test_changed_configuration_is_written(self, ssm_client, imagebuilder_client):
+        counter = ApiCallCounter(imagebuilder_client)
+        deployed = self.render(['eu-west-1', 'eu-central-1'], ['222222222222'], ['444444444444'])
+
+        with Stubber(ssm_client) as ssm_stubber, Stubber(imagebuilder_client) as imagebuilder_stubber:
+            self.stub_parameters(ssm_stubber, '222222222222,333333333333', '444444444444')
+            imagebuilder_stubber.add_response('get_distribution_configuration', distribution_configuration(deployed))
+            imagebuilder_stubber.add_response(
+                'update_distribution_configuration',
+                {'distributionConfigurationArn': DISTRIBUTION_ARN}
+            )
+
+            output = ami_distribution.lambda_handler(create_event(request_type='Update'), None)
+
+            imagebuilder_stubber.assert_no_pending_responses()
+
+        assert counter.calls == ['GetDistributionConfiguration', 'UpdateDistributionConfiguration']
+        assert output['Data']['DistributionUpdated'] == 'true'
+
+
+class TestFastLaunch:
+
+    render = TestDiffAwareDistributionUpdate.render
+    stub_parameters = TestDiffAwareDistributionUpdate.stub_parameters
+
+    FAST_LAUNCH = {'eu-west-1': {'TargetResourceCount': '5', 'MaxParallelLaunches': '10'}}
+
+    def test_fast_launch_rendered_for_configured_regions(self):
+        distributions = ami_distribution.get_distributions_configurations(
+            aws_distribution_regions=['eu-west-1', 'eu-central-1'],
+            ami_distribution_name='AmiShare-test-{{ imagebuilder:buildDate }}',
+            publishing_account_ids=['222222222222'],
+            sharing_account_ids=['444444444444'],
+            fast_launch_configurations=self.FAST_LAUNCH
+        )
+
+        assert distributions[0]['fastLaunchConfigurations'] == [{
+            'enabled': True,
+            'snapshotConfiguration': {'targetResourceCount': 5},
+            'maxParallelLaunches': 10
+        }]
+        assert 'fastLaunchConfigurations' not in distributions[1]
+
+    def test_removed_fast_launch_is_cleaned_up(self, ssm_client, imagebuilder_client):
+        deployed = self.render(['eu-west-1', 'eu-central-1'], ['222222222222'], ['444444444444'])
+        deployed[0]['fastLaunchConfigurations'] = [{
+            'enabled': True, 'snapshotConfiguration': {'targetResourceCount': 5}, 'maxParallelLaunches': 10
+        }]
+
+        with Stubber(ssm_client) as ssm_stubber, Stubber(imagebuilder_client) as imagebuilder_stubber:
+            self.stub_parameters(ssm_stubber, '222222222222', '444444444444')
+            imagebuilder_stubber.add_response('get_distribution_configuration', distribution_configuration(deployed))
+            imagebuilder_stubber.add_response(
+                'update_distribution_configuration',
+                {'distributionConfigurationArn': DISTRIBUTION_ARN},
+                {
+                    'distributionConfigurationArn': DISTRIBUTION_ARN,
+                    'description': 'AMI Distribution settings for: AmiDistributionConfig-test',
+                    'distributions': self.render(['eu-west-1', 'eu-central-1'], ['222222222222'], ['444444444444'])
+                }
+            )
+
+            output = ami_distribution.lambda_handler(create_event(request_type='Update'), None)
+
+            imagebuilder_stubber.assert_no_pending_responses()
+
+        assert output['Data']['DistributionUpdated'] == 'true'
+
+
+class TestDirectCustomResource:
+
+    render = TestDiffAwareDistributionUpdate.render
+    stub_parameters = TestDiffAwareDistributionUpdate.stub_parameters
+
+    @staticmethod
+    def direct_event(server, request_type='Create'):
+        return custom_resource_event(server.url, create_event(request_type=request_type)['ResourceProperties'], request_type)
+
+    def test_success_response_sent(self, ssm_client, imagebuilder_client):
+        deployed = self.render(['eu-west-1', 'eu-central-1'], ['222222222222'], ['444444444444'])
+
+        with ResponseServer() as server, Stubber(ssm_client) as ssm_stubber, Stubber(imagebuilder_client) as imagebuilder_stubber:
+            self.stub_parameters(ssm_stubber, '222222222222', '444444444444')
+            imagebuilder_stubber.add_response('get_distribution_configuration', distribution_configuration(deployed))
+
+            ami_distribution.direct_handler(self.direct_event(server), LambdaContext())
+            _, content_type, response = server.wait_for_response()
+
+        assert content_type == ''
+        assert response == {
+            'Status': 'SUCCESS',
+            'Reason': 'See the details in CloudWatch Log Stream: 2021/11/08/[$LATEST]0123456789abcdef',
+            'PhysicalResourceId': 'ami-distribution-id-test',
+            'StackId': 'arn:aws:cloudformation:us-east-1:111111111111:stack/AmiShare-test/00000000-0000-0000-0000-000000000000',
+            'RequestId': '11111111-1111-1111-1111-111111111111',
+            'LogicalResourceId': 'AmiDistributionDirectCustomResource',
+            'NoEcho': False,
+            'Data': {'AmiDistributionArn': DISTRIBUTION_ARN, 'DistributionUpdated': 'false', 'Target0': 'UNCHANGED'}
+        }
+
+    def test_failure_response_sent(self, ssm_client, imagebuilder_client):
+        with ResponseServer() as server, Stubber(ssm_client) as ssm_stubber:
+            ssm_stubber.add_response('get_parameters', {'Parameters': [], 'InvalidParameters': [PUBLISHING_PARAM]})
+
+            ami_distribution.direct_handler(self.direct_event(server), LambdaContext())
+            _, _, response = server.wait_for_response()
+
+        assert response['Status'] == 'FAILED'
+        assert response['Reason'] == (
+            f"ValueError: 1 of 1 distribution configurations failed to update: "
+            f"{DISTRIBUTION_ARN}: ValueError: SSM parameters not found: {PUBLISHING_PARAM}"
+        )
+
+    def test_single_failure_response_before_timeout(self, monkeypatch):
+        def slow_handler(event, context):
+            time.sleep(0.5)
+            return {'PhysicalResourceId': 'ami-distribution-id-test', 'Data': {}}
+
+        monkeypatch.setattr(ami_distribution, 'lambda_handler', slow_handler)
+        monkeypatch.setattr(ami_distribution, 'RESPONSE_TIMEOUT_MARGIN_SECONDS', 0.9)
+
+        with ResponseServer() as server:
+            ami_distribution.direct_handler(self.direct_event(server), LambdaContext(timeout_seconds=1))
+            _, _, response = server.wait_for_response()
+
+        assert response['Status'] == 'FAILED'
+        assert response['Reason'] == 'The ami distribution custom resource timed out'
+        assert len(server.responses) == 1
+
+
+class FakeImageBuilder:
+    """
+        Image Builder client whose GetDistributionConfiguration takes the
+        latency of the distribution configuration, recording the updates
+        and the largest number of concurrent calls.
+    """
+
+    def __init__(self, latencies, failing=()):
+        self.latencies = latencies
+        self.failing = failing
+        self.updated = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def get_distribution_configuration(self, distributionConfigurationArn):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latencies[distributionConfigurationArn])
+            if distributionConfigurationArn in self.failing:
+                raise ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': 'Not found'}}, 'GetDistributionConfiguration')
+            return distribution_configuration([])
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def update_distribution_configuration(self, distributionConfigurationArn, description, distributions):
+        with self.lock:
+            self.updated.append(distributionConfigurationArn)
+        return {'distributionConfigurationArn': distributionConfigurationArn}
+
+
+class TestDistributionTargets:
+
+    stub_parameters = TestDiffAwareDistributionUpdate.stub_parameters
+
+    LATENCIES = {f'{DISTRIBUTION_ARN}-{index}': 0.2 + index * 0.04 for index in range(6)}
+
+    @staticmethod
+    def targets_event(arns, request_type='Update'):
+        event = create_event(request_type, DistributionTargets=[
+            {
+                'AwsDistributionRegions': ['eu-west-1'],
+                'ImageBuilderName': f'AmiDistributionConfig-test-{index}',
+                'AmiDistributionName': f'AmiShare-test-{index}-{{{{ imagebuilder:buildDate }}}}',
+                'AmiDistributionArn': arn,
+                'PublishingAccountIds': PUBLISHING_PARAM,
+                'SharingAccountIds': SHARING_PARAM
+            }
+            for index, arn in enumerate(arns)
+        ])
+        del event['ResourceProperties']['AmiDistributionArn']
+        return event
+
+    @pytest.fixture()
+    def imagebuilder(self, aws_environment):
+        client = FakeImageBuilder(self.LATENCIES, failing=[f'{DISTRIBUTION_ARN}-2'])
+        ami_distribution._CLIENTS[('imagebuilder', None)] = client
+        return client
+
+    def test_latency_tracks_slowest_target(self, ssm_client, imagebuilder):
+        arns = [arn for arn in self.LATENCIES if arn not in imagebuilder.failing]
+
+        with Stubber(ssm_client) as ssm_stubber:
+            # the targets share their account lists, which are loaded once
+            self.stub_parameters(ssm_stubber, '222222222222', '444444444444')
+
+            start = time.perf_counter()
+            output = ami_distribution.lambda_handler(self.targets_event(arns), None)
+            elapsed = time.perf_counter() - start
+
+            ssm_stubber.assert_no_pending_responses()
+
+        latencies = [self.LATENCIES[arn] for arn in arns]
+        # well below the sum of the latencies, with room for a loaded test host
+        assert max(latencies) <= elapsed < max(latencies) + (sum(latencies) - max(latencies)) / 2
+        assert sorted(imagebuilder.updated) == arns
+        assert output['Data'] == {f'Target{index}': 'UPDATED' for index in range(len(arns))} | {'DistributionUpdated': 'true'}
+
+    def test_concurrency_bounded_by_max_workers(self, ssm_client, imagebuilder, monkeypatch):
+        monkeypatch.setenv('MAX_WORKERS', '2')
+        arns = [arn for arn in self.LATENCIES if arn not in imagebuilder.failing]
+
+        with Stubber(ssm_client) as ssm_stubber:
+            self.stub_parameters(ssm_stubber, '222222222222', '444444444444')
+            ami_distribution.lambda_handler(self.targets_event(arns), None)
+
+        assert imagebuilder.max_active == 2
+        assert sorted(imagebuilder.updated) == arns
+
+    def test_failure_reported_per_target(self, ssm_client, imagebuilder):
+        arns = list(self.LATENCIES)
+
+        with Stubber(ssm_client) as ssm_stubber:
+            self.stub_parameters(ssm_stubber, '222222222222', '444444444444')
+            results = ami_distribution.update_distribution_targets(
+                self.targets_event(arns)['ResourceProperties']['DistributionTargets'], 'Update', AWS_REGION
+            )
+
+        assert [result['Status'] for result in results] == ['SUCCESS', 'SUCCESS', 'FAILED', 'SUCCESS', 'SUCCESS', 'SUCCESS']
+        assert results[2] == {
+            'AmiDistributionArn': f'{DISTRIBUTION_ARN}-2',
+            'Status': 'FAILED',
+            'Reason': 'ClientError: An error occurred (ResourceNotFoundException) when calling the '
+                      'GetDistributionConfiguration operation: Not found'
+        }
+        # the other targets are updated regardless of the failure
+        assert sorted(imagebuilder.updated) == [arn for arn in arns if arn != f'{DISTRIBUTION_ARN}-2']
+
+    def test_failed_targets_fail_the_custom_resource(self, ssm_client, imagebuilder):
+        with Stubber(ssm_client) as ssm_stubber:
+            self.stub_parameters(ssm_stubber, '222222222222', '444444444444')
+            with pytest.raises(ValueError, match=f'^1 of 6 distribution configurations failed to update: {DISTRIBUTION_ARN}-2: ClientError'):
+                ami_distribution.lambda_handler(self.targets_event(list(self.LATENCIES)), None)
+
+
+class TestShardedAccountLists:
+
+    path = '/test-AmiSharing'
+
+    def shard_parameters(self, name, account_ids):
+        return [
+            ssm_parameter(f'{name}/{index:03d}', ','.join(shard))
+            for index, shard in enumerate(CdkUtils.split_string_list(account_ids))
+        ]
+
+    def test_large_account_lists_split_and_rebuilt(self, ssm_client):
+        publishing_account_ids = [f'{i:012d}' for i in range(5000)]
+        sharing_account_ids = [f'{i:012d}' for i in range(5000, 10000)]
+
+        publishing_shards = self.shard_parameters(f'{self.path}/AmiPublishingTargetIds', publishing_account_ids)
+        sharing_shards = self.shard_parameters(f'{self.path}/AmiSharingAccountIds', sharing_account_ids)
+        parameters = publishing_shards + sharing_shards
+
+        assert len(publishing_shards) > 1
+        assert all(len(parameter['Value']) <= SSM_PARAMETER_MAX_LENGTH for parameter in parameters)
+
+        props = create_event(
+            AccountIdsPath=self.path,
+            PublishingAccountIds=f'{self.path}/AmiPublishingTargetIds',
+            SharingAccountIds=f'{self.path}/AmiSharingAccountIds'
+        )['ResourceProperties']
+
+        with Stubber(ssm_client) as ssm_stubber:
+            # GetParametersByPath returns at most 10 parameters per page
+            pages = [parameters[i:i + 10] for i in range(0, len(parameters), 10)]
+            for i, page in enumerate(pages):
+                response = {'Parameters': page}
+                if i < len(pages) - 1:
+                    response['NextToken'] = f'token-{i}'
+                ssm_stubber.add_response('get_parameters_by_path', response)
+
+            loaded = ami_distribution.load_resource_parameters(props, AWS_REGION)
+
+            ssm_stubber.assert_no_pending_responses()
+
+        assert loaded['PublishingAccountIds'].split(',') == publishing_account_ids
+        assert loaded['SharingAccountIds'].split(',') == sharing_account_ids
+
+    def test_oversized_value_rejected(self):
+        with pytest.raises(ValueError):
+            CdkUtils.split_string_list(['x' * 20], max_length=10)
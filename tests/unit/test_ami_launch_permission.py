@@ -0,0 +1,460 @@
+import threading
+import time
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from stacks.amishare.resources.amilaunchpermission import ami_launch_permission
+
+AWS_REGION = 'eu-west-1'
+DISTRIBUTION_REGIONS = ['eu-west-1', 'eu-central-1', 'us-east-1', 'us-west-2']
+SHARING_ACCOUNT_IDS = ['444444444444', '555555555555']
+API_LATENCY = 0.2
+
+
+class ApiCallRecorder:
+    """
+        Records the start and end time of every API call made by the
+        registered boto3 clients and simulates a fixed request latency.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.intervals = []
+
+    def register(self, client):
+        client.meta.events.register_first('before-call.*.*', self._before_call)
+
+    def _before_call(self, model, **kwargs):
+        start = time.monotonic()
+        time.sleep(self.latency)
+        with self.lock:
+            self.intervals.append((model.name, start, time.monotonic()))
+
+    def max_concurrency(self):
+        events = sorted(
+            [(start, 1) for _, start, _ in self.intervals] +
+            [(end, -1) for _, _, end in self.intervals]
+        )
+        current = peak = 0
+        for _, delta in events:
+            current += delta
+            peak = max(peak, current)
+        return peak
+
+
+@pytest.fixture()
+def ec2_clients(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setattr(ami_launch_permission, '_CLIENTS', {})
+
+    clients = {}
+    for region in DISTRIBUTION_REGIONS:
+        clients[region] = boto3.client('ec2', region_name=region)
+        ami_launch_permission._CLIENTS[('ec2', region)] = clients[region]
+    return clients
+
+
+def stub_region(stubber, ami_id, snapshot_id):
+    stubber.add_response(
+        'describe_images',
+        {
+            'Images': [{
+                'ImageId': ami_id,
+                'BlockDeviceMappings': [{'DeviceName': '/dev/xvda', 'Ebs': {'SnapshotId': snapshot_id}}]
+            }]
+        },
+        {'ImageIds': [ami_id]}
+    )
+    stubber.add_response(
+        'modify_image_attribute',
+        {},
+        {
+            'ImageId': ami_id,
+            'LaunchPermission': {'Add': [{'UserId': account_id} for account_id in SHARING_ACCOUNT_IDS]}
+        }
+    )
+    stubber.add_response(
+        'modify_snapshot_attribute',
+        {},
+        {
+            'SnapshotId': snapshot_id,
+            'Attribute': 'createVolumePermission',
+            'OperationType': 'add',
+            'UserIds': SHARING_ACCOUNT_IDS
+        }
+    )
+
+
+class TestShareAmis:
+
+    def test_regions_shared_concurrently(self, ec2_clients):
+        recorder = ApiCallRecorder(API_LATENCY)
+        amis = {region: f'ami-{i:017d}' for i, region in enumerate(DISTRIBUTION_REGIONS)}
+        stubbers = []
+
+        for i, region in enumerate(DISTRIBUTION_REGIONS):
+            recorder.register(ec2_clients[region])
+            stubber = Stubber(ec2_clients[region])
+            stub_region(stubber, amis[region], f'snap-{i:017d}')
+            stubber.activate()
+            stubbers.append(stubber)
+
+        start = time.monotonic()
+        failures = ami_launch_permission.share_amis(amis, SHARING_ACCOUNT_IDS, max_workers=len(DISTRIBUTION_REGIONS))
+        elapsed = time.monotonic() - start
+
+        for stubber in stubbers:
+            stubber.assert_no_pending_responses()
+            stubber.deactivate()
+
+        assert failures == []
+        assert len(recorder.intervals) == 3 * len(DISTRIBUTION_REGIONS)
+        assert recorder.max_concurrency() == len(DISTRIBUTION_REGIONS)
+        # three sequential calls per region, all regions running side by side
+        assert elapsed < 3 * API_LATENCY * 2
+
+    def test_failures_reported_per_region(self, ec2_clients):
+        amis = {'eu-west-1': 'ami-00000000000000001'}
+        with Stubber(ec2_clients['eu-west-1']) as stubber:
+            stubber.add_client_error('describe_images', service_error_code='InvalidAMIID.NotFound')
+            failures = ami_launch_permission.share_amis(amis, SHARING_ACCOUNT_IDS)
+
+        assert [failure['Region'] for failure in failures] == ['eu-west-1']
+
+    def test_organizations_shared_without_snapshot_permissions(self, ec2_clients):
+        organization_arn = 'arn:aws:organizations::111111111111:organization/o-a1b2c3d4e5'
+        organizational_unit_arn = 'arn:aws:organizations::111111111111:ou/o-a1b2c3d4e5/ou-ab12-cdef3456'
+        amis = {'eu-west-1': 'ami-00000000000000001'}
+
+        with Stubber(ec2_clients['eu-west-1']) as stubber:
+            stubber.add_response(
+                'describe_images',
+                {'Images': [{'ImageId': amis['eu-west-1'], 'BlockDeviceMappings': []}]}
+            )
+            stubber.add_response(
+                'modify_image_attribute',
+                {},
+                {
+                    'ImageId': amis['eu-west-1'],
+                    'LaunchPermission': {'Add': [
+                        {'OrganizationArn': organization_arn},
+                        {'OrganizationalUnitArn': organizational_unit_arn}
+                    ]}
+                }
+            )
+            failures = ami_launch_permission.share_amis(amis, [organization_arn, organizational_unit_arn])
+            stubber.assert_no_pending_responses()
+
+        assert failures == []
+
+
+class TestLaunchAcceleration:
+
+    AMI_ID = 'ami-00000000000000002'
+    PREVIOUS_AMI_ID = 'ami-00000000000000001'
+
+    def stub_snapshots(self, stubber, previous_ami_ids):
+        stubber.add_response(
+            'describe_images',
+            {'Images': [{'ImageId': self.AMI_ID, 'BlockDeviceMappings': [{'Ebs': {'SnapshotId': 'snap-new'}}]}]},
+            {'ImageIds': [self.AMI_ID]}
+        )
+        stubber.add_response(
+            'describe_images',
+            {'Images': [{'ImageId': self.PREVIOUS_AMI_ID, 'BlockDeviceMappings': [{'Ebs': {'SnapshotId': 'snap-old'}}]}]},
+            {'Owners': ['self'], 'Filters': [{'Name': 'image-id', 'Values': previous_ami_ids}]}
+        )
+
+    def stub_fast_snapshot_restores(self, stubber, restores):
+        stubber.add_response(
+            'describe_fast_snapshot_restores',
+            {'FastSnapshotRestores': [{'SnapshotId': snapshot_id, 'AvailabilityZone': zone} for snapshot_id, zone in restores]},
+            {'Filters': [
+                {'Name': 'snapshot-id', 'Values': ['snap-new', 'snap-old']},
+                {'Name': 'state', 'Values': ami_launch_permission.FAST_SNAPSHOT_RESTORE_ACTIVE_STATES}
+            ]}
+        )
+
+    def test_new_snapshots_restored_and_previous_cleaned_up(self, ec2_clients):
+        with Stubber(ec2_clients['eu-west-1']) as stubber:
+            # the previous AMI that was deregistered in the meantime is skipped
+            self.stub_snapshots(stubber, [self.PREVIOUS_AMI_ID, 'ami-00000000000000000'])
+            self.stub_fast_snapshot_restores(stubber, [('snap-old', 'eu-west-1a'), ('snap-new', 'eu-west-1a')])
+            stubber.add_response(
+                'disable_fast_snapshot_restores', {},
+                {'AvailabilityZones': ['eu-west-1a'], 'SourceSnapshotIds': ['snap-old']}
+            )
+            stubber.add_response(
+                'enable_fast_snapshot_restores', {},
+                {'AvailabilityZones': ['eu-west-1b'], 'SourceSnapshotIds': ['snap-new']}
+            )
+            stubber.add_response(
+                'describe_fast_launch_images',
+                {'FastLaunchImages': [{'ImageId': self.PREVIOUS_AMI_ID, 'State': 'enabled'}]},
+                {'ImageIds': [self.PREVIOUS_AMI_ID]}
+            )
+            stubber.add_response('disable_fast_launch', {}, {'ImageId': self.PREVIOUS_AMI_ID})
+
+            failures = ami_launch_permission.accelerate_amis(
+                {'eu-west-1': self.AMI_ID},
+                {'eu-west-1': [self.PREVIOUS_AMI_ID, 'ami-00000000000000000']},
+                {'eu-west-1': ['eu-west-1a', 'eu-west-1b']}
+            )
+            stubber.assert_no_pending_responses()
+
+        assert failures == []
+
+    def test_restores_disabled_when_no_longer_configured(self, ec2_clients):
+        with Stubber(ec2_clients['eu-west-1']) as stubber:
+            self.stub_snapshots(stubber, [self.PREVIOUS_AMI_ID])
+            self.stub_fast_snapshot_restores(stubber, [('snap-new', 'eu-west-1a')])
+            stubber.add_response(
+                'disable_fast_snapshot_restores', {},
+                {'AvailabilityZones': ['eu-west-1a'], 'SourceSnapshotIds': ['snap-new']}
+            )
+            stubber.add_response('describe_fast_launch_images', {'FastLaunchImages': []}, {'ImageIds': [self.PREVIOUS_AMI_ID]})
+
+            failures = ami_launch_permission.accelerate_amis(
+                {'eu-west-1': self.AMI_ID}, {'eu-west-1': [self.PREVIOUS_AMI_ID]}, {}
+            )
+            stubber.assert_no_pending_responses()
+
+        assert failures == []
+
+    def test_previous_amis_of_the_pipeline(self, monkeypatch):
+        monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+        monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+        monkeypatch.setattr(ami_launch_permission, '_CLIENTS', {})
+        imagebuilder = boto3.client('imagebuilder', region_name='eu-west-1')
+        ami_launch_permission._CLIENTS[('imagebuilder', None)] = imagebuilder
+        image_arn = 'arn:aws:imagebuilder:eu-west-1:111111111111:image/ami-share-image-recipe-test/1.0.0/{build}'
+        pipeline_arn = 'arn:aws:imagebuilder:eu-west-1:111111111111:image-pipeline/ami-share-pipeline-test'
+
+        def summary(build, status, amis):
+            return {
+                'arn': image_arn.format(build=build),
+                'state': {'status': status},
+                'outputResources': {'amis': [
+                    {'region': region, 'image': ami_id, 'accountId': account_id} for region, ami_id, account_id in amis
+                ]}
+            }
+
+        with Stubber(imagebuilder) as stubber:
+            stubber.add_response('list_image_pipeline_images', {'imageSummaryList': [
+                summary(1, 'AVAILABLE', [('eu-west-1', 'ami-1', '111111111111'), ('eu-west-1', 'ami-1-copy', '222222222222')]),
+                summary(2, 'DEPRECATED', [('eu-west-1', 'ami-2', '111111111111')]),
+                summary(3, 'AVAILABLE', [('eu-west-1', 'ami-3', '111111111111'), ('us-east-1', 'ami-3-us', '111111111111')]),
+                summary(4, 'AVAILABLE', [('eu-west-1', 'ami-4', '111111111111')])
+            ]}, {'imagePipelineArn': pipeline_arn})
+
+            previous_amis = ami_launch_permission.get_previous_amis(
+                {'arn': image_arn.format(build=4), 'sourcePipelineArn': pipeline_arn}
+            )
+
+        assert previous_amis == {'eu-west-1': ['ami-1', 'ami-3'], 'us-east-1': ['ami-3-us']}
+
+
+class TestLatestAmiParameters:
+
+    PARAMETER_PATH = '/ami-share/latest/test'
+    VERSION = '1.0.0/3'
+    BUILD_DATE = '2021-11-08T20:31:12.806Z'
+
+    def expect_parameters(self, stubber, ami_id):
+        for name, value, data_type in [('ami-id', ami_id, 'aws:ec2:image'), ('version', self.VERSION, None), ('build-date', self.BUILD_DATE, None)]:
+            expected_params = {'Name': f'{self.PARAMETER_PATH}/{name}', 'Value': value, 'Type': 'String', 'Overwrite': True}
+            if data_type:
+                expected_params['DataType'] = data_type
+            stubber.add_response('put_parameter', {'Version': 1}, expected_params)
+
+    @pytest.fixture()
+    def ssm_clients(self, monkeypatch):
+        monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+        monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+        monkeypatch.setenv('AWS_REGION', AWS_REGION)
+        monkeypatch.setattr(ami_launch_permission, '_CLIENTS', {})
+        clients = {}
+        for region in DISTRIBUTION_REGIONS:
+            clients[region] = boto3.client('ssm', region_name=region)
+            ami_launch_permission._CLIENTS[('ssm', region)] = clients[region]
+        return clients
+
+    @pytest.fixture()
+    def sharing_account_clients(self, monkeypatch):
+        """The ssm clients of the sharing account sessions, keyed by the access key id of the assumed role and region."""
+        clients = {}
+
+        class RoleSession:
+            def __init__(self, credentials):
+                self.access_key_id = credentials['AccessKeyId']
+
+            def client(self, service_name, region_name, config):
+                return clients[(self.access_key_id, region_name)]
+
+        monkeypatch.setattr(ami_launch_permission, 'role_session', RoleSession)
+        sts = boto3.client('sts', region_name=AWS_REGION)
+        ami_launch_permission._CLIENTS[('sts', AWS_REGION)] = sts
+        for account_id in SHARING_ACCOUNT_IDS:
+            clients[(f'key-{account_id}', AWS_REGION)] = boto3.client('ssm', region_name=AWS_REGION)
+        return sts, clients
+
+    @staticmethod
+    def assume_role_response(account_id):
+        return {'Credentials': {
+            'AccessKeyId': f'key-{account_id}',
+            'SecretAccessKey': 'secret',
+            'SessionToken': 'token',
+            'Expiration': '2021-11-08T21:31:12Z'
+        }}
+
+    def test_image_version_of_arn(self):
+        image_arn = 'arn:aws:imagebuilder:eu-west-1:111111111111:image/ami-share-image-recipe-test/1.0.0/3'
+        assert ami_launch_permission.get_image_version(image_arn) == self.VERSION
+
+    def test_parameters_written_in_every_region(self, ssm_clients):
+        amis = {region: f'ami-{i:017d}' for i, region in enumerate(DISTRIBUTION_REGIONS)}
+        stubbers = [Stubber(ssm_clients[region]) for region in DISTRIBUTION_REGIONS]
+        for stubber, region in zip(stubbers, DISTRIBUTION_REGIONS):
+            self.expect_parameters(stubber, amis[region])
+            stubber.activate()
+
+        failures = ami_launch_permission.publish_latest_amis(amis, self.PARAMETER_PATH, self.VERSION, self.BUILD_DATE)
+
+        for stubber in stubbers:
+            stubber.assert_no_pending_responses()
+            stubber.deactivate()
+        assert failures == []
+
+    def test_parameters_written_into_sharing_accounts(self, ssm_clients, sharing_account_clients):
+        sts, clients = sharing_account_clients
+        amis = {AWS_REGION: 'ami-00000000000000001'}
+        stubbers = [Stubber(ssm_clients[AWS_REGION])] + [Stubber(clients[(f'key-{account_id}', AWS_REGION)]) for account_id in SHARING_ACCOUNT_IDS]
+        for stubber in stubbers:
+            self.expect_parameters(stubber, amis[AWS_REGION])
+            stubber.activate()
+
+        with Stubber(sts) as sts_stubber:
+            for account_id in SHARING_ACCOUNT_IDS:
+                sts_stubber.add_response('assume_role', self.assume_role_response(account_id), {
+                    'RoleArn': f'arn:aws:iam::{account_id}:role/AmiShareLatestAmi',
+                    'RoleSessionName': ami_launch_permission.LATEST_AMI_ROLE_SESSION_NAME
+                })
+            # a single worker keeps the assume role calls in the order of the stubbed responses
+            failures = ami_launch_permission.publish_latest_amis(
+                amis, self.PARAMETER_PATH, self.VERSION, self.BUILD_DATE, SHARING_ACCOUNT_IDS, 'AmiShareLatestAmi', max_workers=1
+            )
+            sts_stubber.assert_no_pending_responses()
+
+        for stubber in stubbers:
+            stubber.assert_no_pending_responses()
+            stubber.deactivate()
+        assert failures == []
+
+    def test_sharing_account_without_role_reported(self, ssm_clients, sharing_account_clients):
+        sts, _ = sharing_account_clients
+        amis = {AWS_REGION: 'ami-00000000000000001'}
+
+        with Stubber(ssm_clients[AWS_REGION]) as stubber, Stubber(sts) as sts_stubber:
+            self.expect_parameters(stubber, amis[AWS_REGION])
+            sts_stubber.add_client_error('assume_role', 'AccessDenied', 'Not authorized to perform sts:AssumeRole')
+
+            failures = ami_launch_permission.publish_latest_amis(
+                amis, self.PARAMETER_PATH, self.VERSION, self.BUILD_DATE, SHARING_ACCOUNT_IDS[:1], 'AmiShareLatestAmi'
+            )
+
+        assert [failure['AccountId'] for failure in failures] == SHARING_ACCOUNT_IDS[:1]
+
+
+class TestLambdaHandler:
+
+    def test_non_available_state_ignored(self):
+        event = {
+            'detail': {'state': {'status': 'BUILDING'}},
+            'resources': ['arn:aws:imagebuilder:eu-west-1:111111111111:image/ami-share-image-recipe-test/1.0.0/1']
+        }
+        assert ami_launch_permission.lambda_handler(event, None) == {'Shared': False}
+
+    def test_sharing_ids_path_selected_by_image_name(self):
+        sharing_ids_paths = {
+            'ami-share-image-recipe-test': '/test-AmiSharing/AmiSharingAccountIds',
+            'ami-share-image-recipe-test-al2-arm64': '/test-AmiSharing-al2-arm64/AmiSharingAccountIds'
+        }
+        image_arn = 'arn:aws:imagebuilder:eu-west-1:111111111111:image/ami-share-image-recipe-test-al2-arm64/1.0.0/1'
+
+        assert ami_launch_permission.get_sharing_ids_path(image_arn, sharing_ids_paths) == \
+            '/test-AmiSharing-al2-arm64/AmiSharingAccountIds'
+
+        with pytest.raises(ValueError):
+            ami_launch_permission.get_sharing_ids_path(image_arn.replace('-al2-arm64', '-other'), sharing_ids_paths)
+
+    IMAGE_ARN = 'arn:aws:imagebuilder:eu-west-1:111111111111:image/ami-share-image-recipe-test/1.0.0/1'
+
+    def handle_available_image(self, ec2_clients, monkeypatch, image, ssm_stubs=()):
+        """
+            Run the handler for an available image distributed into AWS_REGION, with
+            no launch acceleration. Only the sharing calls and ssm_stubs are stubbed,
+            so any other API call fails the test.
+        """
+        monkeypatch.setenv('AWS_REGION', AWS_REGION)
+        monkeypatch.setenv('SHARING_ACCOUNT_IDS_PATHS', '{"ami-share-image-recipe-test": "/test-AmiSharing/AmiSharingAccountIds"}')
+        monkeypatch.setenv('FAST_SNAPSHOT_RESTORE_ZONES', '{}')
+        monkeypatch.setenv('FAST_LAUNCH_IMAGE_NAMES', '[]')
+        ssm = boto3.client('ssm', region_name=AWS_REGION)
+        imagebuilder = boto3.client('imagebuilder', region_name=AWS_REGION)
+        ami_launch_permission._CLIENTS[('ssm', AWS_REGION)] = ssm
+        ami_launch_permission._CLIENTS[('imagebuilder', None)] = imagebuilder
+
+        with Stubber(ssm) as ssm_stubber, Stubber(imagebuilder) as imagebuilder_stubber, Stubber(ec2_clients[AWS_REGION]) as ec2_stubber:
+            ssm_stubber.add_response('get_parameters_by_path', {'Parameters': [
+                {'Name': '/test-AmiSharing/AmiSharingAccountIds', 'Value': ','.join(SHARING_ACCOUNT_IDS)}
+            ]})
+            for method, response in ssm_stubs:
+                ssm_stubber.add_response(method, response)
+            imagebuilder_stubber.add_response('get_image', {'image': {
+                'arn': self.IMAGE_ARN,
+                'sourcePipelineArn': 'arn:aws:imagebuilder:eu-west-1:111111111111:image-pipeline/ami-share-pipeline-test',
+                'outputResources': {'amis': [{'region': AWS_REGION, 'image': 'ami-00000000000000001'}]},
+                **image
+            }})
+            stub_region(ec2_stubber, 'ami-00000000000000001', 'snap-00000000000000001')
+
+            output = ami_launch_permission.lambda_handler({
+                'detail': {'state': {'status': 'AVAILABLE'}},
+                'resources': [self.IMAGE_ARN]
+            }, None)
+
+            ssm_stubber.assert_no_pending_responses()
+            imagebuilder_stubber.assert_no_pending_responses()
+            ec2_stubber.assert_no_pending_responses()
+
+        return output
+
+    def test_no_acceleration_calls_by_default(self, ec2_clients, monkeypatch):
+        output = self.handle_available_image(ec2_clients, monkeypatch, {})
+
+        assert output['Shared'] is True
+        assert output['Failures'] == []
+
+    def test_latest_ami_parameters_published_with_build_date(self, ec2_clients, monkeypatch):
+        monkeypatch.setenv('LATEST_AMI_PARAMETER_PATHS', '{"ami-share-image-recipe-test": "/ami-share/latest/test"}')
+
+        output = self.handle_available_image(
+            ec2_clients, monkeypatch, {'dateCreated': '2021-11-08T20:31:12.806Z'}, [('put_parameter', {'Version': 1})] * 3
+        )
+
+        assert output['LatestAmiParameterPath'] == '/ami-share/latest/test'
+        assert output['Failures'] == []
+
+    def test_latest_ami_parameters_skipped_without_build_date(self, ec2_clients, monkeypatch):
+        monkeypatch.setenv('LATEST_AMI_PARAMETER_PATHS', '{"ami-share-image-recipe-test": "/ami-share/latest/test"}')
+
+        # no put_parameter responses are stubbed, a PutParameter call would fail the test
+        output = self.handle_available_image(ec2_clients, monkeypatch, {})
+
+        assert output['Shared'] is True
+        assert output['LatestAmiParameterPath'] is None
+        assert output['Failures'] == []
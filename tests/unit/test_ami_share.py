@@ -7,8 +7,10 @@ from aws_cdk import (
     core
 )
 
-from cdk_expects_matcher.CdkMatchers import have_resource, ANY_VALUE, contain_metadata_path
+from cdk_expects_matcher.CdkMatchers import ANY_VALUE
+from tests.utils.template_index import have_resource, contain_metadata_path
 import tests.utils.base_test_case as tc
+from tests.utils.root_test_case import variant_settings
 from stacks.amishare.ami_share import AmiShareStack
 from utils.CdkUtils import CdkUtils
 
@@ -24,7 +26,10 @@ class TestAmiShareStack(tc.BaseTestCase):
         Test case for AmiShareStack
     """
 
-    config = CdkUtils.get_project_settings()
+    def setUp(self):
+        # loaded per test rather than at collection time, so that invalid
+        # settings fail the tests instead of the collection of the module
+        self.config = variant_settings()
 
     ##################################################
     ## <START> EC2 Security Group tests
@@ -229,7 +234,10 @@ class TestAmiShareStack(tc.BaseTestCase):
                 "PolicyDocument": {
                     "Statement": [
                         {
-                            "Action": "imagebuilder:UpdateDistributionConfiguration",
+                            "Action": [
+                                "imagebuilder:GetDistributionConfiguration",
+                                "imagebuilder:UpdateDistributionConfiguration"
+                            ],
                             "Effect": "Allow",
                             "Resource": {
                                 "Fn::GetAtt": [
@@ -245,4 +253,29 @@ class TestAmiShareStack(tc.BaseTestCase):
 
     ##################################################
     ## </END> AWS Custom resource tests
+    ##################################################
+
+    ##################################################
+    ## <START> AMI launch permission tests
+    ##################################################
+
+    def test_ami_launch_permission_lambda(self):
+        expect(self.cfn_template).to(contain_metadata_path(self.lambda_, f'amiLaunchPermissionLambda-{CdkUtils.stack_tag}'))
+
+    def test_ami_share_image_available_rule(self):
+        expect(self.cfn_template).to(have_resource(self.event_rule, {
+            "EventPattern": {
+                "source": ["aws.imagebuilder"],
+                "detail-type": ["EC2 Image Builder Image State Change"],
+                "detail": {
+                    "state": {
+                        "status": ["AVAILABLE"]
+                    }
+                }
+            },
+            "State": "ENABLED"
+        }))
+
+    ##################################################
+    ## </END> AMI launch permission tests
     ##################################################
\ No newline at end of file
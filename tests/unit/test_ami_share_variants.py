@@ -0,0 +1,372 @@
+import json
+
+import pytest
+
+import tests.utils.base_test_case as tc
+from stacks.amishare.ami_share import AmiShareStack
+from stacks.amishare.resources.amidistribution import distribution_planner
+from tests.utils.root_test_case import synth_environment, variant_settings
+from tests.utils.settings_variants import SETTINGS_VARIANTS
+from tests.utils.template_index import TemplateIndex
+from utils.CdkUtils import CdkUtils, SSM_PARAMETER_MAX_LENGTH
+
+BaseTestCase = tc.BaseTestCase
+
+
+@pytest.fixture(scope="module", params=sorted(SETTINGS_VARIANTS))
+def variant(request):
+    """The settings and the template index of every settings variant, each synthesised into its own assembly."""
+    cfn_template = BaseTestCase.load_stack_template(AmiShareStack.__name__, request.param)
+    return variant_settings(request.param), TemplateIndex.of(cfn_template)
+
+
+def distribution_targets(index):
+    """The distribution targets of the single ami distribution custom resource of the stack."""
+    custom_resource, = index.resources_of_type(BaseTestCase.custom_cfn_resource).values()
+    return custom_resource['Properties']['DistributionTargets']
+
+
+class TestAmiShareStackVariants:
+    """
+        Test case for AmiShareStack, run for every settings variant
+    """
+
+    def test_no_admin_permissions(self, variant):
+        _, index = variant
+        assert index.count(':iam::aws:policy/AdministratorAccess') == 0
+
+    def test_kms_key_rotation_enabled(self, variant):
+        _, index = variant
+        assert index.count_type(BaseTestCase.kms_key) == index.count('"EnableKeyRotation":true')
+
+    def test_no_iam_users_or_groups_created(self, variant):
+        _, index = variant
+        assert index.count_type(BaseTestCase.iam_user) == index.count_type(BaseTestCase.iam_group) == 0
+
+    def test_distribution_configuration_per_account_chunk(self, variant):
+        settings, index = variant
+        # the project and Pipeline tags of the stack, the Image Builder tags and the headroom
+        reserved_tags = 2 + distribution_planner.IMAGE_BUILDER_AMI_TAGS + distribution_planner.AMI_TAG_HEADROOM
+        chunk_count = sum(
+            len(distribution_planner.plan_account_chunks(
+                pipeline.ami_publishing_target_ids, pipeline.ami_sharing_ids, reserved_tags=reserved_tags
+            ))
+            for pipeline in settings.pipelines
+        )
+
+        foundation_count = sum(pipeline.has_foundation for pipeline in settings.pipelines)
+
+        assert index.count_type(BaseTestCase.imagebuilder_distribution_config) == chunk_count
+        assert index.count_type(BaseTestCase.imagebuilder_image_pipeline) == chunk_count + foundation_count
+        # one custom resource updates every distribution configuration
+        assert index.count_type(BaseTestCase.custom_cfn_resource) == 1
+        assert len(distribution_targets(index)) == chunk_count
+        assert {target['ReservedTags'] for target in distribution_targets(index)} == {reserved_tags}
+
+    def test_recipe_and_infrastructure_per_pipeline(self, variant):
+        settings, index = variant
+        foundation_count = sum(pipeline.has_foundation for pipeline in settings.pipelines)
+        assert index.count_type(BaseTestCase.imagebuilder_recipe) == len(settings.pipelines) + foundation_count
+        assert index.count_type(BaseTestCase.imagebuilder_infrastructure_configuration) == len(settings.pipelines)
+        # the base infrastructure is shared by all pipelines
+        assert index.count_type(BaseTestCase.kms_key) == 1
+        assert index.count_type(BaseTestCase.iam_instance_profile) == 1
+        assert index.count_type(BaseTestCase.ec2_security_group) == 1 + settings.vpc.endpoints
+        assert index.count_type(BaseTestCase.sns_topic) == 1
+
+    def test_distribution_regions(self, variant):
+        settings, index = variant
+        regions = {
+            f"/{CdkUtils.stack_tag}-AmiSharing{pipeline.suffix}": list(pipeline.ami_publishing_regions)
+            for pipeline in settings.pipelines
+        }
+        for target in distribution_targets(index):
+            assert target['AwsDistributionRegions'] == regions[target['AccountIdsPath']]
+
+    def test_instance_types(self, variant):
+        settings, index = variant
+        instance_types = {
+            f"ami-share-infra-config-{CdkUtils.stack_tag}{pipeline.suffix}": list(pipeline.instance_types)
+            for pipeline in settings.pipelines
+        }
+        for infra_config in index.resources_of_type(BaseTestCase.imagebuilder_infrastructure_configuration).values():
+            assert infra_config['Properties']['InstanceTypes'] == instance_types[infra_config['Properties']['Name']]
+
+    def test_patch_recipes_built_on_foundation_image(self, variant):
+        settings, index = variant
+        recipes = {
+            recipe['Properties']['Name']: recipe['Properties']
+            for recipe in index.resources_of_type(BaseTestCase.imagebuilder_recipe).values()
+        }
+        environment = synth_environment()
+        for pipeline in settings.pipelines:
+            name = f"ami-share-image-recipe-{CdkUtils.stack_tag}{pipeline.suffix}"
+            base_image = f"arn:aws:imagebuilder:{environment['region']}:aws:image/{pipeline.base_image_arn}"
+            if pipeline.has_foundation:
+                assert recipes[f"{name}-foundation"]['ParentImage'] == base_image
+            if pipeline.incremental:
+                assert recipes[name]['ParentImage'] == (
+                    f"arn:aws:imagebuilder:{environment['region']}:{environment['account']}:image/{name}-foundation/x.x.x"
+                )
+                assert 'update-linux/x.x.x' in str(recipes[name]['Components'])
+                assert 'aws-cli-version-2-linux' not in str(recipes[name]['Components'])
+            else:
+                assert recipes[name]['ParentImage'] == base_image
+
+    def test_vpc_endpoints(self, variant):
+        settings, index = variant
+        endpoints = index.resources_of_type(BaseTestCase.vpc_endpoint).values()
+        imagebuilder_sg = next(
+            resource['Properties'] for resource in index.resources_of_type(BaseTestCase.ec2_security_group).values()
+            if resource['Properties']['GroupName'] == f"ami-share-imagebuilder-sg-{CdkUtils.stack_tag}"
+        )
+
+        if not settings.vpc.endpoints:
+            assert not endpoints
+            assert imagebuilder_sg['SecurityGroupEgress'] == [{'CidrIp': '0.0.0.0/0', 'Description': 'Allow all outbound traffic by default', 'IpProtocol': '-1'}]
+        else:
+            interface_services = sorted(
+                endpoint['Properties']['ServiceName'] for endpoint in endpoints
+                if endpoint['Properties']['VpcEndpointType'] == 'Interface'
+            )
+            assert interface_services == [
+                f"com.amazonaws.{synth_environment()['region']}.{service}" for service in ['ec2messages', 'imagebuilder', 'kms', 'logs', 'ssm', 'ssmmessages']
+            ]
+            assert [endpoint['Properties']['VpcEndpointType'] for endpoint in endpoints].count('Gateway') == 1
+            assert sorted(rule['FromPort'] for rule in imagebuilder_sg['SecurityGroupEgress']) == [80, 443]
+
+    def test_artifact_cache(self, variant):
+        settings, index = variant
+        buckets = index.resources_of_type(BaseTestCase.s3_bucket)
+        components = index.resources_of_type(BaseTestCase.imagebuilder_component)
+
+        if settings.artifact_cache is None:
+            assert not buckets and not components
+            return
+
+        (bucket_id, bucket), = buckets.items()
+        (component_id, component), = components.items()
+        kms_key_id, = index.resources_of_type(BaseTestCase.kms_key)
+        encryption, = bucket['Properties']['BucketEncryption']['ServerSideEncryptionConfiguration']
+        assert encryption['ServerSideEncryptionByDefault']['KMSMasterKeyID'] == {'Fn::GetAtt': [kms_key_id, 'Arn']}
+        _, parts = component['Properties']['Data']['Fn::Join']
+        bucket_ref = parts.index({'Ref': bucket_id})
+        assert parts[bucket_ref - 1].endswith('cache=\\"s3://') and parts[bucket_ref + 1].startswith('/artifacts\\"')
+
+        # the artifacts are installed by the full builds, patch builds only apply the delta
+        for recipe in index.resources_of_type(BaseTestCase.imagebuilder_recipe).values():
+            components = [str(component) for component in recipe['Properties']['Components']]
+            cache_component = str({'ComponentArn': {'Fn::GetAtt': [component_id, 'Arn']}})
+            uses_cache = cache_component in components
+            assert uses_cache != recipe['Properties']['ParentImage'].endswith('-foundation/x.x.x')
+            # the cache is read with the aws cli, which is installed first
+            if uses_cache:
+                aws_cli_component = next(component for component in components if 'aws-cli-version-2-linux' in component)
+                assert components.index(aws_cli_component) < components.index(cache_component)
+
+    def test_block_devices(self, variant):
+        settings, index = variant
+        block_devices = {
+            f"ami-share-image-recipe-{CdkUtils.stack_tag}{pipeline.suffix}": [
+                {
+                    key: value for key, value in {
+                        'VolumeSize': block_device.volume_size,
+                        'VolumeType': block_device.volume_type,
+                        'Iops': block_device.iops,
+                        'Throughput': block_device.throughput
+                    }.items() if value is not None
+                }
+                for block_device in pipeline.block_devices
+            ]
+            for pipeline in settings.pipelines
+        }
+        for recipe in index.resources_of_type(BaseTestCase.imagebuilder_recipe).values():
+            name = recipe['Properties']['Name'].replace('-foundation', '')
+            assert [
+                {key: value for key, value in mapping['Ebs'].items() if key not in ('DeleteOnTermination', 'Encrypted')}
+                for mapping in recipe['Properties']['BlockDeviceMappings']
+            ] == block_devices[name]
+
+    def test_launch_acceleration(self, variant):
+        settings, index = variant
+        fast_launch_configurations = {
+            target['AmiDistributionName'].split('-{{')[0]: target.get('FastLaunchConfigurations')
+            for target in distribution_targets(index)
+        }
+        launch_permission_environment, = [
+            function['Properties']['Environment']['Variables']
+            for function in index.resources_of_type(BaseTestCase.lambda_).values()
+            if 'FAST_SNAPSHOT_RESTORE_ZONES' in function['Properties'].get('Environment', {}).get('Variables', {})
+        ]
+        launch_permission_zones = json.loads(launch_permission_environment['FAST_SNAPSHOT_RESTORE_ZONES'])
+        fast_launch_image_names = json.loads(launch_permission_environment['FAST_LAUNCH_IMAGE_NAMES'])
+
+        for pipeline in settings.pipelines:
+            fast_launch = {
+                region.region: {
+                    'TargetResourceCount': region.fast_launch.target_resource_count,
+                    'MaxParallelLaunches': region.fast_launch.max_parallel_launches
+                }
+                for region in pipeline.region_settings if region.fast_launch is not None
+            }
+            zones = {
+                region.region: list(region.fast_snapshot_restore_zones)
+                for region in pipeline.region_settings if region.fast_snapshot_restore_zones
+            }
+            assert fast_launch_configurations[f"AmiShare-{CdkUtils.stack_tag}{pipeline.suffix}"] == (fast_launch or None)
+            assert launch_permission_zones.get(f"ami-share-image-recipe-{CdkUtils.stack_tag}{pipeline.suffix}") == (zones or None)
+            assert (f"ami-share-image-recipe-{CdkUtils.stack_tag}{pipeline.suffix}" in fast_launch_image_names) == bool(fast_launch)
+
+    def test_latest_ami_parameters(self, variant):
+        settings, index = variant
+        environment, = [
+            function['Properties']['Environment']['Variables']
+            for function in index.resources_of_type(BaseTestCase.lambda_).values()
+            if 'LATEST_AMI_PARAMETER_PATHS' in function['Properties'].get('Environment', {}).get('Variables', {})
+        ]
+        statements = [
+            statement
+            for policy in index.resources_of_type(BaseTestCase.iam_policy).values()
+            for statement in policy['Properties']['PolicyDocument']['Statement']
+        ]
+        put_parameter_resources = [
+            resource for statement in statements if statement['Action'] == 'ssm:PutParameter' for resource in statement['Resource']
+        ]
+        assume_role_resources = [statement['Resource'] for statement in statements if statement['Action'] == 'sts:AssumeRole']
+
+        if settings.latest_ami_parameters is None:
+            assert json.loads(environment['LATEST_AMI_PARAMETER_PATHS']) == {}
+            assert not put_parameter_resources and not assume_role_resources
+            return
+
+        parameter_paths = {
+            f"ami-share-image-recipe-{CdkUtils.stack_tag}{pipeline.suffix}": f"{settings.latest_ami_parameters.path}/{CdkUtils.stack_tag}{pipeline.suffix}"
+            for pipeline in settings.pipelines
+        }
+        assert json.loads(environment['LATEST_AMI_PARAMETER_PATHS']) == parameter_paths
+        # one parameter path per pipeline and distribution region
+        assert len(put_parameter_resources) == sum(len(pipeline.ami_publishing_regions) for pipeline in settings.pipelines)
+        role_name = settings.latest_ami_parameters.sharing_account_role_name
+        assert environment['LATEST_AMI_SHARING_ACCOUNT_ROLE_NAME'] == (role_name or '')
+        assert assume_role_resources == ([f"arn:aws:iam::*:role/{role_name}"] if role_name else [])
+
+    def test_notification_queue(self, variant):
+        settings, index = variant
+        subscriptions = {
+            subscription['Properties']['Protocol']: subscription['Properties']
+            for subscription in index.resources_of_type(BaseTestCase.sns_subscription).values()
+        }
+        queues = index.resources_of_type(BaseTestCase.sqs_queue).values()
+        event_source_mappings = list(index.resources_of_type(BaseTestCase.lambda_event_source_mapping).values())
+
+        if settings.notification_queue is None:
+            assert sorted(subscriptions) == ['email']
+            assert 'FilterPolicy' not in subscriptions['email']
+            assert not queues and not event_source_mappings
+            return
+
+        assert sorted(subscriptions) == ['email', 'sqs']
+        assert subscriptions['email']['FilterPolicy'] == {'messageType': ['digest']}
+        assert subscriptions['sqs']['FilterPolicy'] == {'messageType': [{'exists': False}]}
+        assert subscriptions['sqs']['RawMessageDelivery'] is True
+        # the notification queue, its dead letter queue and the FIFO digest queue, all encrypted
+        assert len(queues) == 3
+        assert [queue['Properties'].get('FifoQueue', False) for queue in queues].count(True) == 1
+        assert all('KmsMasterKeyId' in queue['Properties'] for queue in queues)
+
+        event_source_mapping, = event_source_mappings
+        assert event_source_mapping['Properties']['BatchSize'] == settings.notification_queue.batch_size
+        assert event_source_mapping['Properties']['MaximumBatchingWindowInSeconds'] == \
+            settings.notification_queue.max_batching_window_seconds
+        assert event_source_mapping['Properties']['FunctionResponseTypes'] == ['ReportBatchItemFailures']
+        assert any(
+            rule['Properties'].get('ScheduleExpression') == f"rate({settings.notification_queue.digest_period_hours} hours)"
+            for rule in index.resources_of_type(BaseTestCase.event_rule).values()
+        )
+
+    def test_custom_resource_mode(self, variant):
+        settings, index = variant
+        functions = index.resources_of_type(BaseTestCase.lambda_).items()
+        handlers = {logical_id: function['Properties']['Handler'] for logical_id, function in functions}
+        distribution_function, = [
+            logical_id for logical_id, handler in handlers.items() if handler.startswith('ami_distribution.')
+        ]
+        service_tokens = [
+            resource['Properties']['ServiceToken']
+            for resource in index.resources_of_type(BaseTestCase.custom_cfn_resource).values()
+        ]
+
+        assert service_tokens
+        if settings.lambda_.custom_resource_mode == 'direct':
+            assert handlers[distribution_function] == 'ami_distribution.direct_handler'
+            assert service_tokens == [{'Fn::GetAtt': [distribution_function, 'Arn']}] * len(service_tokens)
+            # no provider framework function between CloudFormation and the distribution function
+            assert 'framework.onEvent' not in handlers.values()
+        else:
+            assert handlers[distribution_function] == 'ami_distribution.lambda_handler'
+            assert 'framework.onEvent' in handlers.values()
+            assert {'Fn::GetAtt': [distribution_function, 'Arn']} not in service_tokens
+
+    def test_pipeline_schedules(self, variant):
+        settings, index = variant
+        schedules = [
+            pipeline['Properties'].get('Schedule')
+            for pipeline in index.resources_of_type(BaseTestCase.imagebuilder_image_pipeline).values()
+        ]
+
+        if settings.schedule is None:
+            assert schedules == [None] * len(schedules)
+        else:
+            assert schedules == [
+                {
+                    'ScheduleExpression': settings.schedule.schedule_expression_for(build_index),
+                    'PipelineExecutionStartCondition': settings.schedule.start_condition
+                }
+                for build_index in range(len(schedules))
+            ]
+
+    def test_ssm_parameters_within_size_limit(self, variant):
+        _, index = variant
+        for parameter in index.resources_of_type('AWS::SSM::Parameter').values():
+            assert len(parameter['Properties']['Value']) <= SSM_PARAMETER_MAX_LENGTH
+
+
+class TestMultipleStackTags:
+
+    def test_stack_tags_synthesised_in_one_app(self):
+        from aws_cdk import core
+
+        app = core.App(context={'aws:cdk:enable-path-metadata': True})
+        for stack_tag in ['main', 'feature-x']:
+            AmiShareStack(
+                app, f"EC2ImageBuilderAmiShare-{stack_tag}",
+                project_settings=variant_settings(),
+                stack_tag=stack_tag,
+                env=core.Environment(account='111111111111', region='us-east-1')
+            )
+        assembly = app.synth()
+
+        for stack_tag in ['main', 'feature-x']:
+            index = TemplateIndex(assembly.get_stack_by_name(f"EC2ImageBuilderAmiShare-{stack_tag}").template)
+            pipeline, = index.resources_of_type(BaseTestCase.imagebuilder_image_pipeline).values()
+            assert pipeline['Properties']['Name'] == f"ami-share-pipeline-{stack_tag}"
+            assert index.has_path_segment(BaseTestCase.kms_key, f"ami-share-kms-key-{stack_tag}")
+
+    def test_regions_of_one_account_synthesised_in_one_app(self):
+        from aws_cdk import core
+
+        app = core.App(context={'aws:cdk:enable-path-metadata': True})
+        for region in ['us-east-1', 'eu-west-1']:
+            AmiShareStack(
+                app, f"EC2ImageBuilderAmiShare-main-111111111111-{region}",
+                project_settings=variant_settings(),
+                stack_tag='main',
+                env=core.Environment(account='111111111111', region=region)
+            )
+        assembly = app.synth()
+
+        # account-global IAM names must not collide between the regions
+        for region in ['us-east-1', 'eu-west-1']:
+            index = TemplateIndex(assembly.get_stack_by_name(f"EC2ImageBuilderAmiShare-main-111111111111-{region}").template)
+            instance_profile, = index.resources_of_type(BaseTestCase.iam_instance_profile).values()
+            assert instance_profile['Properties']['InstanceProfileName'] == f"ami-share-imagebuilder-instance-profile-main-{region}"
@@ -0,0 +1,134 @@
+import io
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from tests.utils.local_s3 import LocalS3, write_executable
+from utils import ArtifactCache
+from utils.ProjectSettings import ArtifactSettings
+
+BUCKET = 'ami-share-artifact-cache'
+
+AWSCLI = ArtifactSettings(
+    name='awscli-exe-linux-x86_64.zip',
+    url='https://awscli.amazonaws.com/awscli-exe-linux-x86_64.zip',
+    install=''
+)
+SSM_AGENT = ArtifactSettings(
+    name='amazon-ssm-agent.rpm',
+    url='https://s3.amazonaws.com/ec2-downloads-windows/SSMAgent/latest/linux_amd64/amazon-ssm-agent.rpm',
+    install='echo "installed $(cat amazon-ssm-agent.rpm)" > installed.txt'
+)
+
+# records the downloaded urls and writes the upstream content to the --output file
+CURL_SCRIPT = """#!/bin/bash
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --output) output="$2"; shift ;;
+        --*) ;;
+        *) url="$1" ;;
+    esac
+    shift
+done
+echo "$url" >> {log}
+echo -n "upstream" > "$output"
+"""
+
+
+class BuildHost():
+    """Runs the artifact cache fetch script with aws and curl replaced by local stand-ins."""
+
+    def __init__(self, tmp_path):
+        self.s3 = LocalS3(str(tmp_path / 's3'))
+        self.directory = str(tmp_path / 'artifacts')
+        self.curl_log = str(tmp_path / 'curl.log')
+        bin_dir = tmp_path / 'bin'
+        bin_dir.mkdir()
+        self.s3.install_aws_cli(str(bin_dir))
+        write_executable(str(bin_dir / 'curl'), CURL_SCRIPT.format(log=self.curl_log))
+        self.bin_dir = str(bin_dir)
+        self.env = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    def fetch(self, artifacts) -> subprocess.CompletedProcess:
+        script = ArtifactCache.fetch_script(BUCKET, artifacts, self.directory)
+        return subprocess.run(['bash', '-c', script], env=self.env, capture_output=True, text=True, check=True)
+
+    def downloaded_urls(self) -> list:
+        if not os.path.exists(self.curl_log):
+            return []
+        with open(self.curl_log, 'r') as curl_log:
+            return curl_log.read().split()
+
+    def artifact(self, name: str) -> str:
+        with open(os.path.join(self.directory, name), 'r') as artifact:
+            return artifact.read()
+
+
+@pytest.fixture
+def build_host(tmp_path):
+    return BuildHost(tmp_path)
+
+
+class TestFetchScript:
+
+    def test_cache_hit_skips_remote_fetch(self, build_host):
+        build_host.s3.put(BUCKET, ArtifactCache.artifact_key(AWSCLI.name), b'cached')
+
+        result = build_host.fetch([AWSCLI])
+
+        assert build_host.downloaded_urls() == []
+        assert build_host.artifact(AWSCLI.name) == 'cached'
+        assert f"Artifact cache hit: {AWSCLI.name}" in result.stdout
+
+    def test_cache_miss_falls_back_to_upstream_and_fills_cache(self, build_host):
+        result = build_host.fetch([AWSCLI])
+
+        assert build_host.downloaded_urls() == [AWSCLI.url]
+        assert build_host.artifact(AWSCLI.name) == 'upstream'
+        assert build_host.s3.get(BUCKET, ArtifactCache.artifact_key(AWSCLI.name)) == b'upstream'
+        assert f"Artifact cache miss: {AWSCLI.name}" in result.stdout
+
+    def test_second_build_served_from_cache(self, build_host):
+        build_host.fetch([AWSCLI, SSM_AGENT])
+        build_host.fetch([AWSCLI, SSM_AGENT])
+
+        assert build_host.downloaded_urls() == [AWSCLI.url, SSM_AGENT.url]
+
+    def test_install_commands_run_after_fetch(self, build_host):
+        build_host.s3.put(BUCKET, ArtifactCache.artifact_key(SSM_AGENT.name), b'cached')
+
+        build_host.fetch([SSM_AGENT])
+
+        assert build_host.artifact('installed.txt') == 'installed cached\n'
+
+    @pytest.mark.skipif(shutil.which('aws', path='/usr/bin:/bin') is not None, reason='aws cli installed on the host')
+    def test_missing_aws_cli_fails(self, build_host):
+        os.remove(os.path.join(build_host.bin_dir, 'aws'))
+        build_host.env['PATH'] = f"{build_host.bin_dir}{os.pathsep}/usr/bin:/bin"
+
+        with pytest.raises(subprocess.CalledProcessError) as error:
+            build_host.fetch([AWSCLI])
+
+        assert error.value.stderr == "The artifact cache requires the aws cli\n"
+        assert build_host.downloaded_urls() == []
+
+
+class TestPrestage:
+
+    def test_only_missing_artifacts_uploaded(self, tmp_path):
+        s3 = LocalS3(str(tmp_path / 's3'))
+        s3.put(BUCKET, ArtifactCache.artifact_key(AWSCLI.name), b'cached')
+        fetched = []
+
+        def fetch(url):
+            fetched.append(url)
+            return io.BytesIO(b'upstream')
+
+        staged = ArtifactCache.prestage_artifacts(s3, BUCKET, [AWSCLI, SSM_AGENT], fetch)
+
+        assert staged == [SSM_AGENT.name]
+        assert fetched == [SSM_AGENT.url]
+        assert s3.get(BUCKET, ArtifactCache.artifact_key(AWSCLI.name)) == b'cached'
+        assert s3.get(BUCKET, ArtifactCache.artifact_key(SSM_AGENT.name)) == b'upstream'
@@ -0,0 +1,42 @@
+import pytest
+from aws_cdk import core
+
+import utils.CdkUtils
+from utils.CdkUtils import CdkUtils
+
+
+class TestStackTag:
+
+    @pytest.mark.parametrize('stack_tag, expected', [('main', 'main'), ('Feature/ABC_1', 'feature-abc-1')])
+    def test_stack_tag_environment_variable_slugged(self, monkeypatch, stack_tag, expected):
+        monkeypatch.setattr(utils.CdkUtils, '_STACK_TAG', None)
+        monkeypatch.setenv('STACK_TAG', stack_tag)
+
+        assert CdkUtils.stack_tag == expected
+
+
+def app_with_environments(environments):
+    return core.App(context={'environments': environments})
+
+
+class TestContextEnvironments:
+
+    def test_environments_parsed(self):
+        app = app_with_environments('111111111111/eu-west-1, 222222222222/us-gov-west-1')
+
+        assert CdkUtils.get_context_environments(app, 'environments') == [
+            ('111111111111', 'eu-west-1'),
+            ('222222222222', 'us-gov-west-1')
+        ]
+
+    def test_no_environments(self):
+        assert CdkUtils.get_context_environments(core.App(), 'environments') == []
+
+    @pytest.mark.parametrize('entry', ['123456789012', 'a/b/c', '1234/eu-west-1', '111111111111/europe'])
+    def test_malformed_entry_named(self, entry):
+        app = app_with_environments(['111111111111/eu-west-1', entry])
+
+        with pytest.raises(ValueError) as error:
+            CdkUtils.get_context_environments(app, 'environments')
+
+        assert str(error.value) == f"environments: invalid entry {entry}, expected <12 digit account id>/<region>"
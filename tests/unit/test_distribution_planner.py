@@ -0,0 +1,139 @@
+import pytest
+
+from stacks.amishare.resources.amidistribution import ami_distribution
+from stacks.amishare.resources.amidistribution import distribution_planner as planner
+
+
+ORGANIZATION_ARN = 'arn:aws:organizations::111111111111:organization/o-a1b2c3d4e5'
+ORGANIZATIONAL_UNIT_ARN = 'arn:aws:organizations::111111111111:ou/o-a1b2c3d4e5/ou-ab12-cdef3456'
+
+
+def account_ids(start, count):
+    return [f'{i:012d}' for i in range(start, start + count)]
+
+
+def assert_distribution_within_limits(distribution):
+    ami_config = distribution['amiDistributionConfiguration']
+    assert len(ami_config.get('targetAccountIds', [])) <= planner.MAX_TARGET_ACCOUNT_IDS
+    assert len(ami_config.get('launchPermission', {}).get('userIds', [])) <= planner.MAX_LAUNCH_PERMISSION_USER_IDS
+    assert len(ami_config['amiTags']) <= planner.MAX_AMI_TAGS
+    assert all(len(value) <= planner.MAX_TAG_VALUE_LENGTH for value in ami_config['amiTags'].values())
+
+
+class TestSplitTagValues:
+
+    def test_short_list_uses_single_tag(self):
+        assert planner.split_tag_values('PublishTargets', ['111111111111', '222222222222']) == {
+            'PublishTargets': '111111111111,222222222222'
+        }
+
+    def test_long_list_uses_numbered_tags(self):
+        tags = planner.split_tag_values('SharingTargets', account_ids(0, 50))
+
+        assert list(tags) == ['SharingTargets', 'SharingTargets2', 'SharingTargets3']
+        assert all(len(value) <= planner.MAX_TAG_VALUE_LENGTH for value in tags.values())
+        assert ','.join(tags.values()).split(',') == account_ids(0, 50)
+
+
+class TestPlanAccountChunks:
+
+    def test_small_lists_fit_single_distribution(self):
+        chunks = planner.plan_account_chunks(account_ids(0, 3), account_ids(100, 3))
+
+        assert chunks == [{
+            'publishingAccountIds': account_ids(0, 3),
+            'sharingAccountIds': account_ids(100, 3),
+            'organizationArns': [],
+            'organizationalUnitArns': []
+        }]
+
+    def test_duplicates_removed_and_sorted(self):
+        chunks = planner.plan_account_chunks(['222222222222', '111111111111', '222222222222'], [''])
+
+        assert chunks == [{
+            'publishingAccountIds': ['111111111111', '222222222222'],
+            'sharingAccountIds': [],
+            'organizationArns': [],
+            'organizationalUnitArns': []
+        }]
+
+    def test_full_chunk_leaves_reserved_tags(self):
+        ami_tags = {'project': 'ec2-imagebuilder-ami-share', 'Pipeline': 'AmiSharePipeline-test'}
+        reserved_tags = planner.reserved_ami_tags(ami_tags)
+        capacity = planner.accounts_per_distribution(planner.MAX_TARGET_ACCOUNT_IDS, reserved_tags=reserved_tags)
+
+        chunk, = planner.plan_account_chunks(account_ids(0, capacity), account_ids(100000, capacity), reserved_tags)
+        distribution, = ami_distribution.get_distributions_configurations(
+            aws_distribution_regions=['eu-west-1'],
+            ami_distribution_name='AmiShare-test-{{ imagebuilder:buildDate }}',
+            publishing_account_ids=chunk['publishingAccountIds'],
+            sharing_account_ids=chunk['sharingAccountIds']
+        )
+        account_tags = distribution['amiDistributionConfiguration']['amiTags']
+
+        # the account lists of a full chunk, the stack tags and the Image Builder tags fit, with headroom to spare
+        assert len(account_tags) + len(ami_tags) + planner.IMAGE_BUILDER_AMI_TAGS <= planner.MAX_AMI_TAGS - planner.AMI_TAG_HEADROOM
+        assert len(planner.plan_account_chunks(account_ids(0, capacity + 1), [], reserved_tags)) == 2
+
+    @pytest.mark.parametrize('publishing_count, sharing_count', [(1000, 1000), (10, 1000), (1000, 0)])
+    def test_thousand_accounts_split_into_valid_distributions(self, publishing_count, sharing_count):
+        publishing_account_ids = account_ids(0, publishing_count)
+        sharing_account_ids = account_ids(100000, sharing_count)
+
+        chunks = planner.plan_account_chunks(publishing_account_ids, sharing_account_ids)
+
+        assert len(chunks) > 1
+        assert sum((chunk['publishingAccountIds'] for chunk in chunks), []) == publishing_account_ids
+        assert sum((chunk['sharingAccountIds'] for chunk in chunks), []) == sharing_account_ids
+
+        for chunk in chunks:
+            distributions = ami_distribution.get_distributions_configurations(
+                aws_distribution_regions=['eu-west-1', 'us-east-1'],
+                ami_distribution_name='AmiShare-test-{{ imagebuilder:buildDate }}',
+                publishing_account_ids=chunk['publishingAccountIds'],
+                sharing_account_ids=chunk['sharingAccountIds']
+            )
+            for distribution in distributions:
+                assert_distribution_within_limits(distribution)
+
+
+class TestOrganizationSharing:
+
+    def test_mixed_sharing_list_split_into_principals(self):
+        principals = planner.split_sharing_principals(
+            ['444444444444', ORGANIZATIONAL_UNIT_ARN, ORGANIZATION_ARN, '333333333333', ORGANIZATION_ARN]
+        )
+
+        assert principals == {
+            'userIds': ['333333333333', '444444444444'],
+            'organizationArns': [ORGANIZATION_ARN],
+            'organizationalUnitArns': [ORGANIZATIONAL_UNIT_ARN]
+        }
+
+    def test_unsupported_arn_rejected(self):
+        with pytest.raises(ValueError):
+            planner.split_sharing_principals(['arn:aws:iam::111111111111:role/example'])
+
+    def test_organization_only_sharing_renders_organization_launch_permission(self):
+        chunk, = planner.plan_account_chunks(['222222222222'], [ORGANIZATION_ARN, ORGANIZATIONAL_UNIT_ARN])
+
+        distribution, = ami_distribution.get_distributions_configurations(
+            aws_distribution_regions=['eu-west-1'],
+            ami_distribution_name='AmiShare-test-{{ imagebuilder:buildDate }}',
+            publishing_account_ids=chunk['publishingAccountIds'],
+            sharing_account_ids=chunk['sharingAccountIds'],
+            organization_arns=chunk['organizationArns'],
+            organizational_unit_arns=chunk['organizationalUnitArns']
+        )
+
+        assert distribution['amiDistributionConfiguration']['launchPermission'] == {
+            'organizationArns': [ORGANIZATION_ARN],
+            'organizationalUnitArns': [ORGANIZATIONAL_UNIT_ARN]
+        }
+
+    def test_organization_arns_shared_in_every_chunk(self):
+        chunks = planner.plan_account_chunks([], account_ids(0, 1000) + [ORGANIZATION_ARN])
+
+        assert len(chunks) > 1
+        assert all(chunk['organizationArns'] == [ORGANIZATION_ARN] for chunk in chunks)
+        assert sum((chunk['sharingAccountIds'] for chunk in chunks), []) == account_ids(0, 1000)
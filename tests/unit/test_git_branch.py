@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from utils.GitBranch import resolve_branch_name
+
+COMMIT = '0123456789abcdef0123456789abcdef01234567'
+OTHER_COMMIT = 'fedcba9876543210fedcba9876543210fedcba98'
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(content)
+
+
+@pytest.fixture()
+def repo(tmp_path):
+    write(str(tmp_path / '.git' / 'HEAD'), 'ref: refs/heads/feature/AMI-42_share\n')
+    os.makedirs(str(tmp_path / 'stacks' / 'amishare'))
+    return tmp_path
+
+
+class TestResolveBranchName:
+
+    def test_symbolic_head(self, repo):
+        assert resolve_branch_name(str(repo)) == 'feature/AMI-42_share'
+
+    def test_resolved_from_subdirectory(self, repo):
+        assert resolve_branch_name(str(repo / 'stacks' / 'amishare')) == 'feature/AMI-42_share'
+
+    def test_linked_worktree(self, repo, tmp_path_factory):
+        worktree = tmp_path_factory.mktemp('worktree')
+        worktree_git_dir = repo / '.git' / 'worktrees' / 'hotfix'
+        write(str(worktree / '.git'), f'gitdir: {worktree_git_dir}\n')
+        write(str(worktree_git_dir / 'HEAD'), 'ref: refs/heads/hotfix\n')
+        write(str(worktree_git_dir / 'commondir'), '../..\n')
+
+        assert resolve_branch_name(str(worktree)) == 'hotfix'
+
+    def test_detached_head_packed_ref(self, repo):
+        write(str(repo / '.git' / 'HEAD'), f'{COMMIT}\n')
+        write(str(repo / '.git' / 'packed-refs'), (
+            '# pack-refs with: peeled fully-peeled sorted\n'
+            f'{COMMIT} refs/heads/main\n'
+            f'{COMMIT} refs/tags/v1.0.0\n'
+            f'^{OTHER_COMMIT}\n'
+            f'{OTHER_COMMIT} refs/heads/develop\n'
+        ))
+
+        assert resolve_branch_name(str(repo)) == 'main'
+
+    def test_detached_head_loose_ref_overrides_packed_ref(self, repo):
+        write(str(repo / '.git' / 'HEAD'), f'{COMMIT}\n')
+        write(str(repo / '.git' / 'packed-refs'), f'{OTHER_COMMIT} refs/heads/main\n{OTHER_COMMIT} refs/heads/develop\n')
+        write(str(repo / '.git' / 'refs' / 'heads' / 'develop'), f'{COMMIT}\n')
+
+        assert resolve_branch_name(str(repo)) == 'develop'
+
+    def test_ambiguous_detached_head_unresolved(self, repo):
+        write(str(repo / '.git' / 'HEAD'), f'{COMMIT}\n')
+        write(str(repo / '.git' / 'refs' / 'heads' / 'main'), f'{COMMIT}\n')
+        write(str(repo / '.git' / 'refs' / 'heads' / 'develop'), f'{COMMIT}\n')
+
+        assert resolve_branch_name(str(repo)) is None
+
+    def test_reftable_repository_unresolved(self, repo):
+        write(str(repo / '.git' / 'HEAD'), 'ref: refs/heads/.invalid\n')
+
+        assert resolve_branch_name(str(repo)) is None
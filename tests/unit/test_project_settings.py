@@ -0,0 +1,479 @@
+import copy
+import json
+import os
+
+import pytest
+
+from utils import ProjectSettings as project_settings
+from utils.ProjectSettings import (
+    BlockDeviceSettings, FastLaunchSettings, ProjectSettingsError, RegionSettings, load_project_settings
+)
+
+VALID_SETTINGS = {
+    "vpc": {
+        "vpc_id": "vpc-0123456789abcdef0",
+        "subnet_id": "subnet-0123456789abcdef0"
+    },
+    "imagebuilder": {
+        "baseImageArn": "amazon-linux-2-x86/2021.4.29",
+        "ebsVolumeSize": 8,
+        "instanceTypes": ["t2.medium"],
+        "version": "1.0.0",
+        "imageBuilderEmailAddress": "email@example.com",
+        "extraTags": {"imagePipeline": "AMIBuilder"},
+        "distributionList": ["account1", "account2"],
+        "amiPublishingRegions": ["eu-west-1", "us-east-1"],
+        "amiPublishingTargetIds": ["111111111111"],
+        "amiSharingIds": ["222222222222", "arn:aws:organizations::111111111111:organization/o-a1b2c3d4e5"]
+    }
+}
+
+
+def write_cdk_json(path, settings):
+    with open(path, 'w') as cdk_json:
+        json.dump({"app": "python3 app.py", "projectSettings": settings}, cdk_json)
+    return str(path)
+
+
+@pytest.fixture()
+def cdk_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+    return write_cdk_json(tmp_path / 'cdk.json', VALID_SETTINGS)
+
+
+class TestValidation:
+
+    def test_valid_settings_loaded(self, cdk_json):
+        settings = load_project_settings(cdk_json)
+
+        assert settings.vpc.vpc_id == "vpc-0123456789abcdef0"
+        assert settings.vpc.endpoints is False
+        assert settings.imagebuilder.ami_publishing_regions == ("eu-west-1", "us-east-1")
+        assert settings.lambda_.runtime == "python3.9"
+        assert settings.lambda_.memory_size == 128
+        assert settings.lambda_.custom_resource_mode == "provider"
+
+    def test_settings_are_immutable(self, cdk_json):
+        settings = load_project_settings(cdk_json)
+
+        with pytest.raises(AttributeError):
+            settings.vpc.vpc_id = "vpc-fedcba9876543210f"
+
+    def test_placeholders_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['vpc']['vpc_id'] = "<<ADD_VPD_ID_HERE>>"
+        settings['imagebuilder']['amiSharingIds'] = ["<<ADD_AMI_SHARING_ACCOUNT_IDS_HERE>>"]
+
+        with pytest.raises(ProjectSettingsError) as error:
+            load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings))
+
+        assert error.value.errors == [
+            "vpc.vpc_id: placeholder <<ADD_VPD_ID_HERE>> has not been replaced",
+            "imagebuilder.amiSharingIds: placeholder <<ADD_AMI_SHARING_ACCOUNT_IDS_HERE>> has not been replaced"
+        ]
+
+    def test_all_errors_reported(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['vpc']['subnet_id'] = 'subnet-x'
+        settings['imagebuilder']['ebsVolumeSize'] = "8"
+        settings['imagebuilder']['amiPublishingTargetIds'] = ["1234"]
+        settings['lambda'] = {"architecture": "sparc", "memorySize": 64}
+
+        with pytest.raises(ProjectSettingsError) as error:
+            load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings))
+
+        assert error.value.errors == [
+            "vpc.subnet_id: invalid value subnet-x",
+            "imagebuilder.ebsVolumeSize: expected int, got str",
+            "imagebuilder.amiPublishingTargetIds: invalid value 1234",
+            "lambda.architecture: expected one of arm64, x86_64, got sparc",
+            "lambda.memorySize: must be between 128 and 10240 MB, got 64"
+        ]
+
+    def test_malformed_organization_arns_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['imagebuilder']['amiSharingIds'] = [
+            "arn:aws:organizations::111111111111:organization/o-abc",
+            "arn:aws:organizations::111111111111:ou/o-a1b2c3d4e5/ou-x",
+            "arn:aws:organizations::111111111111:ou/o-a1b2c3d4e5/ou-ab12-cdef3456"
+        ]
+
+        with pytest.raises(ProjectSettingsError) as error:
+            load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings))
+
+        # the values the distribution planner would reject at synth time
+        assert error.value.errors == [
+            "imagebuilder.amiSharingIds: invalid value arn:aws:organizations::111111111111:organization/o-abc",
+            "imagebuilder.amiSharingIds: invalid value arn:aws:organizations::111111111111:ou/o-a1b2c3d4e5/ou-x"
+        ]
+
+    @pytest.mark.parametrize('runtime', ["python3.8", "python3.6", "python2.7", "nodejs14.x"])
+    def test_unsupported_runtime_rejected(self, tmp_path, monkeypatch, runtime):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['lambda'] = {"runtime": runtime}
+
+        with pytest.raises(ProjectSettingsError) as error:
+            load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings))
+
+        assert error.value.errors == [f"lambda.runtime: expected python3.9 or later, got {runtime}"]
+
+    def test_newer_runtime_accepted(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['lambda'] = {"runtime": "python3.12"}
+
+        assert load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings)).lambda_.runtime == "python3.12"
+
+    def test_invalid_custom_resource_mode_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['lambda'] = {"customResourceMode": "inline"}
+
+        with pytest.raises(ProjectSettingsError) as error:
+            load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings))
+
+        assert error.value.errors == ["lambda.customResourceMode: expected one of provider, direct, got inline"]
+
+
+class TestPipelines:
+
+    def test_default_pipeline_from_imagebuilder_settings(self, cdk_json):
+        pipeline, = load_project_settings(cdk_json).pipelines
+
+        assert pipeline.name == ''
+        assert pipeline.suffix == ''
+        assert pipeline.instance_types == ("t2.medium",)
+        assert pipeline.ami_sharing_ids == tuple(VALID_SETTINGS['imagebuilder']['amiSharingIds'])
+
+    def test_pipelines_inherit_imagebuilder_settings(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['pipelines'] = [
+            {"name": "al2-x86"},
+            {"name": "al2-arm64", "baseImageArn": "amazon-linux-2-arm64/x.x.x", "instanceTypes": ["t4g.medium"]}
+        ]
+
+        x86, arm64 = load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings)).pipelines
+
+        assert (x86.suffix, x86.base_image_arn, x86.instance_types) == ("-al2-x86", "amazon-linux-2-x86/2021.4.29", ("t2.medium",))
+        assert (arm64.suffix, arm64.base_image_arn, arm64.instance_types) == ("-al2-arm64", "amazon-linux-2-arm64/x.x.x", ("t4g.medium",))
+        assert arm64.ami_publishing_regions == x86.ami_publishing_regions == ("eu-west-1", "us-east-1")
+
+    def test_invalid_pipelines_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['pipelines'] = [
+            {"name": "al2"},
+            {"name": "al2", "amiPublishingRegions": ["mars-1"]},
+            {"name": "Windows_2019"}
+        ]
+
+        with pytest.raises(ProjectSettingsError) as error:
+            load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings))
+
+        assert error.value.errors == [
+            "pipelines[1].amiPublishingRegions: invalid value mars-1",
+            "pipelines[2].name: must be lower case alphanumeric characters and dashes, got Windows_2019",
+            "pipelines: duplicate pipeline name al2"
+        ]
+
+    def test_build_mode_per_pipeline(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['imagebuilder']['buildMode'] = 'incremental'
+        settings['pipelines'] = [{"name": "al2-x86"}, {"name": "al2-arm64", "buildMode": "full"}]
+
+        x86, arm64 = load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings)).pipelines
+
+        assert (x86.build_mode, x86.has_foundation, x86.incremental) == ('incremental', True, True)
+        assert (arm64.build_mode, arm64.has_foundation, arm64.incremental) == ('full', False, False)
+
+    def test_invalid_build_mode_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['pipelines'] = [{"name": "al2", "buildMode": "delta"}]
+
+        with pytest.raises(ProjectSettingsError) as error:
+            load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings))
+
+        assert error.value.errors == ["pipelines[0].buildMode: expected one of full, foundation, incremental, got delta"]
+
+
+class TestSchedule:
+
+    @staticmethod
+    def load_schedule(tmp_path, schedule):
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['schedule'] = schedule
+        return load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings)).schedule
+
+    def test_no_schedule_by_default(self, cdk_json):
+        assert load_project_settings(cdk_json).schedule is None
+
+    def test_dependency_updates_start_condition_by_default(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        schedule = self.load_schedule(tmp_path, {"scheduleExpression": "cron(0 2 ? * SUN *)"})
+
+        assert schedule.start_condition == "EXPRESSION_MATCH_AND_DEPENDENCY_UPDATES_AVAILABLE"
+        assert [schedule.schedule_expression_for(i) for i in range(3)] == ["cron(0 2 ? * SUN *)"] * 3
+
+    def test_builds_staggered_in_slots_of_max_concurrent_builds(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        schedule = self.load_schedule(tmp_path, {
+            "scheduleExpression": "cron(45 22 ? * SUN *)",
+            "staggerMinutes": 20,
+            "maxConcurrentBuilds": 2
+        })
+
+        assert [schedule.schedule_expression_for(i) for i in range(6)] == [
+            "cron(45 22 ? * SUN *)", "cron(45 22 ? * SUN *)",
+            "cron(5 23 ? * SUN *)", "cron(5 23 ? * SUN *)",
+            "cron(25 23 ? * SUN *)", "cron(25 23 ? * SUN *)"
+        ]
+        with pytest.raises(ValueError):
+            schedule.schedule_expression_for(8)
+
+    def test_invalid_schedule_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+
+        with pytest.raises(ProjectSettingsError) as error:
+            self.load_schedule(tmp_path, {
+                "scheduleExpression": "cron(0/15 * ? * * *)",
+                "startCondition": "ALWAYS",
+                "staggerMinutes": 10
+            })
+
+        assert error.value.errors == [
+            "schedule.startCondition: expected one of EXPRESSION_MATCH_AND_DEPENDENCY_UPDATES_AVAILABLE, EXPRESSION_MATCH_ONLY, got ALWAYS",
+            "schedule.staggerMinutes: requires a scheduleExpression with fixed minutes and hours"
+        ]
+
+
+class TestBlockDevices:
+
+    @staticmethod
+    def load_pipelines(tmp_path, imagebuilder_block_devices, pipelines):
+        settings = copy.deepcopy(VALID_SETTINGS)
+        if imagebuilder_block_devices is not None:
+            settings['imagebuilder']['blockDevices'] = imagebuilder_block_devices
+        settings['pipelines'] = pipelines
+        return load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings)).pipelines
+
+    def test_gp2_root_volume_by_default(self, cdk_json):
+        pipeline, = load_project_settings(cdk_json).pipelines
+
+        assert pipeline.block_devices == (BlockDeviceSettings('/dev/xvda', 8, 'gp2', None, None),)
+
+    def test_block_devices_per_pipeline(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        gp3 = {'deviceName': '/dev/xvda', 'volumeType': 'gp3', 'iops': 4000, 'throughput': 1000}
+
+        default, io2, resized = self.load_pipelines(tmp_path, [gp3], [
+            {'name': 'default'},
+            {'name': 'io2', 'blockDevices': [gp3, {'deviceName': '/dev/xvdb', 'volumeSize': 100, 'volumeType': 'io2', 'iops': 50000}]},
+            {'name': 'resized', 'ebsVolumeSize': 30}
+        ])
+
+        assert default.block_devices == (BlockDeviceSettings('/dev/xvda', 8, 'gp3', 4000, 1000),)
+        assert [block_device.volume_type for block_device in io2.block_devices] == ['gp3', 'io2']
+        assert resized.block_devices == (BlockDeviceSettings('/dev/xvda', 30, 'gp2', None, None),)
+
+    def test_small_gp3_volume_gets_baseline_iops(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        small = {'deviceName': '/dev/xvda', 'volumeSize': 1, 'volumeType': 'gp3', 'iops': 3000}
+
+        pipeline, = self.load_pipelines(tmp_path, [small], [{'name': 'small'}])
+        assert pipeline.block_devices == (BlockDeviceSettings('/dev/xvda', 1, 'gp3', 3000, None),)
+
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        with pytest.raises(ProjectSettingsError) as error:
+            self.load_pipelines(tmp_path, [dict(small, volumeSize=6, iops=3001)], [{'name': 'small'}])
+
+        assert error.value.errors == [
+            "imagebuilder.blockDevices[0].iops: gp3 volumes support at most 500 IOPS per GiB, got 3001 IOPS for 6 GiB"
+        ]
+
+    def test_invalid_combinations_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+
+        with pytest.raises(ProjectSettingsError) as error:
+            self.load_pipelines(tmp_path, None, [{'name': 'al2', 'blockDevices': [
+                {'deviceName': '/dev/xvda', 'volumeType': 'gp2', 'iops': 3000},
+                {'deviceName': '/dev/xvdb', 'volumeSize': 8, 'volumeType': 'gp3', 'iops': 6000},
+                {'deviceName': '/dev/xvdc', 'volumeType': 'gp3', 'throughput': 1000},
+                {'deviceName': '/dev/xvdd', 'volumeSize': 100, 'volumeType': 'io2'},
+                {'deviceName': '/dev/xvdd', 'volumeSize': 100, 'volumeType': 'io1', 'iops': 6000, 'throughput': 250},
+                {'deviceName': '/dev/nvme1', 'volumeType': 'st1'}
+            ]}])
+
+        assert error.value.errors == [
+            "pipelines[0].blockDevices[0].iops: not supported by gp2 volumes",
+            "pipelines[0].blockDevices[1].iops: gp3 volumes support at most 500 IOPS per GiB, got 6000 IOPS for 8 GiB",
+            "pipelines[0].blockDevices[2].throughput: gp3 volumes support at most 0.25 MiB/s per IOPS, got 1000 MiB/s for 3000 IOPS",
+            "pipelines[0].blockDevices[3].iops: required for io2 volumes",
+            "pipelines[0].blockDevices[4].iops: io1 volumes support at most 50 IOPS per GiB, got 6000 IOPS for 100 GiB",
+            "pipelines[0].blockDevices[4].throughput: not supported by io1 volumes",
+            "pipelines[0].blockDevices[5].deviceName: invalid value /dev/nvme1",
+            "pipelines[0].blockDevices[5].volumeType: expected one of gp2, gp3, io1, io2, got st1",
+            "pipelines[0].blockDevices: duplicate device name /dev/xvdd"
+        ]
+
+
+class TestLaunchAcceleration:
+
+    WINDOWS_BASE_IMAGE = 'windows-server-2019-english-full-base-x86/x.x.x'
+
+    @staticmethod
+    def load_pipelines(tmp_path, pipelines):
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['imagebuilder']['amiPublishingRegions'] = [
+            'us-east-1',
+            {'region': 'eu-west-1', 'fastSnapshotRestoreAvailabilityZones': ['eu-west-1a', 'eu-west-1b']}
+        ]
+        settings['pipelines'] = pipelines
+        return load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings)).pipelines
+
+    def test_region_names_and_objects(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+
+        linux, windows = self.load_pipelines(tmp_path, [
+            {'name': 'linux'},
+            {'name': 'windows', 'baseImageArn': self.WINDOWS_BASE_IMAGE, 'amiPublishingRegions': [
+                {'region': 'eu-west-1', 'fastLaunch': {'targetResourceCount': 10}}
+            ]}
+        ])
+
+        assert linux.ami_publishing_regions == ('us-east-1', 'eu-west-1')
+        assert linux.region_settings == (
+            RegionSettings('us-east-1', (), None),
+            RegionSettings('eu-west-1', ('eu-west-1a', 'eu-west-1b'), None)
+        )
+        assert windows.region_settings == (RegionSettings('eu-west-1', (), FastLaunchSettings(10, 6)),)
+
+    def test_invalid_acceleration_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+
+        with pytest.raises(ProjectSettingsError) as error:
+            self.load_pipelines(tmp_path, [
+                {'name': 'linux', 'amiPublishingRegions': [
+                    {'region': 'eu-west-1', 'fastSnapshotRestoreAvailabilityZones': ['us-east-1a'], 'fastLaunch': {}},
+                    'eu-west-1'
+                ]},
+                {'name': 'windows', 'baseImageArn': self.WINDOWS_BASE_IMAGE, 'amiPublishingRegions': [
+                    {'region': 'eu-west-1', 'fastLaunch': {'targetResourceCount': 0, 'maxParallelLaunches': 2}}
+                ]}
+            ])
+
+        assert error.value.errors == [
+            "pipelines[0].amiPublishingRegions[0].fastSnapshotRestoreAvailabilityZones: us-east-1a is not an availability zone of eu-west-1",
+            "pipelines[0].amiPublishingRegions: duplicate region eu-west-1",
+            "pipelines[1].amiPublishingRegions[0].fastLaunch.targetResourceCount: must be positive, got 0",
+            "pipelines[1].amiPublishingRegions[0].fastLaunch.maxParallelLaunches: must be at least 6, got 2",
+            "pipelines[0]: fastLaunch of region eu-west-1 only applies to Windows base images, got amazon-linux-2-x86/2021.4.29"
+        ]
+
+
+class TestArtifactCache:
+
+    def test_no_artifact_cache_by_default(self, cdk_json):
+        assert load_project_settings(cdk_json).artifact_cache is None
+
+    def test_invalid_artifacts_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['artifactCache'] = {
+            'artifacts': [
+                {'name': 'awscli.zip', 'url': 'https://awscli.amazonaws.com/awscli-exe-linux-x86_64.zip'},
+                {'name': 'awscli.zip', 'url': 'http://example.com/awscli.zip'},
+                {'name': '../etc/passwd', 'url': 'https://example.com/passwd'}
+            ]
+        }
+
+        with pytest.raises(ProjectSettingsError) as error:
+            load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings))
+
+        assert error.value.errors == [
+            "artifactCache.artifacts[1].url: invalid value http://example.com/awscli.zip",
+            "artifactCache.artifacts[2].name: invalid value ../etc/passwd",
+            "artifactCache.artifacts: duplicate artifact name awscli.zip"
+        ]
+
+
+class TestLatestAmiParameters:
+
+    @staticmethod
+    def load(tmp_path, latest_ami_parameters):
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['latestAmiParameters'] = latest_ami_parameters
+        return load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings)).latest_ami_parameters
+
+    def test_no_parameters_by_default(self, cdk_json):
+        assert load_project_settings(cdk_json).latest_ami_parameters is None
+
+    def test_empty_section_uses_default_path(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+
+        latest_ami_parameters = self.load(tmp_path, {})
+
+        assert latest_ami_parameters.path == '/ami-share/latest'
+        assert latest_ami_parameters.sharing_account_role_name is None
+
+    def test_invalid_parameters_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+
+        with pytest.raises(ProjectSettingsError) as error:
+            self.load(tmp_path, {'path': 'ami-share/latest/', 'sharingAccountRoleName': 'role/AmiShareLatestAmi'})
+
+        assert error.value.errors == [
+            "latestAmiParameters.path: invalid value ami-share/latest/",
+            "latestAmiParameters.sharingAccountRoleName: invalid value role/AmiShareLatestAmi"
+        ]
+
+
+class TestNotificationQueue:
+
+    @staticmethod
+    def load(tmp_path, notification_queue):
+        settings = copy.deepcopy(VALID_SETTINGS)
+        settings['notificationQueue'] = notification_queue
+        return load_project_settings(write_cdk_json(tmp_path / 'cdk.json', settings)).notification_queue
+
+    def test_no_queue_by_default(self, cdk_json):
+        assert load_project_settings(cdk_json).notification_queue is None
+
+    def test_empty_section_uses_defaults(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+
+        assert self.load(tmp_path, {}) == project_settings.NotificationQueueSettings(100, 60, 24)
+
+    def test_invalid_batching_rejected(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(project_settings, '_SETTINGS_CACHE', {})
+
+        with pytest.raises(ProjectSettingsError) as error:
+            self.load(tmp_path, {'batchSize': 50, 'maxBatchingWindowSeconds': 0, 'digestPeriodHours': 336})
+
+        assert error.value.errors == [
+            "notificationQueue.maxBatchingWindowSeconds: must be at least 1 for a batchSize of 50",
+            "notificationQueue.digestPeriodHours: must be between 1 and 168, got 336"
+        ]
+
+
+class TestCaching:
+
+    def test_repeated_lookups_reuse_settings(self, cdk_json):
+        assert load_project_settings(cdk_json) is load_project_settings(cdk_json)
+
+    def test_modified_file_reloaded(self, cdk_json):
+        settings = load_project_settings(cdk_json)
+
+        updated = copy.deepcopy(VALID_SETTINGS)
+        updated['imagebuilder']['version'] = "1.0.1"
+        write_cdk_json(cdk_json, updated)
+        os.utime(cdk_json, ns=(0, os.stat(cdk_json).st_mtime_ns + 1))
+
+        assert load_project_settings(cdk_json).imagebuilder.version == "1.0.1"
+        assert settings.imagebuilder.version == "1.0.0"
@@ -0,0 +1,20 @@
+import os
+
+from tests.utils import root_test_case
+
+
+def test_prune_keeps_one_entry_per_variant(tmp_path, monkeypatch):
+    monkeypatch.setattr(root_test_case, 'synth_cache_dir', str(tmp_path))
+    names = [
+        'default-0123456789abcdef', 'default-fedcba9876543210', 'many-regions-0123456789abcdef',
+        'many-accounts-0123456789abcdef', 'gw0-default-x1y2z3', 'main-ab12cd34'
+    ]
+    for name in names:
+        os.makedirs(tmp_path / name)
+
+    root_test_case.prune_synth_cache('default-fedcba9876543210')
+    root_test_case.prune_synth_cache('many-accounts-fedcba9876543210')
+
+    assert sorted(os.listdir(tmp_path)) == [
+        'default-fedcba9876543210', 'gw0-default-x1y2z3', 'main-ab12cd34', 'many-regions-0123456789abcdef'
+    ]
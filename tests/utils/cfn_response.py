@@ -0,0 +1,79 @@
+"""
+    cfn_response.py:
+    Local stand-ins for the pre-signed S3 ResponseURL of CloudFormation
+    custom resource events and for the Lambda context object, used to run
+    the custom resource handlers that send their response themselves.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class LambdaContext():
+
+    def __init__(self, timeout_seconds: float = 30, log_stream_name: str = '2021/11/08/[$LATEST]0123456789abcdef'):
+        self.deadline = time.monotonic() + timeout_seconds
+        self.log_stream_name = log_stream_name
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+class ResponseServer():
+    """
+        HTTP server on localhost that records the custom resource responses
+        PUT to its url, with the time.perf_counter() at which they arrived.
+    """
+
+    def __init__(self):
+        self.responses = []
+        self.received = threading.Condition()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_PUT(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                self.send_response(200)
+                self.end_headers()
+                with server.received:
+                    server.responses.append((time.perf_counter(), self.headers.get('Content-Type'), json.loads(body)))
+                    server.received.notify_all()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}/response'
+
+    def wait_for_response(self, count: int = 1, timeout: float = 30) -> tuple:
+        """Return the count-th (received time, content type, body) response, waiting for it up to timeout seconds."""
+        with self.received:
+            if not self.received.wait_for(lambda: len(self.responses) >= count, timeout):
+                raise TimeoutError(f"No custom resource response received within {timeout} seconds")
+            return self.responses[count - 1]
+
+    def __enter__(self) -> 'ResponseServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def custom_resource_event(response_url: str, resource_properties: dict, request_type: str = 'Create') -> dict:
+    return {
+        'RequestType': request_type,
+        'ResponseURL': response_url,
+        'StackId': 'arn:aws:cloudformation:us-east-1:111111111111:stack/AmiShare-test/00000000-0000-0000-0000-000000000000',
+        'RequestId': '11111111-1111-1111-1111-111111111111',
+        'ResourceType': 'AWS::CloudFormation::CustomResource',
+        'LogicalResourceId': 'AmiDistributionDirectCustomResource',
+        'ResourceProperties': resource_properties
+    }
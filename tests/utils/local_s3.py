@@ -0,0 +1,83 @@
+"""
+    local_s3.py:
+    Directory backed stand-in for S3, serving both the boto3 client calls
+    of the artifact pre-staging and the "aws s3 cp" commands of the
+    artifact cache component. Objects are stored as root/bucket/key.
+"""
+
+import os
+import stat
+
+from botocore.exceptions import ClientError
+
+AWS_CLI_SCRIPT = """#!/bin/bash
+# aws s3 cp [--options] <source> <destination>, against the objects below {root}
+operands=()
+for argument in "$@"; do
+    case "$argument" in
+        --*) ;;
+        *) operands+=("$argument") ;;
+    esac
+done
+local_path() {{
+    case "$1" in
+        s3://*) echo "{root}/${{1#s3://}}" ;;
+        *) echo "$1" ;;
+    esac
+}}
+source_path=$(local_path "${{operands[2]}}")
+destination_path=$(local_path "${{operands[3]}}")
+if [ ! -f "$source_path" ]; then
+    echo "fatal error: An error occurred (404) when calling the HeadObject operation: Not Found" >&2
+    exit 1
+fi
+mkdir -p "$(dirname "$destination_path")"
+cp "$source_path" "$destination_path"
+"""
+
+
+def write_executable(path: str, content: str) -> str:
+    with open(path, 'w') as executable:
+        executable.write(content)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+class LocalS3():
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def object_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, key)
+
+    def put(self, bucket: str, key: str, body: bytes) -> None:
+        path = self.object_path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as s3_object:
+            s3_object.write(body)
+
+    def get(self, bucket: str, key: str) -> bytes:
+        """The content of the object, None when there is no such object."""
+        try:
+            with open(self.object_path(bucket, key), 'rb') as s3_object:
+                return s3_object.read()
+        except FileNotFoundError:
+            return None
+
+    # boto3 S3 client calls
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        path = self.object_path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': os.path.getsize(path)}
+
+    def upload_fileobj(self, Fileobj, Bucket: str, Key: str) -> None:
+        self.put(Bucket, Key, Fileobj.read())
+
+    # aws cli
+
+    def install_aws_cli(self, bin_dir: str) -> str:
+        """Write an "aws" command to bin_dir that copies objects from and to this stand-in."""
+        return write_executable(os.path.join(bin_dir, 'aws'), AWS_CLI_SCRIPT.format(root=self.root))
@@ -1,17 +1,36 @@
+import copy
 import fnmatch
+import functools
+import hashlib
 import json
 import os
 import pytest
 import re
+import shutil
+import tempfile
 import typing
-from cdk_expects_matcher.CdkMatchers import have_resource, ANY_VALUE
+from importlib.metadata import version
+from cdk_expects_matcher.CdkMatchers import ANY_VALUE
 from expects import expect
 from unittest import TestCase
+from tests.utils.settings_variants import BASE_SETTINGS, DEFAULT_VARIANT, SETTINGS_VARIANTS
+from tests.utils.template_index import TemplateIndex, have_resource
 from utils.CdkUtils import CdkUtils
+from utils.ProjectSettings import ProjectSettings
 
 cdk_out_dir = 'cdk.out'
 suffix = 'template.json'
 
+# Synthesised cloud assemblies are cached below this directory, keyed by
+# a hash of everything that goes into the synthesis.
+synth_cache_dir = os.path.join(cdk_out_dir, 'test-synth-cache')
+
+# Sources, lambda assets, settings and context that determine the synthesised templates
+synth_inputs = [
+    'stacks', 'utils', 'cdk.json', 'cdk.context.json',
+    os.path.relpath(__file__), os.path.join(os.path.dirname(os.path.relpath(__file__)), 'settings_variants.py')
+]
+
 
 def find(pattern, path):
     result = []
@@ -30,10 +49,113 @@ def read(file_path):
     return cfn_template
 
 
+def synth_environment() -> dict:
+    return {
+        'account': os.getenv('CDK_DEFAULT_ACCOUNT', '111111111111'),
+        'region': os.getenv('CDK_DEFAULT_REGION', 'us-east-1')
+    }
+
+
+def variant_settings(variant: str = DEFAULT_VARIANT) -> ProjectSettings:
+    """The base test settings with the overrides of the settings variant applied."""
+    settings = copy.deepcopy(BASE_SETTINGS)
+    for section, overrides in SETTINGS_VARIANTS[variant].items():
+        if isinstance(overrides, dict):
+            settings.setdefault(section, {}).update(overrides)
+        else:
+            settings[section] = overrides
+    return ProjectSettings.from_dict(settings)
+
+
+def synth_cache_key(variant: str = DEFAULT_VARIANT) -> str:
+    """Hash of the synthesis inputs, the settings variant, the stack tag, the target environment and the CDK version."""
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(
+        [SETTINGS_VARIANTS[variant], CdkUtils.stack_tag, synth_environment(), version('aws-cdk.core')],
+        sort_keys=True
+    ).encode('utf-8'))
+    for synth_input in synth_inputs:
+        paths = [synth_input] if os.path.isfile(synth_input) else sorted(
+            os.path.join(root, name)
+            for root, dirs, files in os.walk(synth_input)
+            if '__pycache__' not in root
+            for name in files
+            if not name.endswith('.pyc')
+        )
+        for path in paths:
+            hasher.update(path.encode('utf-8'))
+            with open(path, 'rb') as file:
+                hasher.update(hashlib.sha256(file.read()).digest())
+    return f'{variant}-{hasher.hexdigest()[:16]}'
+
+
+def synth_context() -> dict:
+    """The context the CDK CLI would pass to the app: cdk.json context and cached lookups."""
+    context = {
+        # enabled by default by the CDK CLI, the tests match on aws:cdk:path metadata
+        'aws:cdk:enable-path-metadata': True,
+        'aws:cdk:enable-asset-metadata': True
+    }
+    for context_file, key in [('cdk.json', 'context'), ('cdk.context.json', None)]:
+        if os.path.isfile(context_file):
+            data = read(context_file)
+            context.update(data.get(key, {}) if key else data)
+    return context
+
+
+def prune_synth_cache(cache_key: str):
+    """
+        Remove the cached assemblies of the variant of the cache key that were
+        synthesised from other inputs, keeping one entry per variant. Temporary
+        synthesis directories of other workers never match an entry name.
+    """
+    variant = cache_key.rsplit('-', 1)[0]
+    entry = re.compile(rf'^{re.escape(variant)}-[0-9a-f]{{16}}$')
+    for name in os.listdir(synth_cache_dir):
+        if name != cache_key and entry.match(name):
+            shutil.rmtree(os.path.join(synth_cache_dir, name), ignore_errors=True)
+
+
+@functools.lru_cache(maxsize=None)
+def synth_assembly_dir(variant: str = DEFAULT_VARIANT) -> str:
+    """
+        Synthesise the AmiShareStack in-process for the settings variant, unless
+        a cloud assembly for the current inputs is already cached, and return
+        the assembly directory.
+
+        Every synthesis writes to a directory of its own, so that pytest-xdist
+        workers can synthesise side by side, and is then published under
+        its cache key. The stale assemblies of the variant are then pruned.
+    """
+    assembly_dir = os.path.join(synth_cache_dir, synth_cache_key(variant))
+    if os.path.isfile(os.path.join(assembly_dir, 'manifest.json')):
+        return assembly_dir
+
+    from aws_cdk import core
+    from stacks.amishare.ami_share import AmiShareStack
+
+    os.makedirs(synth_cache_dir, exist_ok=True)
+    out_dir = tempfile.mkdtemp(dir=synth_cache_dir, prefix=f"{os.getenv('PYTEST_XDIST_WORKER', 'main')}-")
+    app = core.App(context=synth_context(), outdir=out_dir)
+    AmiShareStack(
+        app, f"EC2ImageBuilderAmiShare-{CdkUtils.stack_tag}",
+        project_settings=variant_settings(variant),
+        env=core.Environment(**synth_environment())
+    )
+    app.synth()
+
+    # publish the assembly atomically, another worker may have won the race
+    try:
+        os.rename(out_dir, assembly_dir)
+    except OSError:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    prune_synth_cache(os.path.basename(assembly_dir))
+    return assembly_dir
+
+
 @pytest.fixture(scope="session")
 def synth(request):
-    os.system('rm -rf ./cdk.out/')
-    os.system('cdk synth --json')
+    synth_assembly_dir()
 
 
 class RootTestCase(TestCase):
@@ -84,6 +206,8 @@ class RootTestCase(TestCase):
     imagebuilder_distribution_config = 'AWS::ImageBuilder::DistributionConfiguration'
     sns_topic = 'AWS::SNS::Topic'
     sns_subscription = 'AWS::SNS::Subscription'
+    sqs_queue = 'AWS::SQS::Queue'
+    lambda_event_source_mapping = 'AWS::Lambda::EventSourceMapping'
     ec2_security_group = 'AWS::EC2::SecurityGroup'
     elastic_cache_subnet_group = 'AWS::ElastiCache::SubnetGroup'
     elastic_cache_replication_group = 'AWS::ElastiCache::ReplicationGroup'
@@ -101,26 +225,32 @@ class RootTestCase(TestCase):
 
     __test__ = False
 
+    @property
+    def template_index(self) -> TemplateIndex:
+        return TemplateIndex.of(self.cfn_template)
+
     def test_s3_bucket_encryption(self):
-        assert self.get_template_str().count(f'"{self.s3_bucket}"') == \
-               self.get_template_str().count('"SSEAlgorithm":"aws:kms"') == \
-               self.get_template_str().count('"ServerSideEncryptionConfiguration"') == \
-               self.get_template_str().count('"BucketEncryption"')
+        index = self.template_index
+        assert index.count_type(self.s3_bucket) == \
+               index.count('"SSEAlgorithm":"aws:kms"') == \
+               index.count('"ServerSideEncryptionConfiguration"') == \
+               index.count('"BucketEncryption"')
 
     def test_s3_block_public_access(self):
-        assert self.get_template_str().count(f'"{self.s3_bucket}"') == \
-               self.get_template_str().count('"PublicAccessBlockConfiguration"') == \
-               self.get_template_str().count('"BlockPublicAcls":true') == \
-               self.get_template_str().count('"BlockPublicPolicy":true') == \
-               self.get_template_str().count('"IgnorePublicAcls":true') == \
-               self.get_template_str().count('"RestrictPublicBuckets":true')
+        index = self.template_index
+        assert index.count_type(self.s3_bucket) == \
+               index.count('"PublicAccessBlockConfiguration"') == \
+               index.count('"BlockPublicAcls":true') == \
+               index.count('"BlockPublicPolicy":true') == \
+               index.count('"IgnorePublicAcls":true') == \
+               index.count('"RestrictPublicBuckets":true')
 
     def test_kms_key_rotation_enabled(self):
-        assert self.get_template_str().count(f'"{self.kms_key}"') == \
-               self.get_template_str().count('"EnableKeyRotation":true')
+        assert self.template_index.count_type(self.kms_key) == \
+               self.template_index.count('"EnableKeyRotation":true')
 
     def test_s3_bucket_baseline(self):
-        if self.get_template_str().count(f'"{self.s3_bucket}"'):
+        if self.template_index.count_type(self.s3_bucket):
             expect(self.cfn_template).to(have_resource(self.s3_bucket, {
                 "BucketEncryption": {
                     "ServerSideEncryptionConfiguration": [
@@ -141,10 +271,10 @@ class RootTestCase(TestCase):
 
     def test_s3_bucket_enforce_encryption_policy_applied(self):
 
-        assert self.get_template_str().count(f'"{self.s3_bucket_policy}"') == \
-               self.get_template_str().count(f'"{self.s3_bucket}"')
+        assert self.template_index.count_type(self.s3_bucket_policy) == \
+               self.template_index.count_type(self.s3_bucket)
 
-        if self.get_template_str().count(f'"{self.s3_bucket_policy}"'):
+        if self.template_index.count_type(self.s3_bucket_policy):
             expect(self.cfn_template).to(have_resource(self.s3_bucket_policy, {
                 "Bucket": {
                     "Ref": ANY_VALUE
@@ -189,10 +319,10 @@ class RootTestCase(TestCase):
             }))
 
     def test_no_iam_users_created(self):
-        assert self.iam_user not in self.get_template_str()
+        assert self.template_index.count_type(self.iam_user) == 0
 
     def test_no_iam_groups_created(self):
-        assert self.iam_group not in self.get_template_str()
+        assert self.template_index.count_type(self.iam_group) == 0
 
     def exists(self, value):
         exists = False
@@ -205,8 +335,8 @@ class RootTestCase(TestCase):
         return exists
 
     def get_template_str(self):
-        return json.dumps(self.cfn_template).replace(' ', '')
+        return self.template_index.template_str
 
     @staticmethod
-    def load_stack_template(stack_name: str):
-        return read(f'{cdk_out_dir}/EC2ImageBuilderAmiShare-{CdkUtils.stack_tag}.{suffix}')
+    def load_stack_template(stack_name: str, variant: str = DEFAULT_VARIANT):
+        return read(f'{synth_assembly_dir(variant)}/EC2ImageBuilderAmiShare-{CdkUtils.stack_tag}.{suffix}')
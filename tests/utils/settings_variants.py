@@ -0,0 +1,210 @@
+"""
+    settings_variants.py:
+    Matrix of projectSettings variants the stack is synthesised and tested
+    with. Every variant lists the settings it overrides, per section, on
+    top of BASE_SETTINGS. List valued sections, such as "pipelines",
+    replace the section of BASE_SETTINGS.
+
+    The tests do not read the projectSettings of cdk.json, which hold the
+    placeholders a deployer replaces, so that they need no setup and do
+    not change with the deployment settings.
+"""
+
+DEFAULT_VARIANT = 'default'
+
+# projectSettings of cdk.json, with valid ids in place of the placeholders
+BASE_SETTINGS = {
+    'lambda': {
+        'runtime': 'python3.9',
+        'architecture': 'arm64',
+        'memorySize': 256,
+        'logLevel': 'INFO'
+    },
+    'vpc': {
+        'vpc_id': 'vpc-0123456789abcdef0',
+        'subnet_id': 'subnet-0123456789abcdef0'
+    },
+    'imagebuilder': {
+        'baseImageArn': 'amazon-linux-2-x86/2021.4.29',
+        'ebsVolumeSize': 8,
+        'instanceTypes': ['t2.medium'],
+        'version': '1.0.0',
+        'imageBuilderEmailAddress': 'email@example.com',
+        'extraTags': {'imagePipeline': 'AMIBuilder'},
+        'distributionList': ['account1', 'account2'],
+        'amiPublishingRegions': ['us-east-1', 'eu-west-1'],
+        'amiPublishingTargetIds': ['111111111111'],
+        'amiSharingIds': ['222222222222']
+    }
+}
+
+
+def account_ids(start, count):
+    return [f'{i:012d}' for i in range(start, start + count)]
+
+
+SETTINGS_VARIANTS = {
+    DEFAULT_VARIANT: {},
+    'many-regions': {
+        'imagebuilder': {
+            'amiPublishingRegions': [
+                'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1',
+                'eu-central-1', 'eu-west-1', 'eu-west-2', 'eu-west-3', 'eu-north-1',
+                'eu-south-1', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3',
+                'ap-southeast-1', 'ap-southeast-2', 'ap-east-1', 'sa-east-1', 'me-south-1'
+            ]
+        }
+    },
+    'many-accounts': {
+        'imagebuilder': {
+            'amiPublishingTargetIds': account_ids(0, 2000),
+            'amiSharingIds': account_ids(100000, 3000)
+        }
+    },
+    'organization-sharing': {
+        'imagebuilder': {
+            'amiSharingIds': [
+                '222222222222',
+                'arn:aws:organizations::111111111111:organization/o-a1b2c3d4e5',
+                'arn:aws:organizations::111111111111:ou/o-a1b2c3d4e5/ou-ab12-cdef3456'
+            ]
+        }
+    },
+    'multi-pipeline': {
+        'pipelines': [
+            {
+                'name': 'al2-x86',
+                'baseImageArn': 'amazon-linux-2-x86/x.x.x',
+                'instanceTypes': ['t3.medium']
+            },
+            {
+                'name': 'al2-arm64',
+                'baseImageArn': 'amazon-linux-2-arm64/x.x.x',
+                'instanceTypes': ['t4g.medium', 'm6g.large'],
+                'amiPublishingRegions': ['eu-west-1', 'eu-central-1'],
+                'amiSharingIds': account_ids(200000, 2000)
+            }
+        ]
+    },
+    'scheduled': {
+        'schedule': {
+            'scheduleExpression': 'cron(0 20 ? * SUN *)',
+            'staggerMinutes': 30,
+            'maxConcurrentBuilds': 2
+        },
+        'imagebuilder': {
+            'amiSharingIds': account_ids(100000, 3000)
+        },
+        'pipelines': [
+            {'name': 'al2-x86'},
+            {'name': 'al2-arm64', 'baseImageArn': 'amazon-linux-2-arm64/x.x.x', 'instanceTypes': ['t4g.medium']}
+        ]
+    },
+    'incremental': {
+        'schedule': {
+            'scheduleExpression': 'cron(0 20 ? * SUN *)',
+            'staggerMinutes': 45
+        },
+        'pipelines': [
+            {'name': 'al2-x86', 'buildMode': 'incremental'},
+            {'name': 'al2-arm64', 'baseImageArn': 'amazon-linux-2-arm64/x.x.x', 'buildMode': 'foundation'},
+            {'name': 'al2-legacy'}
+        ]
+    },
+    'vpc-endpoints': {
+        'vpc': {
+            'endpoints': True
+        }
+    },
+    'artifact-cache': {
+        'artifactCache': {
+            'artifacts': [
+                {
+                    'name': 'awscli-exe-linux-x86_64.zip',
+                    'url': 'https://awscli.amazonaws.com/awscli-exe-linux-x86_64.zip',
+                    'install': 'unzip -q -o awscli-exe-linux-x86_64.zip && ./aws/install --update'
+                }
+            ]
+        },
+        'pipelines': [
+            {'name': 'al2-x86', 'buildMode': 'incremental'},
+            {'name': 'al2-legacy'}
+        ]
+    },
+    'storage-profile': {
+        'imagebuilder': {
+            'blockDevices': [
+                {'deviceName': '/dev/xvda', 'volumeSize': 16, 'volumeType': 'gp3', 'iops': 6000, 'throughput': 500}
+            ]
+        },
+        'pipelines': [
+            {'name': 'al2-x86'},
+            {
+                'name': 'al2-io',
+                'blockDevices': [
+                    {'deviceName': '/dev/xvda', 'volumeSize': 32, 'volumeType': 'gp3'},
+                    {'deviceName': '/dev/xvdb', 'volumeSize': 200, 'volumeType': 'io2', 'iops': 20000}
+                ]
+            },
+            {'name': 'al2-gp2', 'ebsVolumeSize': 20}
+        ]
+    },
+    'launch-acceleration': {
+        'imagebuilder': {
+            'amiPublishingRegions': [
+                {'region': 'us-east-1', 'fastSnapshotRestoreAvailabilityZones': ['us-east-1a', 'us-east-1b']},
+                'eu-west-1'
+            ]
+        },
+        'pipelines': [
+            {'name': 'al2-x86'},
+            {
+                'name': 'windows-2019',
+                'baseImageArn': 'windows-server-2019-english-full-base-x86/x.x.x',
+                'amiPublishingRegions': [
+                    'us-east-1',
+                    {'region': 'eu-west-1', 'fastLaunch': {'targetResourceCount': 10, 'maxParallelLaunches': 12}}
+                ]
+            }
+        ]
+    },
+    'latest-ami-parameters': {
+        'latestAmiParameters': {
+            'path': '/golden-images/latest',
+            'sharingAccountRoleName': 'AmiShareLatestAmi'
+        },
+        'pipelines': [
+            {'name': 'al2-x86'},
+            {'name': 'al2-arm64', 'baseImageArn': 'amazon-linux-2-arm64/x.x.x', 'amiPublishingRegions': ['eu-west-1']}
+        ]
+    },
+    'notification-queue': {
+        'notificationQueue': {
+            'batchSize': 500,
+            'maxBatchingWindowSeconds': 120,
+            'digestPeriodHours': 12
+        },
+        'pipelines': [
+            {'name': 'al2-x86'},
+            {'name': 'al2-arm64', 'baseImageArn': 'amazon-linux-2-arm64/x.x.x'}
+        ]
+    },
+    'direct-custom-resource': {
+        'lambda': {
+            'customResourceMode': 'direct'
+        },
+        'pipelines': [
+            {'name': 'al2-x86'},
+            {'name': 'al2-arm64', 'baseImageArn': 'amazon-linux-2-arm64/x.x.x'}
+        ]
+    },
+    'instance-types': {
+        'imagebuilder': {
+            'instanceTypes': ['t3.medium', 'm5.large', 'c5.xlarge']
+        },
+        'lambda': {
+            'architecture': 'x86_64',
+            'memorySize': 1024
+        }
+    }
+}
@@ -0,0 +1,92 @@
+"""
+    template_index.py:
+    Index over a synthesised CloudFormation template, built once per
+    template and shared by the assertions of the test cases.
+"""
+
+import functools
+import json
+from collections import Counter
+
+from cdk_expects_matcher import CdkMatchers
+
+
+class TemplateIndex():
+    """
+        Resource type counts, lookups by logical id and by aws:cdk:path
+        metadata, and the normalised template string used for substring
+        and regex assertions.
+    """
+
+    # Indexes keyed by the id of the template they were built from. The
+    # template is kept alongside the index so that its id can not be reused.
+    _indexes = {}
+
+    def __init__(self, cfn_template: dict):
+        self.cfn_template = cfn_template
+        self.resources = cfn_template.get('Resources', {})
+        self.type_counts = Counter()
+        self.by_type = {}
+        self.by_path = {}
+        self.path_segments = {}
+
+        for logical_id, resource in self.resources.items():
+            resource_type = resource['Type']
+            self.type_counts[resource_type] += 1
+            self.by_type.setdefault(resource_type, {})[logical_id] = resource
+
+            metadata_path = resource.get('Metadata', {}).get('aws:cdk:path')
+            if metadata_path:
+                self.by_path[metadata_path] = resource
+                self.path_segments.setdefault(resource_type, set()).update(str(metadata_path).split('/'))
+
+    @classmethod
+    def of(cls, cfn_template: dict) -> 'TemplateIndex':
+        """Return the index of cfn_template, building it on first use."""
+        cached = cls._indexes.get(id(cfn_template))
+        if cached is None or cached.cfn_template is not cfn_template:
+            cached = cls._indexes[id(cfn_template)] = cls(cfn_template)
+        return cached
+
+    @functools.cached_property
+    def template_str(self) -> str:
+        """The template serialised as JSON, with all spaces removed."""
+        return json.dumps(self.cfn_template).replace(' ', '')
+
+    @functools.lru_cache(maxsize=None)
+    def count(self, value: str) -> int:
+        """Number of occurrences of value in the normalised template string."""
+        return self.template_str.count(value)
+
+    def count_type(self, resource_type: str) -> int:
+        return self.type_counts[resource_type]
+
+    def resource(self, logical_id: str) -> dict:
+        return self.resources.get(logical_id)
+
+    def resources_of_type(self, resource_type: str) -> dict:
+        return self.by_type.get(resource_type, {})
+
+    def resource_at_path(self, metadata_path: str) -> dict:
+        return self.by_path.get(metadata_path)
+
+    def has_path_segment(self, resource_type: str, segment: str) -> bool:
+        """Whether a resource of resource_type has segment in its aws:cdk:path."""
+        return segment in self.path_segments.get(resource_type, ())
+
+
+class have_resource(CdkMatchers.have_resource):
+    """cdk_expects_matcher have_resource, matching only the resources of the expected type."""
+
+    def _match(self, cfn_template):
+        resources = TemplateIndex.of(cfn_template).resources_of_type(self._type)
+        return super()._match({'Resources': resources})
+
+
+class contain_metadata_path(CdkMatchers.contain_metadata_path):
+    """cdk_expects_matcher contain_metadata_path, answered from the aws:cdk:path index."""
+
+    def _match(self, cfn_template):
+        if TemplateIndex.of(cfn_template).has_path_segment(self._type, self._expected):
+            return True, ["Cloudformation resource exists"]
+        return False, ["Cloudformation resource doesn't exist"]
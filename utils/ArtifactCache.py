@@ -0,0 +1,104 @@
+"""
+    ArtifactCache.py:
+    Fetch script of the artifact cache component and synth-time
+    pre-staging of the artifacts into the artifact cache bucket.
+
+    The build instances copy every artifact from the cache bucket and
+    only download it from its upstream url on a cache miss, storing it
+    in the bucket for the next build. Pre-staging uploads the artifacts
+    that are missing from the bucket before the first build needs them.
+"""
+
+import logging
+import shlex
+import urllib.request
+
+ARTIFACT_CACHE_PREFIX = 'artifacts'
+ARTIFACT_DIRECTORY = '/imagebuilder/artifacts'
+DOWNLOAD_TIMEOUT_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+def artifact_cache_bucket_parameter(stack_tag: str) -> str:
+    """Name of the SSM parameter holding the name of the artifact cache bucket of stack_tag."""
+    return f'/{stack_tag}-AmiShare/ArtifactCacheBucket'
+
+
+def artifact_key(name: str) -> str:
+    return f'{ARTIFACT_CACHE_PREFIX}/{name}'
+
+
+def fetch_script(bucket_name: str, artifacts, directory: str = ARTIFACT_DIRECTORY) -> str:
+    """
+        Bash script that fetches artifacts into directory, from the cache
+        bucket or, on a miss, from their url, and then runs their install
+        commands from directory. The aws cli must be installed, without it
+        every fetch would bypass the cache.
+    """
+    lines = [
+        'set -eu',
+        'command -v aws > /dev/null || { echo "The artifact cache requires the aws cli" >&2; exit 1; }',
+        f'cache="s3://{bucket_name}/{ARTIFACT_CACHE_PREFIX}"',
+        f'mkdir -p {shlex.quote(directory)}',
+        f'cd {shlex.quote(directory)}',
+        'fetch() {',
+        '    if aws s3 cp --only-show-errors "$cache/$1" "$1"; then',
+        '        echo "Artifact cache hit: $1"',
+        '    else',
+        '        echo "Artifact cache miss: $1, downloading $2"',
+        '        curl --fail --silent --show-error --location --retry 3 --output "$1" "$2"',
+        '        aws s3 cp --only-show-errors "$1" "$cache/$1" || echo "Could not store $1 in the artifact cache"',
+        '    fi',
+        '}'
+    ]
+    lines.extend(f'fetch {shlex.quote(artifact.name)} {shlex.quote(artifact.url)}' for artifact in artifacts)
+    lines.extend(artifact.install for artifact in artifacts if artifact.install)
+    return '\n'.join(lines) + '\n'
+
+
+def download(url: str):
+    return urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT_SECONDS)
+
+
+def prestage_artifacts(s3_client, bucket_name: str, artifacts, fetch=download) -> list:
+    """
+        Upload the artifacts that are missing from bucket_name, streamed
+        from the file objects returned by fetch for their url. Returns the
+        names of the uploaded artifacts.
+    """
+    # botocore is only needed when pre-staging, not to synthesise the stack
+    from botocore.exceptions import ClientError
+
+    staged = []
+    for artifact in artifacts:
+        key = artifact_key(artifact.name)
+        try:
+            s3_client.head_object(Bucket=bucket_name, Key=key)
+            logger.info(f"Artifact {artifact.name} already staged in {bucket_name}")
+            continue
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+                raise
+
+        logger.info(f"Staging artifact {artifact.name} from {artifact.url} in {bucket_name}")
+        with fetch(artifact.url) as body:
+            s3_client.upload_fileobj(body, bucket_name, key)
+        staged.append(artifact.name)
+    return staged
+
+
+def prestage_stack_artifacts(stack_tag: str, artifacts, region: str = None) -> list:
+    """
+        Pre-stage artifacts in the artifact cache bucket of the deployed
+        stack_tag stack, skipping stacks that have not been deployed yet.
+    """
+    import boto3
+
+    ssm_client = boto3.client('ssm', region_name=region)
+    try:
+        bucket_name = ssm_client.get_parameter(Name=artifact_cache_bucket_parameter(stack_tag))['Parameter']['Value']
+    except ssm_client.exceptions.ParameterNotFound:
+        logger.warning(f"No artifact cache bucket deployed for {stack_tag}, artifacts are staged by the first build")
+        return []
+    return prestage_artifacts(boto3.client('s3', region_name=region), bucket_name, artifacts)
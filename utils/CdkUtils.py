@@ -5,11 +5,15 @@ from aws_cdk import (
 import os
 import hashlib
 import re
-import json
 from jsii.python import classproperty
+from utils.GitBranch import resolve_branch_name
+from utils.ProjectSettings import ACCOUNT_ID_PATTERN, REGION_PATTERN, ProjectSettings, load_project_settings
 
 _STACK_TAG = None
 
+# Maximum size of a standard tier SSM parameter value
+SSM_PARAMETER_MAX_LENGTH = 4096
+
 class CdkUtils():
 
     @classproperty
@@ -36,25 +40,61 @@ class CdkUtils():
         if _STACK_TAG is None:
             if "STACK_TAG" in os.environ:
                 # An environment variable that can be used to define the stack suffix.
-                _STACK_TAG = os.environ["STACK_TAG"]
+                # It is slugged like a branch name, as Image Builder lowercases the
+                # recipe names in its image ARNs.
+                _STACK_TAG = CdkUtils.tag_slug(os.environ["STACK_TAG"])
             else:
-                from git import Repo
-
                 # If the stack tag is not provided in the OS environment, then it is
                 # calculated from the Git branch that is currently checked out.
-                repo = Repo(path=os.getcwd())
-                branch_name = repo.active_branch.name
+                # The branch is read from the git files directly, GitPython is
+                # only imported for repositories that can not be read that way.
+                branch_name = resolve_branch_name(os.getcwd())
+                if branch_name is None:
+                    from git import Repo
+
+                    repo = Repo(path=os.getcwd(), search_parent_directories=True)
+                    branch_name = repo.active_branch.name
 
-                # Create a "slug" from the branch name, by replacing all
-                # non-alphanumeric characters in the branch name with a dash.
-                _STACK_TAG = re.sub(
-                    r"""[^a-zA-Z0-9-]""",
-                    r"""-""",
-                    branch_name
-                ).lower()
+                _STACK_TAG = CdkUtils.tag_slug(branch_name)
 
         return _STACK_TAG
 
+    @staticmethod
+    def tag_slug(name: str) -> str:
+        """Create a "slug" from a branch or tag name, by replacing all
+        non-alphanumeric characters in the name with a dash.
+        """
+        return re.sub(
+            r"""[^a-zA-Z0-9-]""",
+            r"""-""",
+            name
+        ).lower()
+
+    @staticmethod
+    def get_context_list(scope: core.Construct, key: str) -> list:
+        """A list valued context entry, given either as a list in cdk.json
+        or as a comma separated string on the command line (-c key=a,b).
+        """
+        value = scope.node.try_get_context(key)
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = value.split(',')
+        return [item.strip() for item in value if item.strip()]
+
+    @staticmethod
+    def get_context_environments(scope: core.Construct, key: str) -> list:
+        """The (account, region) pairs of a context list of "account/region"
+        entries. Raises a ValueError naming the first malformed entry.
+        """
+        environments = []
+        for entry in CdkUtils.get_context_list(scope, key):
+            parts = entry.split('/')
+            if len(parts) != 2 or not ACCOUNT_ID_PATTERN.match(parts[0]) or not REGION_PATTERN.match(parts[1]):
+                raise ValueError(f"{key}: invalid entry {entry}, expected <12 digit account id>/<region>")
+            environments.append((parts[0], parts[1]))
+        return environments
+
     @classproperty
     def bootstrap_qualifier(self) -> str:
         hasher = hashlib.sha256()
@@ -62,8 +102,34 @@ class CdkUtils():
         return hasher.hexdigest()[-10:]
 
     @staticmethod
-    def get_project_settings():
-        filename = "cdk.json"
-        with open(filename, 'r') as cdk_json:
-            data = cdk_json.read()
-        return json.loads(data).get("projectSettings")
\ No newline at end of file
+    def get_project_settings(filename: str = "cdk.json") -> ProjectSettings:
+        """The validated project settings of cdk.json. The settings are cached
+        and only loaded again when the file has been modified.
+        """
+        return load_project_settings(filename)
+
+    @staticmethod
+    def split_string_list(values: list, max_length: int = SSM_PARAMETER_MAX_LENGTH) -> list:
+        """Split a list of strings into consecutive chunks so that the comma
+        separated value of every chunk fits within max_length characters.
+        """
+        chunks = []
+        chunk = []
+        chunk_length = 0
+
+        for value in values:
+            # every value after the first one in a chunk is preceded by a comma
+            value_length = len(value) + (1 if chunk else 0)
+            if chunk and chunk_length + value_length > max_length:
+                chunks.append(chunk)
+                chunk = []
+                chunk_length = 0
+                value_length = len(value)
+            if value_length > max_length:
+                raise ValueError(f"Value exceeds the maximum length of {max_length} characters: {value}")
+            chunk.append(value)
+            chunk_length += value_length
+
+        if chunk:
+            chunks.append(chunk)
+        return chunks
@@ -0,0 +1,104 @@
+"""
+    GitBranch.py:
+    Resolve the checked out git branch by reading the repository files
+    directly, without importing GitPython.
+
+    Handles linked worktrees (".git" file pointing to the worktree git
+    directory), detached HEADs (a branch whose loose or packed ref points
+    at the HEAD commit) and packed refs. None is returned whenever the
+    branch can not be determined this way, so that the caller can fall
+    back to GitPython.
+"""
+
+import os
+from typing import Optional
+
+BRANCH_REF_PREFIX = 'refs/heads/'
+
+
+def find_git_dir(path: str) -> Optional[str]:
+    """Return the git directory of the repository containing path, following ".git" files of worktrees."""
+    path = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return dot_git
+        if os.path.isfile(dot_git):
+            with open(dot_git, 'r') as dot_git_file:
+                content = dot_git_file.read().strip()
+            if not content.startswith('gitdir:'):
+                return None
+            return os.path.normpath(os.path.join(path, content[len('gitdir:'):].strip()))
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def find_common_dir(git_dir: str) -> str:
+    """Return the directory holding the shared refs, which differs from git_dir for linked worktrees."""
+    commondir_file = os.path.join(git_dir, 'commondir')
+    if not os.path.isfile(commondir_file):
+        return git_dir
+    with open(commondir_file, 'r') as commondir:
+        return os.path.normpath(os.path.join(git_dir, commondir.read().strip()))
+
+
+def read_packed_refs(common_dir: str) -> dict:
+    """Return the packed refs of the repository as a dict of ref name to commit id."""
+    refs = {}
+    try:
+        with open(os.path.join(common_dir, 'packed-refs'), 'r') as packed_refs:
+            for line in packed_refs:
+                # skip the header and the peeled tag lines
+                if line.startswith(('#', '^')):
+                    continue
+                commit, _, ref = line.strip().partition(' ')
+                if ref:
+                    refs[ref] = commit
+    except FileNotFoundError:
+        pass
+    return refs
+
+
+def find_branches_at(common_dir: str, commit: str) -> list:
+    """Return the sorted names of the local branches pointing at commit."""
+    refs = read_packed_refs(common_dir)
+
+    # loose refs take precedence over packed refs of the same name
+    heads_dir = os.path.join(common_dir, 'refs', 'heads')
+    for root, _, files in os.walk(heads_dir):
+        for name in files:
+            ref_file = os.path.join(root, name)
+            with open(ref_file, 'r') as ref:
+                refs[BRANCH_REF_PREFIX + os.path.relpath(ref_file, heads_dir).replace(os.sep, '/')] = ref.read().strip()
+
+    return sorted(
+        ref[len(BRANCH_REF_PREFIX):]
+        for ref, ref_commit in refs.items()
+        if ref.startswith(BRANCH_REF_PREFIX) and ref_commit == commit
+    )
+
+
+def resolve_branch_name(path: str) -> Optional[str]:
+    """Return the branch checked out in the repository containing path, or None if it can not be resolved."""
+    git_dir = find_git_dir(path)
+    if git_dir is None:
+        return None
+
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), 'r') as head_file:
+            head = head_file.read().strip()
+    except FileNotFoundError:
+        return None
+
+    if head.startswith('ref:'):
+        ref = head[len('ref:'):].strip()
+        # repositories using the reftable format keep a placeholder HEAD
+        if not ref.startswith(BRANCH_REF_PREFIX) or ref == BRANCH_REF_PREFIX + '.invalid':
+            return None
+        return ref[len(BRANCH_REF_PREFIX):]
+
+    # Detached HEAD, use the branch pointing at the same commit if there is exactly one
+    branches = find_branches_at(find_common_dir(git_dir), head)
+    return branches[0] if len(branches) == 1 else None
@@ -0,0 +1,761 @@
+"""
+    ProjectSettings.py:
+    Typed, validated view of the "projectSettings" section of cdk.json.
+
+    The settings are parsed into immutable __slots__ dataclasses and
+    validated when the file is loaded, so that configuration mistakes,
+    such as placeholder VPC ids, fail before any construct is created.
+"""
+
+import json
+import os
+import re
+from dataclasses import dataclass
+
+from stacks.amishare.resources.amidistribution.distribution_planner import (
+    ORGANIZATION_ARN_PATTERN, ORGANIZATIONAL_UNIT_ARN_PATTERN
+)
+
+PLACEHOLDER_PATTERN = re.compile(r'<<.*>>')
+VPC_ID_PATTERN = re.compile(r'^vpc-[0-9a-f]{8,17}$')
+SUBNET_ID_PATTERN = re.compile(r'^subnet-[0-9a-f]{8,17}$')
+REGION_PATTERN = re.compile(r'^[a-z]{2}(-gov|-iso[a-z]?)?-[a-z]+-\d$')
+ACCOUNT_ID_PATTERN = re.compile(r'^\d{12}$')
+VERSION_PATTERN = re.compile(r'^\d+\.\d+\.\d+$')
+PIPELINE_NAME_PATTERN = re.compile(r'^[a-z0-9][a-z0-9-]*$')
+
+CRON_EXPRESSION_PATTERN = re.compile(r'^cron\((.+)\)$')
+DEVICE_NAME_PATTERN = re.compile(r'^/dev/(sd|xvd)[a-z]$')
+ARTIFACT_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+ARTIFACT_URL_PATTERN = re.compile(r'^https://\S+$')
+SSM_PARAMETER_PATH_PATTERN = re.compile(r'^(/[A-Za-z0-9_.-]+)+$')
+IAM_ROLE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9+=,.@_-]{1,64}$')
+
+# account ids, and the organization and OU ARNs the distribution planner accepts
+SHARING_ID_PATTERNS = [ACCOUNT_ID_PATTERN, ORGANIZATION_ARN_PATTERN, ORGANIZATIONAL_UNIT_ARN_PATTERN]
+
+# the handlers use builtin generics such as list[str], added in python 3.9
+LAMBDA_RUNTIME_PATTERN = re.compile(r'^python3\.(\d+)$')
+LAMBDA_MIN_PYTHON_MINOR_VERSION = 9
+LAMBDA_ARCHITECTURES = ('arm64', 'x86_64')
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+# provider: through the CDK custom resource provider framework,
+# direct: Lambda-backed custom resources that send their response
+CUSTOM_RESOURCE_MODES = ('provider', 'direct')
+# the first start condition is the default: only build when the schedule
+# matches and the base image or a component has been updated
+PIPELINE_START_CONDITIONS = ('EXPRESSION_MATCH_AND_DEPENDENCY_UPDATES_AVAILABLE', 'EXPRESSION_MATCH_ONLY')
+# full: every build starts from the AWS base image, foundation: a foundation
+# pipeline is added next to the full builds, incremental: the distributed
+# images are patch builds on top of the newest foundation image
+BUILD_MODES = ('full', 'foundation', 'incremental')
+# EBS limits per volume type: size range in GiB, IOPS range, maximum IOPS per
+# GiB, the IOPS provided at any size, and whether the IOPS and throughput can be set
+EBS_VOLUME_TYPES = {
+    'gp2': {'size': (1, 16384), 'iops': None, 'iops_per_gib': None, 'baseline_iops': None, 'throughput': False},
+    'gp3': {'size': (1, 16384), 'iops': (3000, 16000), 'iops_per_gib': 500, 'baseline_iops': 3000, 'throughput': True},
+    'io1': {'size': (4, 16384), 'iops': (100, 64000), 'iops_per_gib': 50, 'baseline_iops': 0, 'throughput': False},
+    'io2': {'size': (4, 16384), 'iops': (100, 64000), 'iops_per_gib': 500, 'baseline_iops': 0, 'throughput': False}
+}
+GP3_THROUGHPUT_RANGE = (125, 1000)
+# gp3 throughput in MiB/s can be at most a quarter of the IOPS
+GP3_THROUGHPUT_PER_IOPS = 0.25
+# EC2 Fast Launch keeps at least this many instances launching in parallel
+FAST_LAUNCH_MIN_PARALLEL_LAUNCHES = 6
+
+
+class ProjectSettingsError(ValueError):
+    """Raised when the project settings fail validation."""
+
+    def __init__(self, filename: str, errors: list):
+        self.errors = errors
+        super().__init__(f"Invalid project settings in {filename}:\n  - " + "\n  - ".join(errors))
+
+
+class _Validator():
+    """Collects every validation error so that they can be reported at once."""
+
+    def __init__(self):
+        self.errors = []
+
+    def section(self, data: dict, path: str) -> dict:
+        value = data.get(path.split('.')[-1], {})
+        if not isinstance(value, dict):
+            self.errors.append(f"{path}: expected an object")
+            return {}
+        return value
+
+    def value(self, data: dict, path: str, expected_type, default=None, required=True):
+        key = path.split('.')[-1]
+        if key not in data:
+            if required:
+                self.errors.append(f"{path}: missing")
+            return default
+        value = data[key]
+        if not isinstance(value, expected_type) or isinstance(value, bool) and expected_type is not bool:
+            self.errors.append(f"{path}: expected {getattr(expected_type, '__name__', expected_type)}, got {type(value).__name__}")
+            return default
+        if isinstance(value, str) and PLACEHOLDER_PATTERN.search(value):
+            self.errors.append(f"{path}: placeholder {value} has not been replaced")
+        return value
+
+    def string_list(self, data: dict, path: str, pattern=None, required=True, default=()) -> tuple:
+        if not required and path.split('.')[-1] not in data:
+            return tuple(default)
+        values = self.value(data, path, list, [], required)
+        for value in values:
+            if not isinstance(value, str):
+                self.errors.append(f"{path}: expected a list of strings")
+            elif PLACEHOLDER_PATTERN.search(value):
+                self.errors.append(f"{path}: placeholder {value} has not been replaced")
+            elif pattern is not None and not any(p.match(value) for p in pattern):
+                self.errors.append(f"{path}: invalid value {value}")
+        if required and not values:
+            self.errors.append(f"{path}: must not be empty")
+        return tuple(values)
+
+    def match(self, value, path: str, pattern):
+        if isinstance(value, str) and not PLACEHOLDER_PATTERN.search(value) and not pattern.match(value):
+            self.errors.append(f"{path}: invalid value {value}")
+        return value
+
+
+def _build_mode(data: dict, path: str, default: str, validator: _Validator) -> str:
+    build_mode = validator.value(data, path, str, default, required=False)
+    if build_mode not in BUILD_MODES:
+        validator.errors.append(f"{path}: expected one of {', '.join(BUILD_MODES)}, got {build_mode}")
+    return build_mode
+
+
+@dataclass(frozen=True)
+class BlockDeviceSettings():
+    """An EBS volume of the build instances, gp3 volumes without iops or throughput get the gp3 baseline."""
+    __slots__ = ('device_name', 'volume_size', 'volume_type', 'iops', 'throughput')
+    device_name: str
+    volume_size: int
+    volume_type: str
+    iops: int
+    throughput: int
+
+    @classmethod
+    def root_volume(cls, volume_size: int) -> 'BlockDeviceSettings':
+        """The gp2 root volume used when no block devices are configured."""
+        return cls(device_name='/dev/xvda', volume_size=volume_size, volume_type='gp2', iops=None, throughput=None)
+
+    @classmethod
+    def from_dict(cls, data: dict, path: str, default_volume_size: int, validator: _Validator) -> 'BlockDeviceSettings':
+        device_name = validator.match(validator.value(data, f'{path}.deviceName', str), f'{path}.deviceName', DEVICE_NAME_PATTERN)
+        volume_size = validator.value(data, f'{path}.volumeSize', int, default_volume_size, required=False)
+        volume_type = validator.value(data, f'{path}.volumeType', str, 'gp2', required=False)
+        iops = validator.value(data, f'{path}.iops', int, None, required=False)
+        throughput = validator.value(data, f'{path}.throughput', int, None, required=False)
+
+        limits = EBS_VOLUME_TYPES.get(volume_type)
+        if limits is None:
+            validator.errors.append(f"{path}.volumeType: expected one of {', '.join(EBS_VOLUME_TYPES)}, got {volume_type}")
+            return cls(device_name, volume_size, volume_type, iops, throughput)
+
+        if not limits['size'][0] <= volume_size <= limits['size'][1]:
+            validator.errors.append(f"{path}.volumeSize: {volume_type} volumes must be {limits['size'][0]} to {limits['size'][1]} GiB, got {volume_size}")
+        if limits['iops'] is None:
+            if iops is not None:
+                validator.errors.append(f"{path}.iops: not supported by {volume_type} volumes")
+        elif iops is None and volume_type != 'gp3':
+            validator.errors.append(f"{path}.iops: required for {volume_type} volumes")
+        elif iops is not None:
+            if not limits['iops'][0] <= iops <= limits['iops'][1]:
+                validator.errors.append(f"{path}.iops: {volume_type} volumes support {limits['iops'][0]} to {limits['iops'][1]} IOPS, got {iops}")
+            elif iops > max(limits['baseline_iops'], limits['iops_per_gib'] * volume_size):
+                validator.errors.append(
+                    f"{path}.iops: {volume_type} volumes support at most {limits['iops_per_gib']} IOPS per GiB, "
+                    f"got {iops} IOPS for {volume_size} GiB"
+                )
+        if not limits['throughput']:
+            if throughput is not None:
+                validator.errors.append(f"{path}.throughput: not supported by {volume_type} volumes")
+        elif throughput is not None:
+            if not GP3_THROUGHPUT_RANGE[0] <= throughput <= GP3_THROUGHPUT_RANGE[1]:
+                validator.errors.append(
+                    f"{path}.throughput: gp3 volumes support {GP3_THROUGHPUT_RANGE[0]} to {GP3_THROUGHPUT_RANGE[1]} MiB/s, got {throughput}"
+                )
+            elif throughput > GP3_THROUGHPUT_PER_IOPS * (iops or limits['iops'][0]):
+                validator.errors.append(
+                    f"{path}.throughput: gp3 volumes support at most {GP3_THROUGHPUT_PER_IOPS} MiB/s per IOPS, "
+                    f"got {throughput} MiB/s for {iops or limits['iops'][0]} IOPS"
+                )
+        return cls(device_name, volume_size, volume_type, iops, throughput)
+
+    @classmethod
+    def list_from_dict(cls, data: dict, path: str, default_volume_size: int, default: tuple,
+                       validator: _Validator) -> tuple:
+        if 'blockDevices' not in data:
+            return default if default is not None else (cls.root_volume(default_volume_size),)
+
+        block_devices = validator.value(data, f'{path}.blockDevices', list, [])
+        if not block_devices:
+            validator.errors.append(f"{path}.blockDevices: must not be empty")
+        settings = tuple(
+            cls.from_dict(block_device if isinstance(block_device, dict) else {}, f'{path}.blockDevices[{index}]', default_volume_size, validator)
+            for index, block_device in enumerate(block_devices)
+        )
+        names = [block_device.device_name for block_device in settings]
+        for name in sorted(set(name for name in names if names.count(name) > 1 and name)):
+            validator.errors.append(f"{path}.blockDevices: duplicate device name {name}")
+        return settings
+
+
+@dataclass(frozen=True)
+class FastLaunchSettings():
+    """Windows Fast Launch of the distributed AMIs: pre-provisioned snapshots and parallel launches."""
+    __slots__ = ('target_resource_count', 'max_parallel_launches')
+    target_resource_count: int
+    max_parallel_launches: int
+
+    @classmethod
+    def from_dict(cls, data: dict, path: str, validator: _Validator) -> 'FastLaunchSettings':
+        target_resource_count = validator.value(data, f'{path}.targetResourceCount', int, 5, required=False)
+        if target_resource_count < 1:
+            validator.errors.append(f"{path}.targetResourceCount: must be positive, got {target_resource_count}")
+
+        max_parallel_launches = validator.value(
+            data, f'{path}.maxParallelLaunches', int, FAST_LAUNCH_MIN_PARALLEL_LAUNCHES, required=False
+        )
+        if max_parallel_launches < FAST_LAUNCH_MIN_PARALLEL_LAUNCHES:
+            validator.errors.append(
+                f"{path}.maxParallelLaunches: must be at least {FAST_LAUNCH_MIN_PARALLEL_LAUNCHES}, got {max_parallel_launches}"
+            )
+        return cls(target_resource_count=target_resource_count, max_parallel_launches=max_parallel_launches)
+
+
+@dataclass(frozen=True)
+class RegionSettings():
+    """
+        A distribution region, with the availability zones in which fast snapshot
+        restore is enabled for the AMI snapshots, and the Windows Fast Launch settings.
+    """
+    __slots__ = ('region', 'fast_snapshot_restore_zones', 'fast_launch')
+    region: str
+    fast_snapshot_restore_zones: tuple
+    fast_launch: FastLaunchSettings
+
+    @classmethod
+    def from_value(cls, value, path: str, index: int, validator: _Validator) -> 'RegionSettings':
+        """A region name, or an object with the region and its launch acceleration settings."""
+        if isinstance(value, str):
+            if PLACEHOLDER_PATTERN.search(value):
+                validator.errors.append(f"{path}: placeholder {value} has not been replaced")
+            elif not REGION_PATTERN.match(value):
+                validator.errors.append(f"{path}: invalid value {value}")
+            return cls(region=value, fast_snapshot_restore_zones=(), fast_launch=None)
+        if not isinstance(value, dict):
+            validator.errors.append(f"{path}: expected a list of region names or objects")
+            return cls(region=None, fast_snapshot_restore_zones=(), fast_launch=None)
+
+        path = f'{path}[{index}]'
+        region = validator.match(validator.value(value, f'{path}.region', str), f'{path}.region', REGION_PATTERN)
+        zones = validator.string_list(value, f'{path}.fastSnapshotRestoreAvailabilityZones', required=False)
+        for zone in zones:
+            if isinstance(region, str) and not re.match(rf'^{re.escape(region)}[a-z]$', zone):
+                validator.errors.append(f"{path}.fastSnapshotRestoreAvailabilityZones: {zone} is not an availability zone of {region}")
+        fast_launch = None
+        if 'fastLaunch' in value:
+            fast_launch = FastLaunchSettings.from_dict(validator.section(value, f'{path}.fastLaunch'), f'{path}.fastLaunch', validator)
+        return cls(region=region, fast_snapshot_restore_zones=zones, fast_launch=fast_launch)
+
+    @classmethod
+    def list_from_dict(cls, data: dict, path: str, validator: _Validator, required: bool = True, default: tuple = ()) -> tuple:
+        if not required and path.split('.')[-1] not in data:
+            return default
+        values = validator.value(data, path, list, [], required)
+        if required and not values:
+            validator.errors.append(f"{path}: must not be empty")
+        settings = tuple(cls.from_value(value, path, index, validator) for index, value in enumerate(values))
+        regions = [region.region for region in settings if region.region]
+        for region in sorted(set(region for region in regions if regions.count(region) > 1)):
+            validator.errors.append(f"{path}: duplicate region {region}")
+        return settings
+
+
+@dataclass(frozen=True)
+class VpcSettings():
+    __slots__ = ('vpc_id', 'subnet_id', 'endpoints')
+    vpc_id: str
+    subnet_id: str
+    endpoints: bool
+
+    @classmethod
+    def from_dict(cls, data: dict, validator: _Validator) -> 'VpcSettings':
+        return cls(
+            vpc_id=validator.match(validator.value(data, 'vpc.vpc_id', str), 'vpc.vpc_id', VPC_ID_PATTERN),
+            subnet_id=validator.match(validator.value(data, 'vpc.subnet_id', str), 'vpc.subnet_id', SUBNET_ID_PATTERN),
+            endpoints=validator.value(data, 'vpc.endpoints', bool, False, required=False)
+        )
+
+
+@dataclass(frozen=True)
+class LambdaSettings():
+    __slots__ = ('runtime', 'architecture', 'memory_size', 'log_level', 'custom_resource_mode')
+    runtime: str
+    architecture: str
+    memory_size: int
+    log_level: str
+    custom_resource_mode: str
+
+    @classmethod
+    def from_dict(cls, data: dict, validator: _Validator) -> 'LambdaSettings':
+        runtime = validator.value(data, 'lambda.runtime', str, 'python3.9', required=False)
+        runtime_match = LAMBDA_RUNTIME_PATTERN.match(runtime)
+        if not runtime_match or int(runtime_match.group(1)) < LAMBDA_MIN_PYTHON_MINOR_VERSION:
+            validator.errors.append(
+                f"lambda.runtime: expected python3.{LAMBDA_MIN_PYTHON_MINOR_VERSION} or later, got {runtime}"
+            )
+
+        architecture = validator.value(data, 'lambda.architecture', str, 'x86_64', required=False)
+        if architecture not in LAMBDA_ARCHITECTURES:
+            validator.errors.append(f"lambda.architecture: expected one of {', '.join(LAMBDA_ARCHITECTURES)}, got {architecture}")
+
+        memory_size = validator.value(data, 'lambda.memorySize', int, 128, required=False)
+        if not 128 <= memory_size <= 10240:
+            validator.errors.append(f"lambda.memorySize: must be between 128 and 10240 MB, got {memory_size}")
+
+        log_level = validator.value(data, 'lambda.logLevel', str, 'INFO', required=False).upper()
+        if log_level not in LOG_LEVELS:
+            validator.errors.append(f"lambda.logLevel: expected one of {', '.join(LOG_LEVELS)}, got {log_level}")
+
+        custom_resource_mode = validator.value(data, 'lambda.customResourceMode', str, 'provider', required=False)
+        if custom_resource_mode not in CUSTOM_RESOURCE_MODES:
+            validator.errors.append(
+                f"lambda.customResourceMode: expected one of {', '.join(CUSTOM_RESOURCE_MODES)}, got {custom_resource_mode}"
+            )
+
+        return cls(
+            runtime=runtime,
+            architecture=architecture,
+            memory_size=memory_size,
+            log_level=log_level,
+            custom_resource_mode=custom_resource_mode
+        )
+
+
+@dataclass(frozen=True)
+class ImageBuilderSettings():
+    __slots__ = (
+        'base_image_arn', 'ebs_volume_size', 'instance_types', 'version',
+        'image_builder_email_address', 'extra_tags', 'distribution_list',
+        'ami_publishing_regions', 'ami_publishing_target_ids', 'ami_sharing_ids',
+        'launch_permission_max_workers', 'build_mode', 'block_devices', 'region_settings'
+    )
+    base_image_arn: str
+    ebs_volume_size: int
+    instance_types: tuple
+    version: str
+    image_builder_email_address: str
+    extra_tags: dict
+    distribution_list: tuple
+    ami_publishing_regions: tuple
+    ami_publishing_target_ids: tuple
+    ami_sharing_ids: tuple
+    launch_permission_max_workers: int
+    build_mode: str
+    block_devices: tuple
+    region_settings: tuple
+
+    @classmethod
+    def from_dict(cls, data: dict, validator: _Validator) -> 'ImageBuilderSettings':
+        ebs_volume_size = validator.value(data, 'imagebuilder.ebsVolumeSize', int, 8)
+        if ebs_volume_size < 1:
+            validator.errors.append(f"imagebuilder.ebsVolumeSize: must be positive, got {ebs_volume_size}")
+
+        email_address = validator.value(data, 'imagebuilder.imageBuilderEmailAddress', str, '')
+        if '@' not in email_address:
+            validator.errors.append(f"imagebuilder.imageBuilderEmailAddress: invalid value {email_address}")
+
+        launch_permission_max_workers = validator.value(data, 'imagebuilder.launchPermissionMaxWorkers', int, 16, required=False)
+        if launch_permission_max_workers < 1:
+            validator.errors.append(f"imagebuilder.launchPermissionMaxWorkers: must be positive, got {launch_permission_max_workers}")
+
+        region_settings = RegionSettings.list_from_dict(data, 'imagebuilder.amiPublishingRegions', validator)
+
+        return cls(
+            base_image_arn=validator.value(data, 'imagebuilder.baseImageArn', str),
+            ebs_volume_size=ebs_volume_size,
+            instance_types=validator.string_list(data, 'imagebuilder.instanceTypes'),
+            version=validator.match(validator.value(data, 'imagebuilder.version', str), 'imagebuilder.version', VERSION_PATTERN),
+            image_builder_email_address=email_address,
+            extra_tags=dict(validator.value(data, 'imagebuilder.extraTags', dict, {}, required=False)),
+            distribution_list=validator.string_list(data, 'imagebuilder.distributionList'),
+            ami_publishing_regions=tuple(region.region for region in region_settings),
+            ami_publishing_target_ids=validator.string_list(data, 'imagebuilder.amiPublishingTargetIds', [ACCOUNT_ID_PATTERN]),
+            ami_sharing_ids=validator.string_list(data, 'imagebuilder.amiSharingIds', SHARING_ID_PATTERNS),
+            launch_permission_max_workers=launch_permission_max_workers,
+            build_mode=_build_mode(data, 'imagebuilder.buildMode', BUILD_MODES[0], validator),
+            block_devices=BlockDeviceSettings.list_from_dict(data, 'imagebuilder', ebs_volume_size, None, validator),
+            region_settings=region_settings
+        )
+
+
+@dataclass(frozen=True)
+class ScheduleSettings():
+    """
+        Build schedule of the image pipelines. The builds are spread over
+        slots of max_concurrent_builds pipelines, and every slot starts
+        stagger_minutes after the previous one.
+    """
+    __slots__ = ('schedule_expression', 'start_condition', 'stagger_minutes', 'max_concurrent_builds')
+    schedule_expression: str
+    start_condition: str
+    stagger_minutes: int
+    max_concurrent_builds: int
+
+    @classmethod
+    def from_dict(cls, data: dict, validator: _Validator) -> 'ScheduleSettings':
+        if not data:
+            return None
+
+        schedule_expression = validator.value(data, 'schedule.scheduleExpression', str, '')
+        fields = cls.cron_fields(schedule_expression)
+        if fields is None:
+            validator.errors.append(f"schedule.scheduleExpression: expected cron(minutes hours day-of-month month day-of-week year), got {schedule_expression}")
+
+        start_condition = validator.value(
+            data, 'schedule.startCondition', str, PIPELINE_START_CONDITIONS[0], required=False
+        )
+        if start_condition not in PIPELINE_START_CONDITIONS:
+            validator.errors.append(f"schedule.startCondition: expected one of {', '.join(PIPELINE_START_CONDITIONS)}, got {start_condition}")
+
+        stagger_minutes = validator.value(data, 'schedule.staggerMinutes', int, 0, required=False)
+        if stagger_minutes < 0:
+            validator.errors.append(f"schedule.staggerMinutes: must not be negative, got {stagger_minutes}")
+        elif stagger_minutes and fields is not None and not (fields[0].isdigit() and fields[1].isdigit()):
+            validator.errors.append("schedule.staggerMinutes: requires a scheduleExpression with fixed minutes and hours")
+
+        max_concurrent_builds = validator.value(data, 'schedule.maxConcurrentBuilds', int, 0, required=False)
+        if max_concurrent_builds < 0:
+            validator.errors.append(f"schedule.maxConcurrentBuilds: must not be negative, got {max_concurrent_builds}")
+
+        return cls(
+            schedule_expression=schedule_expression,
+            start_condition=start_condition,
+            stagger_minutes=stagger_minutes,
+            max_concurrent_builds=max_concurrent_builds
+        )
+
+    @staticmethod
+    def cron_fields(schedule_expression: str) -> list:
+        match = CRON_EXPRESSION_PATTERN.match(schedule_expression)
+        if not match:
+            return None
+        fields = match.group(1).split()
+        return fields if len(fields) in (5, 6) else None
+
+    def schedule_expression_for(self, build_index: int) -> str:
+        """
+            The schedule expression of the build_index-th pipeline. Without
+            maxConcurrentBuilds every pipeline gets a slot of its own.
+        """
+        slot = build_index // self.max_concurrent_builds if self.max_concurrent_builds else build_index
+        offset = slot * self.stagger_minutes
+        if not offset:
+            return self.schedule_expression
+
+        minutes, hours, *fields = self.cron_fields(self.schedule_expression)
+        start = int(hours) * 60 + int(minutes) + offset
+        if start >= 24 * 60:
+            raise ValueError(
+                f"Staggered schedule of pipeline {build_index} starts {offset} minutes after "
+                f"{self.schedule_expression}, past the end of the day"
+            )
+        return f"cron({start % 60} {start // 60} {' '.join(fields)})"
+
+
+@dataclass(frozen=True)
+class ArtifactSettings():
+    """An installer or package fetched through the artifact cache, and the optional command installing it."""
+    __slots__ = ('name', 'url', 'install')
+    name: str
+    url: str
+    install: str
+
+    @classmethod
+    def from_dict(cls, data: dict, path: str, validator: _Validator) -> 'ArtifactSettings':
+        return cls(
+            name=validator.match(validator.value(data, f'{path}.name', str), f'{path}.name', ARTIFACT_NAME_PATTERN),
+            url=validator.match(validator.value(data, f'{path}.url', str), f'{path}.url', ARTIFACT_URL_PATTERN),
+            install=validator.value(data, f'{path}.install', str, '', required=False)
+        )
+
+
+@dataclass(frozen=True)
+class ArtifactCacheSettings():
+    """
+        Artifacts the builds fetch from the artifact cache bucket,
+        falling back to their upstream url on a cache miss.
+    """
+    __slots__ = ('artifacts',)
+    artifacts: tuple
+
+    @classmethod
+    def from_dict(cls, data: dict, validator: _Validator) -> 'ArtifactCacheSettings':
+        if not data:
+            return None
+
+        artifacts = tuple(
+            ArtifactSettings.from_dict(artifact if isinstance(artifact, dict) else {}, f'artifactCache.artifacts[{index}]', validator)
+            for index, artifact in enumerate(validator.value(data, 'artifactCache.artifacts', list, []))
+        )
+        names = [artifact.name for artifact in artifacts]
+        for name in sorted(set(name for name in names if names.count(name) > 1)):
+            validator.errors.append(f"artifactCache.artifacts: duplicate artifact name {name}")
+        return cls(artifacts=artifacts)
+
+
+@dataclass(frozen=True)
+class LatestAmiParametersSettings():
+    """
+        SSM parameters below path that index the latest AMI of every pipeline
+        in every distribution region, optionally written into the sharing
+        accounts through the sharing account role.
+    """
+    __slots__ = ('path', 'sharing_account_role_name')
+    path: str
+    sharing_account_role_name: str
+
+    def pipeline_path(self, stack_tag: str, pipeline: 'PipelineSettings') -> str:
+        return f'{self.path}/{stack_tag}{pipeline.suffix}'
+
+    @classmethod
+    def from_dict(cls, data: dict, validator: _Validator) -> 'LatestAmiParametersSettings':
+        path = validator.value(data, 'latestAmiParameters.path', str, '/ami-share/latest', required=False)
+        return cls(
+            path=validator.match(path, 'latestAmiParameters.path', SSM_PARAMETER_PATH_PATTERN),
+            sharing_account_role_name=validator.match(
+                validator.value(data, 'latestAmiParameters.sharingAccountRoleName', str, None, required=False),
+                'latestAmiParameters.sharingAccountRoleName', IAM_ROLE_NAME_PATTERN
+            )
+        )
+
+
+@dataclass(frozen=True)
+class NotificationQueueSettings():
+    """
+        Build notifications buffered in a queue, consumed in batches and
+        summarised by a digest every digest_period_hours.
+    """
+    __slots__ = ('batch_size', 'max_batching_window_seconds', 'digest_period_hours')
+    batch_size: int
+    max_batching_window_seconds: int
+    digest_period_hours: int
+
+    @classmethod
+    def from_dict(cls, data: dict, validator: _Validator) -> 'NotificationQueueSettings':
+        batch_size = validator.value(data, 'notificationQueue.batchSize', int, 100, required=False)
+        if not 1 <= batch_size <= 10000:
+            validator.errors.append(f"notificationQueue.batchSize: must be between 1 and 10000, got {batch_size}")
+
+        max_batching_window_seconds = validator.value(data, 'notificationQueue.maxBatchingWindowSeconds', int, 60, required=False)
+        if not 0 <= max_batching_window_seconds <= 300:
+            validator.errors.append(
+                f"notificationQueue.maxBatchingWindowSeconds: must be between 0 and 300, got {max_batching_window_seconds}"
+            )
+        elif batch_size > 10 and max_batching_window_seconds == 0:
+            validator.errors.append(
+                f"notificationQueue.maxBatchingWindowSeconds: must be at least 1 for a batchSize of {batch_size}"
+            )
+
+        # the digest queue retains the notifications for at most 14 days
+        digest_period_hours = validator.value(data, 'notificationQueue.digestPeriodHours', int, 24, required=False)
+        if not 1 <= digest_period_hours <= 168:
+            validator.errors.append(f"notificationQueue.digestPeriodHours: must be between 1 and 168, got {digest_period_hours}")
+
+        return cls(
+            batch_size=batch_size,
+            max_batching_window_seconds=max_batching_window_seconds,
+            digest_period_hours=digest_period_hours
+        )
+
+
+@dataclass(frozen=True)
+class PipelineSettings():
+    """
+        One image pipeline of the stack. Settings that are omitted
+        default to the values of the "imagebuilder" section.
+    """
+    __slots__ = (
+        'name', 'base_image_arn', 'ebs_volume_size', 'instance_types', 'version',
+        'ami_publishing_regions', 'ami_publishing_target_ids', 'ami_sharing_ids', 'build_mode',
+        'block_devices', 'region_settings'
+    )
+    name: str
+    base_image_arn: str
+    ebs_volume_size: int
+    instance_types: tuple
+    version: str
+    ami_publishing_regions: tuple
+    ami_publishing_target_ids: tuple
+    ami_sharing_ids: tuple
+    build_mode: str
+    block_devices: tuple
+    region_settings: tuple
+
+    @property
+    def suffix(self) -> str:
+        """Suffix of the names of the pipeline resources, empty for the unnamed default pipeline."""
+        return f"-{self.name}" if self.name else ""
+
+    @property
+    def has_foundation(self) -> bool:
+        """Whether a foundation pipeline is built for the pipeline."""
+        return self.build_mode != 'full'
+
+    @property
+    def incremental(self) -> bool:
+        """Whether the distributed images are patch builds on top of the newest foundation image."""
+        return self.build_mode == 'incremental'
+
+    @classmethod
+    def from_imagebuilder(cls, imagebuilder: ImageBuilderSettings) -> 'PipelineSettings':
+        """The single, unnamed pipeline used when no "pipelines" are configured."""
+        return cls(
+            name='',
+            base_image_arn=imagebuilder.base_image_arn,
+            ebs_volume_size=imagebuilder.ebs_volume_size,
+            instance_types=imagebuilder.instance_types,
+            version=imagebuilder.version,
+            ami_publishing_regions=imagebuilder.ami_publishing_regions,
+            ami_publishing_target_ids=imagebuilder.ami_publishing_target_ids,
+            ami_sharing_ids=imagebuilder.ami_sharing_ids,
+            build_mode=imagebuilder.build_mode,
+            block_devices=imagebuilder.block_devices,
+            region_settings=imagebuilder.region_settings
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict, path: str, defaults: ImageBuilderSettings, validator: _Validator) -> 'PipelineSettings':
+        name = validator.value(data, f'{path}.name', str, '')
+        if name and not PIPELINE_NAME_PATTERN.match(name):
+            validator.errors.append(f"{path}.name: must be lower case alphanumeric characters and dashes, got {name}")
+
+        ebs_volume_size = validator.value(data, f'{path}.ebsVolumeSize', int, defaults.ebs_volume_size, required=False)
+        if ebs_volume_size < 1:
+            validator.errors.append(f"{path}.ebsVolumeSize: must be positive, got {ebs_volume_size}")
+
+        region_settings = RegionSettings.list_from_dict(
+            data, f'{path}.amiPublishingRegions', validator, required=False, default=defaults.region_settings
+        )
+
+        return cls(
+            name=name,
+            base_image_arn=validator.value(data, f'{path}.baseImageArn', str, defaults.base_image_arn, required=False),
+            ebs_volume_size=ebs_volume_size,
+            instance_types=validator.string_list(data, f'{path}.instanceTypes', required=False, default=defaults.instance_types),
+            version=validator.match(
+                validator.value(data, f'{path}.version', str, defaults.version, required=False), f'{path}.version', VERSION_PATTERN
+            ),
+            ami_publishing_regions=tuple(region.region for region in region_settings),
+            ami_publishing_target_ids=validator.string_list(
+                data, f'{path}.amiPublishingTargetIds', [ACCOUNT_ID_PATTERN], required=False, default=defaults.ami_publishing_target_ids
+            ),
+            ami_sharing_ids=validator.string_list(
+                data, f'{path}.amiSharingIds', SHARING_ID_PATTERNS, required=False, default=defaults.ami_sharing_ids
+            ),
+            build_mode=_build_mode(data, f'{path}.buildMode', defaults.build_mode, validator),
+            # a pipeline with its own ebsVolumeSize gets a root volume of that size
+            block_devices=BlockDeviceSettings.list_from_dict(
+                data, path, ebs_volume_size, None if 'ebsVolumeSize' in data else defaults.block_devices, validator
+            ),
+            region_settings=region_settings
+        )
+
+    def check_fast_launch(self, path: str, validator: _Validator) -> None:
+        """Fast Launch only applies to Windows AMIs."""
+        if isinstance(self.base_image_arn, str) and 'windows' in self.base_image_arn.lower():
+            return
+        for region in self.region_settings:
+            if region.fast_launch is not None:
+                validator.errors.append(
+                    f"{path}: fastLaunch of region {region.region} only applies to Windows base images, got {self.base_image_arn}"
+                )
+
+    @classmethod
+    def list_from_dict(cls, data: dict, defaults: ImageBuilderSettings, validator: _Validator) -> tuple:
+        if 'pipelines' not in data:
+            pipeline = cls.from_imagebuilder(defaults)
+            pipeline.check_fast_launch('imagebuilder', validator)
+            return (pipeline,)
+
+        pipelines = validator.value(data, 'pipelines', list, [])
+        if not pipelines:
+            validator.errors.append("pipelines: must not be empty")
+        settings = tuple(
+            cls.from_dict(pipeline if isinstance(pipeline, dict) else {}, f'pipelines[{index}]', defaults, validator)
+            for index, pipeline in enumerate(pipelines)
+        )
+        for index, pipeline in enumerate(settings):
+            pipeline.check_fast_launch(f'pipelines[{index}]', validator)
+        names = [pipeline.name for pipeline in settings]
+        for name in sorted(set(name for name in names if names.count(name) > 1)):
+            validator.errors.append(f"pipelines: duplicate pipeline name {name}")
+        return settings
+
+
+@dataclass(frozen=True)
+class ProjectSettings():
+    __slots__ = (
+        'vpc', 'imagebuilder', 'lambda_', 'pipelines', 'schedule', 'artifact_cache', 'latest_ami_parameters',
+        'notification_queue'
+    )
+    vpc: VpcSettings
+    imagebuilder: ImageBuilderSettings
+    lambda_: LambdaSettings
+    pipelines: tuple
+    schedule: ScheduleSettings
+    artifact_cache: ArtifactCacheSettings
+    latest_ami_parameters: LatestAmiParametersSettings
+    notification_queue: NotificationQueueSettings
+
+    @classmethod
+    def from_dict(cls, data: dict, filename: str = 'cdk.json') -> 'ProjectSettings':
+        """Parse and validate the projectSettings, raising ProjectSettingsError on any error."""
+        validator = _Validator()
+        if not isinstance(data, dict):
+            raise ProjectSettingsError(filename, ["projectSettings: missing or not an object"])
+        vpc = VpcSettings.from_dict(validator.section(data, 'vpc'), validator)
+        imagebuilder = ImageBuilderSettings.from_dict(validator.section(data, 'imagebuilder'), validator)
+        settings = cls(
+            vpc=vpc,
+            imagebuilder=imagebuilder,
+            lambda_=LambdaSettings.from_dict(validator.section(data, 'lambda'), validator),
+            pipelines=PipelineSettings.list_from_dict(data, imagebuilder, validator),
+            schedule=ScheduleSettings.from_dict(validator.section(data, 'schedule'), validator),
+            artifact_cache=ArtifactCacheSettings.from_dict(validator.section(data, 'artifactCache'), validator),
+            # empty sections enable these features with their defaults
+            latest_ami_parameters=LatestAmiParametersSettings.from_dict(
+                validator.section(data, 'latestAmiParameters'), validator
+            ) if 'latestAmiParameters' in data else None,
+            notification_queue=NotificationQueueSettings.from_dict(
+                validator.section(data, 'notificationQueue'), validator
+            ) if 'notificationQueue' in data else None
+        )
+        if validator.errors:
+            raise ProjectSettingsError(filename, validator.errors)
+        return settings
+
+
+# Loaded settings keyed by absolute file name, together with the
+# modification time of the file they were loaded from.
+_SETTINGS_CACHE = {}
+
+
+def load_project_settings(filename: str = 'cdk.json') -> ProjectSettings:
+    """Return the project settings of filename, parsing the file again only when its mtime changes."""
+    path = os.path.abspath(filename)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _SETTINGS_CACHE.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'r') as cdk_json:
+        data = json.load(cdk_json)
+    settings = ProjectSettings.from_dict(data.get("projectSettings"), filename)
+    _SETTINGS_CACHE[path] = (mtime, settings)
+    return settings